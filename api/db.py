@@ -0,0 +1,53 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+from django.conf import settings
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def db_path() -> Path:
+    return Path(settings.MEDIA_ROOT) / 'jobs' / 'jobs.sqlite3'
+
+def get_connection() -> sqlite3.Connection:
+    """Соединение SQLite на поток (общая БД очереди и служебных таблиц под MEDIA_ROOT)."""
+    p = db_path()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != p:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(p), timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+        _local.path = p
+    return conn
+
+def ensure_schema(name: str, statements: List[str]) -> None:
+    """Создание таблиц модуля один раз на процесс."""
+    key = (str(db_path()), name)
+    if key in _schema_ready:
+        return
+    with _schema_lock:
+        if key in _schema_ready:
+            return
+        conn = get_connection()
+        for stmt in statements:
+            conn.execute(stmt)
+        _schema_ready.add(key)
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Транзакция с немедленной блокировкой записи (безопасна между процессами)."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        # и при KeyboardInterrupt/SystemExit: открытая транзакция держала бы блокировку записи
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
@@ -68,6 +68,7 @@ class JobForm(forms.Form):
     codec_random = forms.BooleanField(label="Случайные параметры кодека", required=False, initial=True)
     color_mod = forms.BooleanField(label="Модуляция цвета", required=False)
     hidden_pattern = forms.BooleanField(label="Скрытый паттерн", required=False)
+    stream_copy = forms.BooleanField(label="Без перекодирования видео, если исходник уже подходит", required=False)
 
     # Можно зажать длительность “по шаблону”
     fixed_duration_enabled = forms.BooleanField(label="Фиксировать длительность", required=False)
@@ -0,0 +1,103 @@
+import time
+from typing import Dict, Iterable, List, Optional, Union
+from .db import ensure_schema, get_connection, transaction
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS job_index (
+        job_id TEXT PRIMARY KEY,
+        name TEXT,
+        status TEXT,
+        created_at TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS job_index_created ON job_index (created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS job_index_status ON job_index (status, created_at DESC)",
+    """CREATE TABLE IF NOT EXISTS job_index_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS job_name_counter (
+        slug TEXT PRIMARY KEY,
+        last INTEGER NOT NULL
+    )""",
+]
+
+def _ensure():
+    ensure_schema('job_index', _SCHEMA)
+
+def _row(job: Dict) -> tuple:
+    return (str(job['id']), job.get('name'), job.get('status'), job.get('created_at') or '', time.time())
+
+def index_job(job: Dict) -> None:
+    """Добавить или обновить задачу в каталоге (вызывается из write_job)."""
+    _ensure()
+    get_connection().execute(
+        """INSERT INTO job_index (job_id, name, status, created_at, updated_at)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(job_id) DO UPDATE SET
+               name = excluded.name, status = excluded.status,
+               created_at = excluded.created_at, updated_at = excluded.updated_at""",
+        _row(job),
+    )
+
+def next_name_number(slug: str, seed: int = -1) -> int:
+    """
+    Следующий номер для имени задачи (атомарно между потоками и процессами).
+    seed — последний уже занятый номер при первом обращении к slug.
+    """
+    _ensure()
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO job_name_counter (slug, last) VALUES (?, ?)", (slug, int(seed)))
+        conn.execute("UPDATE job_name_counter SET last = last + 1 WHERE slug = ?", (slug,))
+        row = conn.execute("SELECT last FROM job_name_counter WHERE slug = ?", (slug,)).fetchone()
+    return row['last']
+
+def remove_job(job_id: Union[int, str]) -> None:
+    _ensure()
+    get_connection().execute("DELETE FROM job_index WHERE job_id = ?", (str(job_id),))
+
+def is_backfilled() -> bool:
+    _ensure()
+    row = get_connection().execute("SELECT value FROM job_index_meta WHERE key = 'backfilled'").fetchone()
+    return row is not None
+
+def backfill(jobs: Iterable[Dict]) -> int:
+    """
+    Однократное заполнение каталога задачами, созданными до его появления.
+    Уже проиндексированные задачи не перезаписываются.
+    """
+    _ensure()
+    n = 0
+    with transaction() as conn:
+        for job in jobs:
+            cur = conn.execute(
+                """INSERT OR IGNORE INTO job_index (job_id, name, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                _row(job),
+            )
+            n += cur.rowcount
+        conn.execute("INSERT OR REPLACE INTO job_index_meta (key, value) VALUES ('backfilled', ?)", (str(time.time()),))
+    return n
+
+def list_job_ids(limit: int = 20, offset: int = 0, status: Optional[str] = None) -> List[str]:
+    """Идентификаторы задач страницы, новые сверху."""
+    _ensure()
+    if status:
+        rows = get_connection().execute(
+            "SELECT job_id FROM job_index WHERE status = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (status, int(limit), int(offset)),
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            "SELECT job_id FROM job_index ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (int(limit), int(offset)),
+        ).fetchall()
+    return [r['job_id'] for r in rows]
+
+def count_jobs(status: Optional[str] = None) -> int:
+    _ensure()
+    if status:
+        row = get_connection().execute("SELECT COUNT(*) AS n FROM job_index WHERE status = ?", (status,)).fetchone()
+    else:
+        row = get_connection().execute("SELECT COUNT(*) AS n FROM job_index").fetchone()
+    return row['n']
@@ -0,0 +1,125 @@
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from .db import ensure_schema, get_connection, transaction
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS job_queue (
+        job_id TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        cost REAL NOT NULL DEFAULT 1,
+        enqueued_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        worker TEXT,
+        heartbeat REAL,
+        attempts INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS job_queue_state ON job_queue (state, enqueued_at)",
+]
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+# Задача исчерпала попытки: воркер падал на ней JOB_MAX_ATTEMPTS раз подряд
+FAILED = 'failed'
+
+def _ensure():
+    ensure_schema('job_queue', _SCHEMA)
+
+def enqueue(job_id: Union[int, str], cost: float = 1.0) -> None:
+    """Поставить задачу в очередь (повторная постановка сбрасывает её состояние и счётчик попыток)."""
+    _ensure()
+    with transaction() as conn:
+        conn.execute(
+            """INSERT INTO job_queue (job_id, state, cost, enqueued_at)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(job_id) DO UPDATE SET
+                   state = excluded.state, cost = excluded.cost, enqueued_at = excluded.enqueued_at,
+                   started_at = NULL, finished_at = NULL, worker = NULL, heartbeat = NULL, attempts = 0""",
+            (str(job_id), QUEUED, float(cost), time.time()),
+        )
+
+def claim_next(worker_id: str, running_cost: float, cost_budget: float) -> Optional[Dict]:
+    """
+    Забрать первую задачу из очереди, которая помещается в бюджет стоимости.
+    Если у воркера ничего не выполняется, задача берётся даже при превышении бюджета,
+    иначе крупная задача никогда бы не запустилась.
+    """
+    _ensure()
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute(
+            "SELECT job_id, cost, enqueued_at, attempts FROM job_queue WHERE state = ? ORDER BY enqueued_at",
+            (QUEUED,),
+        ).fetchall()
+        for row in rows:
+            fits = cost_budget <= 0 or running_cost + row['cost'] <= cost_budget
+            if not fits and running_cost > 0:
+                continue
+            conn.execute(
+                """UPDATE job_queue SET state = ?, worker = ?, started_at = ?, heartbeat = ?,
+                       attempts = attempts + 1
+                   WHERE job_id = ?""",
+                (RUNNING, worker_id, now, now, row['job_id']),
+            )
+            return {
+                'job_id': row['job_id'],
+                'cost': row['cost'],
+                'queue_wait': now - row['enqueued_at'],
+                'attempts': row['attempts'] + 1,
+            }
+    return None
+
+def job_state(job_id: Union[int, str]) -> Optional[str]:
+    _ensure()
+    row = get_connection().execute("SELECT state FROM job_queue WHERE job_id = ?", (str(job_id),)).fetchone()
+    return row['state'] if row else None
+
+def heartbeat(worker_id: str) -> None:
+    _ensure()
+    get_connection().execute(
+        "UPDATE job_queue SET heartbeat = ? WHERE worker = ? AND state = ?",
+        (time.time(), worker_id, RUNNING),
+    )
+
+def finish(job_id: Union[int, str]) -> None:
+    _ensure()
+    get_connection().execute(
+        "UPDATE job_queue SET state = ?, finished_at = ? WHERE job_id = ?",
+        (FINISHED, time.time(), str(job_id)),
+    )
+
+def requeue_stale(stale_after_sec: float, max_attempts: int = 0) -> Tuple[List[str], List[str]]:
+    """
+    Вернуть в очередь задачи воркеров, которые перестали присылать heartbeat (упали или перезапущены).
+    Задача, уже запускавшаяся max_attempts раз (0 — без ограничения), в очередь не возвращается:
+    если она сама роняет воркер (нехватка памяти, краш FFmpeg), повтор уронил бы его снова.
+    Возвращает (возвращённые в очередь, исчерпавшие попытки).
+    """
+    _ensure()
+    now = time.time()
+    requeued, failed = [], []
+    with transaction() as conn:
+        rows = conn.execute(
+            "SELECT job_id, attempts FROM job_queue WHERE state = ? AND (heartbeat IS NULL OR heartbeat < ?)",
+            (RUNNING, now - stale_after_sec),
+        ).fetchall()
+        for row in rows:
+            if max_attempts > 0 and row['attempts'] >= max_attempts:
+                conn.execute(
+                    "UPDATE job_queue SET state = ?, finished_at = ?, worker = NULL, heartbeat = NULL WHERE job_id = ?",
+                    (FAILED, now, row['job_id']),
+                )
+                failed.append(row['job_id'])
+            else:
+                conn.execute(
+                    "UPDATE job_queue SET state = ?, worker = NULL, heartbeat = NULL WHERE job_id = ?",
+                    (QUEUED, row['job_id']),
+                )
+                requeued.append(row['job_id'])
+    return requeued, failed
+
+def queue_stats() -> Dict[str, int]:
+    _ensure()
+    rows = get_connection().execute("SELECT state, COUNT(*) AS n FROM job_queue GROUP BY state").fetchall()
+    return {r['state']: r['n'] for r in rows}
@@ -0,0 +1,62 @@
+import copy
+import threading
+import time
+from typing import Dict, Optional
+from django.conf import settings
+from .store import append_job_event, write_job
+
+TERMINAL_STATUSES = ('done', 'error')
+
+_MISSING = object()
+
+class JobState:
+    """
+    Состояние выполняющейся задачи в памяти с редкими сбросами в job.json.
+
+    save() находит изменённые поля, дописывает их в events.jsonl и переписывает job.json
+    не чаще раза в JOB_STATE_FLUSH_MS (сразу — при завершении или ошибке).
+    read_job применяет несброшенные изменения из журнала, поэтому читатели видят актуальное
+    состояние, а после сброса журнал сжимается.
+    """
+
+    def __init__(self, job: Dict, flush_interval_ms: Optional[int] = None):
+        if flush_interval_ms is None:
+            flush_interval_ms = getattr(settings, 'JOB_STATE_FLUSH_MS', 1000)
+        self.job = job
+        self.job_id = job['id']
+        self.flush_interval = max(0, int(flush_interval_ms)) / 1000.0
+        self._lock = threading.RLock()
+        self._saved = copy.deepcopy(job)
+        self._seq = int(job.get('state_seq') or 0)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def save(self, force: bool = False) -> None:
+        with self._lock:
+            changed = {
+                k: v for k, v in self.job.items()
+                if k != 'state_seq' and self._saved.get(k, _MISSING) != v
+            }
+            removed = [k for k in self._saved if k != 'state_seq' and k not in self.job]
+            if changed or removed:
+                self._seq += 1
+                event = {'seq': self._seq, 'ts': time.time(), 'set': changed}
+                if removed:
+                    event['unset'] = removed
+                append_job_event(self.job_id, event)
+                for k in removed:
+                    self._saved.pop(k, None)
+                self._saved.update(copy.deepcopy(changed))
+                self._dirty = True
+            if not self._dirty:
+                return
+            if force or self.job.get('status') in TERMINAL_STATUSES \
+                    or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self.job['state_seq'] = self._seq
+            write_job(self.job)
+            self._dirty = False
+            self._last_flush = time.monotonic()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+from video_core.probe import probe_media
+from .store import job_json_path
+
+DONE = 'done'
+FAILED = 'failed'
+
+def ledger_path(job_id: Union[int, str]) -> Path:
+    return job_json_path(job_id).parent / 'tasks.jsonl'
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class TaskLedger:
+    """
+    Журнал выполненных кодирований задачи рядом с job.json (tasks.jsonl).
+    Запись только дописывается; при чтении побеждает последняя запись по пути выхода,
+    поэтому обрыв процесса посреди записи теряет максимум одну строку.
+    """
+
+    def __init__(self, job_id: Union[int, str]):
+        self.path = ledger_path(job_id)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        entries = {}
+        if not self.path.exists():
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and entry.get('output'):
+                    entries[entry['output']] = entry
+        return entries
+
+    def _append(self, entry: Dict) -> None:
+        with self._lock:
+            self.entries[entry['output']] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record_result(self, inp: Path, out: Path, ok: bool, error: Optional[str] = None,
+                      stats: Optional[Dict] = None) -> Dict:
+        """
+        Записать итог кодирования. Успех засчитывается, только если выход существует,
+        не пустой и читается ffprobe (битый файл после обрыва FFmpeg считается ошибкой).
+        stats — пропускная способность кодирования выхода (realtime-фактор, fps, битрейт, кадры).
+        """
+        entry = {'output': str(out), 'input': str(inp), 'finished_at': time.time()}
+        if ok and out.exists() and out.stat().st_size > 0:
+            info = probe_media(out)
+            if info.ok:
+                st = out.stat()
+                entry.update({
+                    'status': DONE,
+                    'size': st.st_size,
+                    'mtime_ns': st.st_mtime_ns,
+                    'duration': info.duration,
+                    'checksum': file_checksum(out),
+                })
+                if stats:
+                    entry['throughput'] = stats
+                self._append(entry)
+                return entry
+            error = error or info.error or 'нет видеопотока'
+        entry.update({'status': FAILED, 'error': error or ('FFmpeg завершился с ошибкой' if out.exists() else 'Выход не создан')})
+        self._append(entry)
+        return entry
+
+    def record_uploaded(self, out: Path, remote_path: str) -> None:
+        """Готовый выход загружен в удалённое хранилище — локальную копию можно удалить."""
+        entry = self.entries.get(str(out))
+        if not entry or entry.get('status') != DONE:
+            return
+        self._append(dict(entry, uploaded=remote_path, uploaded_at=time.time()))
+
+    def uploaded(self, out: Path) -> bool:
+        entry = self.entries.get(str(out))
+        return bool(entry and entry.get('status') == DONE and entry.get('uploaded'))
+
+    def verified(self, out: Path) -> bool:
+        """
+        Выход готов и не изменился с момента записи: совпадают размер и контрольная сумма.
+        Если совпадает и mtime, файл не перечитывается. Загруженный выход готов и без локальной копии.
+        """
+        entry = self.entries.get(str(out))
+        if not entry or entry.get('status') != DONE:
+            return False
+        if entry.get('uploaded'):
+            return True
+        try:
+            st = out.stat()
+        except OSError:
+            return False
+        if st.st_size != entry.get('size'):
+            return False
+        if st.st_mtime_ns == entry.get('mtime_ns'):
+            return True
+        return file_checksum(out) == entry.get('checksum')
+
+    def throughput(self) -> Dict[str, Dict]:
+        """Пропускная способность кодирования готовых выходов: {имя выхода: realtime-фактор, fps, скорость...}."""
+        return {
+            Path(output).name: entry['throughput']
+            for output, entry in self.entries.items()
+            if entry.get('status') == DONE and entry.get('throughput')
+        }
+
+    def summary(self) -> Dict[str, int]:
+        counts = {DONE: 0, FAILED: 0}
+        for entry in self.entries.values():
+            counts[entry.get('status')] = counts.get(entry.get('status'), 0) + 1
+        return counts
@@ -0,0 +1,107 @@
+import queue
+import threading
+from typing import Dict, Optional, Set, Union
+from django.conf import settings
+from .job_state import TERMINAL_STATUSES
+from .store import job_events_path, job_json_path, job_live_path, read_job, read_job_live
+
+def _mtime(path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+class _JobBroadcaster:
+    """
+    Один поток на задачу: следит за job.json, events.jsonl и live.json и рассылает
+    снимок прогресса всем подписчикам. Файлы читаются только когда они изменились,
+    сколько бы зрителей ни было открыто.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.poll = max(50, int(getattr(settings, 'JOB_LIVE_POLL_MS', 500) or 500)) / 1000.0
+        self.subscribers: Set[queue.Queue] = set()
+        self.last: Optional[Dict] = None
+        self._stamp = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"live-{job_id}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _snapshot(self) -> Optional[Dict]:
+        stamp = tuple(_mtime(p(self.job_id)) for p in (job_json_path, job_events_path, job_live_path))
+        if stamp == self._stamp:
+            return None
+        self._stamp = stamp
+        try:
+            job = read_job(self.job_id)
+        except (OSError, ValueError):
+            return None
+        payload = {
+            'status': job.get('status'),
+            'message': job.get('message', ''),
+            'progress_overall': job.get('progress_overall', 0),
+            'done_tasks': job.get('done_tasks', 0),
+            'total_tasks': job.get('total_tasks', 0),
+            'tasks': [],
+        }
+        live = read_job_live(self.job_id)
+        if live and job.get('status') not in TERMINAL_STATUSES:
+            payload['progress_overall'] = max(payload['progress_overall'], live.get('progress_overall', 0))
+            payload['tasks'] = live.get('tasks', [])
+        return payload
+
+    def _publish(self, payload: Dict) -> None:
+        with _registry_lock:
+            self.last = payload
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(payload)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            payload = self._snapshot()
+            if payload is not None and payload != self.last:
+                self._publish(payload)
+            self._stop.wait(self.poll)
+
+_broadcasters: Dict[str, _JobBroadcaster] = {}
+_registry_lock = threading.Lock()
+
+def subscribe(job_id: Union[int, str]) -> queue.Queue:
+    """Подписка на прогресс задачи; сразу получает последний известный снимок."""
+    job_id = str(job_id)
+    q: queue.Queue = queue.Queue(maxsize=8)
+    with _registry_lock:
+        b = _broadcasters.get(job_id)
+        if b is None:
+            b = _broadcasters[job_id] = _JobBroadcaster(job_id)
+            b.start()
+        b.subscribers.add(q)
+        if b.last is not None:
+            q.put_nowait(b.last)
+    return q
+
+def unsubscribe(job_id: Union[int, str], q: queue.Queue) -> None:
+    """Последний отписавшийся останавливает поток задачи."""
+    job_id = str(job_id)
+    with _registry_lock:
+        b = _broadcasters.get(job_id)
+        if b is None:
+            return
+        b.subscribers.discard(q)
+        if not b.subscribers:
+            b.stop()
+            del _broadcasters[job_id]
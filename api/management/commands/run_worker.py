@@ -0,0 +1,28 @@
+import logging
+import signal
+from django.core.management.base import BaseCommand
+from api.worker import JobWorker
+
+
+class Command(BaseCommand):
+    help = "Запуск воркера, выполняющего задачи из очереди (отдельно от веб-процесса)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Сколько задач выполнять одновременно (по умолчанию JOB_WORKER_CONCURRENCY)")
+        parser.add_argument('--budget', type=float, default=None,
+                            help="Суммарная стоимость одновременно выполняемых задач (по умолчанию JOB_WORKER_COST_BUDGET, 0 — без ограничения)")
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+        worker = JobWorker(concurrency=options['concurrency'], cost_budget=options['budget'])
+
+        def _stop(signum, frame):
+            self.stdout.write("Остановка воркера: новые задачи не берутся, ожидание текущих...")
+            worker.stop()
+
+        signal.signal(signal.SIGINT, _stop)
+        signal.signal(signal.SIGTERM, _stop)
+
+        self.stdout.write(f"Воркер {worker.worker_id}: задач одновременно {worker.concurrency}, бюджет {worker.cost_budget or 'без ограничения'}")
+        worker.run_forever()
@@ -1,4 +1,5 @@
 import json
+import sqlite3
 import re
 import time
 import os
@@ -7,6 +8,7 @@ from pathlib import Path
 from typing import Dict, List, Union, Optional
 from django.conf import settings
 from datetime import datetime
+from . import job_index
 
 JOBS_ROOT = Path(settings.MEDIA_ROOT) / 'jobs'
 
@@ -28,23 +30,40 @@ def _slugify(name: str) -> str:
 def _ensure_root():
     JOBS_ROOT.mkdir(parents=True, exist_ok=True)
 
+_NUMERIC_SLUG = '#'
+
+def _claim_job_dir(name: str) -> bool:
+    try:
+        (JOBS_ROOT / name).mkdir(exist_ok=False)
+        return True
+    except FileExistsError:
+        return False
+
+def _numeric_seed() -> int:
+    p_counter = JOBS_ROOT / 'last_id.txt'
+    try:
+        return int(p_counter.read_text().strip())
+    except (OSError, ValueError):
+        return 0
+
 def _get_unique_job_name(base_name: str) -> str:
+    """
+    Уникальное имя задачи: номер из счётчика SQLite (без имени) или slug, slug_1, slug_2…
+    Каталог задачи занимается mkdir без exist_ok, поэтому одно имя не достанется двум задачам;
+    занятые до появления счётчика имена просто пропускаются.
+    """
     _ensure_root()
-    if not base_name:
-        p_counter = JOBS_ROOT / 'last_id.txt'
-        n = int(p_counter.read_text().strip()) + 1 if p_counter.exists() else 1
-        p_counter.write_text(str(n))
-        return str(n)
-
-    slug_name = _slugify(base_name)
-    if not (JOBS_ROOT / slug_name).exists():
-        return slug_name
-    counter = 1
+    slug_name = _slugify(base_name) if base_name else ''
+    if not slug_name:
+        while True:
+            name = str(job_index.next_name_number(_NUMERIC_SLUG, seed=_numeric_seed()))
+            if _claim_job_dir(name):
+                return name
     while True:
-        unique_name = f"{slug_name}_{counter}"
-        if not (JOBS_ROOT / unique_name).exists():
-            return unique_name
-        counter += 1
+        n = job_index.next_name_number(slug_name)
+        name = slug_name if n == 0 else f"{slug_name}_{n}"
+        if _claim_job_dir(name):
+            return name
 
 def _job_dir(job_id: Union[int, str]) -> Path:
     return JOBS_ROOT / str(job_id)
@@ -55,6 +74,77 @@ def job_json_path(job_id: Union[int, str]) -> Path:
 def job_log_path(job_id: Union[int, str]) -> Path:
     return _job_dir(job_id) / 'job.log'
 
+def job_events_path(job_id: Union[int, str]) -> Path:
+    return _job_dir(job_id) / 'events.jsonl'
+
+def job_live_path(job_id: Union[int, str]) -> Path:
+    return _job_dir(job_id) / 'live.json'
+
+def write_job_live(job_id: Union[int, str], data: Dict) -> None:
+    """Текущий прогресс кодирований (проценты, fps, скорость, ETA) для страницы задачи."""
+    p = job_live_path(job_id)
+    tmp = p.with_suffix(f'.json.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    tmp.replace(p)
+
+def read_job_live(job_id: Union[int, str]) -> Optional[Dict]:
+    try:
+        return json.loads(job_live_path(job_id).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def append_job_event(job_id: Union[int, str], event: Dict) -> None:
+    """Дописать изменение состояния в events.jsonl (между сбросами job.json)."""
+    p = job_events_path(job_id)
+    with open(p, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+def _read_job_events(job_id: Union[int, str]) -> List[Dict]:
+    p = job_events_path(job_id)
+    if not p.exists():
+        return []
+    events = []
+    with open(p, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                break
+    return events
+
+def _compact_job_events(job_id: Union[int, str], seq: int) -> None:
+    """Убрать из events.jsonl изменения, уже попавшие в снимок job.json."""
+    p = job_events_path(job_id)
+    if not p.exists():
+        return
+    rest = [e for e in _read_job_events(job_id) if int(e.get('seq') or 0) > seq]
+    if not rest:
+        p.unlink(missing_ok=True)
+        return
+    tmp = p.with_suffix('.jsonl.tmp')
+    tmp.write_text(''.join(json.dumps(e, ensure_ascii=False) + "\n" for e in rest), encoding='utf-8')
+    tmp.replace(p)
+
+def _replay_job_events(job: Dict, events: List[Dict]) -> bool:
+    """
+    Применить к снимку непрерывную цепочку изменений начиная с state_seq + 1.
+    False — цепочка не стыкуется со снимком (снимок устарел, а журнал уже сжат).
+    """
+    seq = int(job.get('state_seq') or 0)
+    for event in events:
+        event_seq = int(event.get('seq') or 0)
+        if event_seq <= seq:
+            continue
+        if event_seq != seq + 1:
+            job['state_seq'] = seq
+            return False
+        job.update(event.get('set') or {})
+        for key in event.get('unset') or []:
+            job.pop(key, None)
+        seq = event_seq
+    job['state_seq'] = seq
+    return True
+
 def create_job(payload: Dict) -> Dict:
     job_name_raw = payload.get('job_name', '')
     job_name = _get_unique_job_name(job_name_raw)
@@ -101,27 +191,54 @@ def write_job(job: Dict) -> None:
                         pass
             except Exception as final_error:
                 raise Exception(f"Не удалось записать job.json: {final_error}")
+        _compact_job_events(job_id, int(job.get('state_seq') or 0))
+    try:
+        job_index.index_job(job)
+    except sqlite3.Error:
+        pass
 
 def read_job(job_id: Union[int, str]) -> Dict:
+    """Снимок job.json с применёнными изменениями из events.jsonl, ещё не сброшенными в снимок."""
     p = job_json_path(job_id)
-    return json.loads(p.read_text(encoding='utf-8'))
+    for _ in range(2):
+        job = json.loads(p.read_text(encoding='utf-8'))
+        if _replay_job_events(job, _read_job_events(job_id)):
+            return job
+    return job
 
 def job_log_relpath(job_id: Union[int, str], output_folder: Optional[str] = None) -> str:
     if output_folder:
         return str(Path(output_folder) / str(job_id) / 'logs' / 'job.log')
     else:
         return str(Path('jobs') / str(job_id) / 'job.log')
-def list_jobs(limit: int = 20) -> List[Dict]:
+def _ensure_index() -> None:
+    """Перенос в каталог задач, созданных до его появления (один раз)."""
+    if job_index.is_backfilled():
+        return
     _ensure_root()
     jobs = []
-    all_job_paths = [p for p in JOBS_ROOT.iterdir() if p.is_dir()]
-    job_data = []
-    for path in all_job_paths:
+    for path in JOBS_ROOT.iterdir():
         json_p = path / 'job.json'
-        if json_p.exists():
+        if path.is_dir() and json_p.exists():
             try:
-                job_data.append(json.loads(json_p.read_text(encoding='utf-8')))
+                jobs.append(json.loads(json_p.read_text(encoding='utf-8')))
             except Exception:
                 continue
-    job_data.sort(key=lambda j: j.get('created_at', ''), reverse=True)
-    return job_data[:limit]
\ No newline at end of file
+    job_index.backfill(jobs)
+
+def list_jobs(limit: int = 20, offset: int = 0, status: Optional[str] = None) -> List[Dict]:
+    """Страница задач из каталога (SQLite), новые сверху; читаются только job.json этой страницы."""
+    _ensure_index()
+    jobs = []
+    for job_id in job_index.list_job_ids(limit, offset, status):
+        try:
+            jobs.append(read_job(job_id))
+        except FileNotFoundError:
+            job_index.remove_job(job_id)
+        except Exception:
+            continue
+    return jobs
+
+def count_jobs(status: Optional[str] = None) -> int:
+    _ensure_index()
+    return job_index.count_jobs(status)
@@ -1,18 +1,76 @@
+import queue
 import threading
+import time
 import tempfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Union, Optional
-from video_core.probe import probe_duration
-from video_core.ffmpeg_builder import build_ffmpeg_command
-from video_core.ffmpeg_runner import run_ffmpeg_with_progress
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union, Optional
+from django.conf import settings
+from video_core import metrics
+from video_core.capabilities import configure_capabilities, get_capabilities, mark_unusable
+from video_core.probe import ProbeInfo, probe_duration, probe_media, probe_many, probe_url, configure_probe_cache
+from video_core.remote import input_failed
+from video_core.ffmpeg_builder import build_ffmpeg_command, build_ffmpeg_multi_command, can_stream_copy
+from video_core.ffmpeg_runner import ProgressRecord, run_ffmpeg_with_progress
+from video_core.segmented import SegmentedPlan, build_segmented, segment_eligible
+from video_core.smart_cut import build_smart_cut, smart_cut_planned
+from video_core.threads import get_thread_budget
 from video_core.params import JobParams, TextParams, BadgeParams, EffectsParams
-from .store import read_job, write_job, job_log_relpath
+from . import job_queue
+from .job_state import JobState
+from .ledger import TaskLedger
+from .store import read_job, write_job, write_job_live, job_log_relpath
 from .yadisk_client import get_yadisk_client
 
-def start_job_thread(job_id: Union[int, str]):
-    t = threading.Thread(target=_run_job, args=(job_id,), daemon=True)
-    t.start()
+VIDEO_PATTERNS = ["*.mp4","*.MP4","*.mov","*.MOV","*.mkv","*.MKV","*.webm","*.WEBM"]
+
+def _find_video_files(folder: Path) -> List[Path]:
+    video_files_set = set()
+    for pattern in VIDEO_PATTERNS:
+        video_files_set.update(folder.rglob(pattern))
+    return list(video_files_set)
+
+def estimate_job_cost(job: dict) -> float:
+    """
+    Оценка стоимости задачи для допуска в воркер: число кодирований (исходники × копии).
+    Для Яндекс Диска число исходников заранее неизвестно — считаем по копиям.
+    """
+    params = job.get('params') or {}
+    if params.get('is_test'):
+        return 1.0
+    copies = max(1, int(params.get('copies') or 1))
+    if params.get('use_yadisk'):
+        return float(copies)
+    try:
+        folder = Path(job['input_folder'])
+        n_files = len(_find_video_files(folder)) if folder.is_dir() else 0
+    except Exception:
+        n_files = 0
+    return float(max(1, n_files) * copies)
+
+def submit_job(job_id: Union[int, str]) -> None:
+    """Поставить задачу в очередь воркера (python manage.py run_worker)."""
+    job = read_job(job_id)
+    cost = estimate_job_cost(job)
+    job['status'] = 'queued'
+    job['estimated_cost'] = cost
+    write_job(job)
+    job_queue.enqueue(job_id, cost)
+
+def resume_job(job_id: Union[int, str]) -> bool:
+    """
+    Повторный запуск прерванной или завершившейся с ошибками задачи.
+    Выходы, подтверждённые журналом tasks.jsonl, пропускаются; False — задача ещё выполняется.
+    """
+    if job_queue.job_state(job_id) == job_queue.RUNNING:
+        return False
+    job = read_job(job_id)
+    job['resume_count'] = int(job.get('resume_count') or 0) + 1
+    job['message'] = ''
+    write_job(job)
+    submit_job(job_id)
+    return True
 
 def _clean_path_str(val: str) -> str:
     if val is None:
@@ -63,6 +121,7 @@ def _build_params(job: dict, input_path: Path, output_path: Path, ui: dict, temp
         safe_mode=bool(ui.get('safe_mode', True)),
         color_mod=bool(ui.get('color_mod')),
         hidden_pattern=bool(ui.get('hidden_pattern')),
+        stream_copy=bool(ui.get('stream_copy')),
     )
     jp = JobParams(
         input_path=input_path,
@@ -77,6 +136,8 @@ def _build_params(job: dict, input_path: Path, output_path: Path, ui: dict, temp
     return jp
 
 def _nvenc_to_x264(cmd: List[str]) -> List[str]:
+    """Замена NVENC на libx264 после сбоя; NVENC больше не выбирается этим процессом (реестр возможностей)."""
+    mark_unusable('h264_nvenc')
     new_cmd = []
     skip_next = False
     i = 0
@@ -102,8 +163,715 @@ def _nvenc_to_x264(cmd: List[str]) -> List[str]:
         i += 1
     return new_cmd
 
-def _run_job(job_id: Union[int, str]):
+def _threads_per_encode() -> int:
+    return max(1, int(getattr(settings, 'ENCODE_THREADS_PER_TASK', 4) or 4))
+
+def _thread_budget():
+    return get_thread_budget(
+        total=int(getattr(settings, 'FFMPEG_THREAD_BUDGET', 0) or 0) or None,
+        pin=bool(getattr(settings, 'FFMPEG_PIN_CPUS', False)),
+    )
+
+_probe_cache_configured = False
+
+def _configure_probe_cache() -> None:
+    global _probe_cache_configured
+    if _probe_cache_configured:
+        return
+    cache_dir = getattr(settings, 'PROBE_CACHE_DIR', '') or None
+    configure_probe_cache(Path(cache_dir) if cache_dir else None)
+    caps_dir = getattr(settings, 'FFMPEG_CAPS_DIR', '') or None
+    configure_capabilities(Path(caps_dir) if caps_dir else None,
+                           float(getattr(settings, 'FFMPEG_CAPS_TTL_SEC', 86400) or 86400))
+    _probe_cache_configured = True
+
+def warm_up() -> str:
+    """Опрос возможностей FFmpeg при старте воркера, чтобы задачи не запускали его сами."""
+    _configure_probe_cache()
+    return get_capabilities().summary()
+
+def _encode_workers(threads_per_encode: int) -> int:
+    configured = int(getattr(settings, 'ENCODE_WORKERS', 0) or 0)
+    if configured > 0:
+        return configured
+    return max(1, _thread_budget().total // threads_per_encode)
+
+class _JobProgress:
+    """
+    Агрегация прогресса параллельных кодирований в job.json и job.log.
+    Проценты, fps, скорость и ETA текущих кодирований публикуются в live.json
+    не чаще раза в JOB_LIVE_INTERVAL_MS — их раздаёт поток событий страницы задачи.
+    """
+
+    def __init__(self, state: JobState, log_path: Path, ledger: Optional[TaskLedger] = None):
+        self.state = state
+        self.job = state.job
+        self.log_path = log_path
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self._active = {}
+        self._live = {}
+        self._live_interval = int(getattr(settings, 'JOB_LIVE_INTERVAL_MS', 500) or 0) / 1000.0
+        self._live_published = 0.0
+        self._stats: Dict[str, dict] = {}
+        self._rf_sum = 0.0
+        self._rf_count = 0
+
+    def log(self, lines: List[str]) -> None:
+        with self._lock:
+            with open(self.log_path, 'a', encoding='utf-8') as logf:
+                for line in lines:
+                    logf.write(line + "\n")
+
+    def _publish_live(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._live_published < self._live_interval:
+            return
+        self._live_published = now
+        job = self.job
+        in_flight = sum(self._active.values()) / 100.0
+        tasks = []
+        for key, live in self._live.items():
+            pct = self._active.get(key, 0)
+            rec: Optional[ProgressRecord] = live.get('record')
+            eta = rec.eta_sec if rec is not None else None
+            if eta is None and pct > 0:
+                eta = round((now - live['started']) * (100 - pct) / pct, 1)
+            tasks.append({
+                'output': Path(key).name,
+                'pct': pct,
+                'fps': rec.fps if rec else None,
+                'speed': rec.speed if rec else None,
+                'bitrate_kbps': rec.bitrate_kbps if rec else None,
+                'frame': rec.frame if rec else None,
+                'drop_frames': rec.drop_frames if rec else 0,
+                'dup_frames': rec.dup_frames if rec else 0,
+                'eta_sec': eta,
+            })
+        try:
+            write_job_live(job['id'], {
+                'ts': time.time(),
+                'progress_overall': min(100, int((job['done_tasks'] + in_flight) * 100 / max(1, job['total_tasks']))),
+                'done_tasks': job['done_tasks'],
+                'total_tasks': job['total_tasks'],
+                'tasks': tasks,
+            })
+        except OSError:
+            pass
+
+    def task_progress(self, key: str, pct: int, record: Optional[ProgressRecord] = None) -> None:
+        with self._lock:
+            self._active[key] = pct
+            live = self._live.setdefault(key, {'started': time.monotonic()})
+            if record is not None:
+                live['record'] = record
+            self._publish_live()
+
+    def task_stats(self, key: str, media_sec: float, wall_sec: float, record: Optional[ProgressRecord] = None) -> None:
+        """
+        Пропускная способность кодирования выхода: realtime-фактор = длительность ролика / время кодирования.
+        Сведения по выходу уходят в журнал задачи (pop_stats → record_result), в job — только средние:
+        растущий словарь в job переписывался бы в events.jsonl целиком при каждом save.
+        """
+        stats = {
+            'realtime_factor': round(media_sec / wall_sec, 2) if wall_sec > 0 else None,
+            'wall_sec': round(wall_sec, 2),
+            'media_sec': round(media_sec, 2),
+        }
+        if record is not None:
+            stats.update({
+                'fps': record.fps,
+                'speed': record.speed,
+                'frames': record.frame,
+                'bitrate_kbps': record.bitrate_kbps,
+                'drop_frames': record.drop_frames,
+                'dup_frames': record.dup_frames,
+            })
+        if stats['realtime_factor'] is not None:
+            metrics.observe('encode_realtime_factor', stats['realtime_factor'])
+        try:
+            metrics.add_bytes('encoded', Path(key).stat().st_size)
+        except OSError:
+            pass
+        with self._lock:
+            self._stats[key] = stats
+            if stats['realtime_factor'] is not None:
+                self._rf_sum += stats['realtime_factor']
+                self._rf_count += 1
+                self.job['throughput'] = {
+                    'outputs': self._rf_count,
+                    'realtime_factor_avg': round(self._rf_sum / self._rf_count, 2),
+                }
+
+    def pop_stats(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._stats.pop(key, None)
+
+    def drop_source(self, inp: Path, tasks: int, reason: str) -> None:
+        """Исходник оказался нечитаемым после скачивания: его задачи убираются из общего числа."""
+        with self._lock:
+            job = self.job
+            job['total_tasks'] = max(0, job['total_tasks'] - tasks)
+            job['src_files_total'] = max(0, job.get('src_files_total', 1) - 1)
+            job.setdefault('unreadable_files', []).append({'path': str(inp), 'error': reason})
+            job['message'] = f"Пропущено нечитаемых файлов: {len(job['unreadable_files'])}"
+            with open(self.log_path, 'a', encoding='utf-8') as logf:
+                logf.write(f"UNREADABLE INPUT: {inp}: {reason}\n")
+            self.state.save()
+
+    def upload_done(self, nbytes: int, busy_sec: float) -> None:
+        """Выход загружен: число файлов, байты и скорость загрузки (байты / время, когда шла хоть одна загрузка)."""
+        with self._lock:
+            job = self.job
+            job['uploaded_files'] = job.get('uploaded_files', 0) + 1
+            job['uploaded_bytes'] = job.get('uploaded_bytes', 0) + nbytes
+            job['upload_bytes_per_sec'] = int(job['uploaded_bytes'] / busy_sec) if busy_sec > 0 else None
+            self.state.save()
+
+    def task_done(self, key: str, message: Optional[str] = None) -> None:
+        with self._lock:
+            self._active.pop(key, None)
+            job = self.job
+            job['done_tasks'] += 1
+            if message:
+                job['message'] = message
+            total = max(1, job['total_tasks'])
+            in_flight = sum(self._active.values()) / 100.0
+            job['progress_overall'] = min(100, int((job['done_tasks'] + in_flight) * 100 / total))
+            self.state.save()
+            self._live.pop(key, None)
+            self._publish_live(force=True)
+
+def _probe_sources(video_files: List[Path], log_path: Path) -> Tuple[List[Path], List[dict]]:
+    """
+    Пакетная проверка всех исходников до старта кодирования.
+    Возвращает (читаемые файлы в исходном порядке, список нечитаемых с причиной).
+    """
+    workers = int(getattr(settings, 'PROBE_WORKERS', 8) or 8)
+    bad = {}
+    with open(log_path, 'a', encoding='utf-8') as logf:
+        for path, info in probe_many(video_files, max_workers=workers):
+            if not info.ok:
+                reason = info.error or 'нет видеопотока'
+                bad[path] = reason
+                logf.write(f"UNREADABLE INPUT: {path}: {reason}\n")
+    readable = [f for f in video_files if f not in bad]
+    unreadable = [{'path': str(f), 'error': reason} for f, reason in bad.items()]
+    return readable, unreadable
+
+def _remote_sources(client, remote_by_local: Dict[Path, Dict], disk_folder: str, local_folder: Path,
+                    slots: threading.Semaphore, urls: Dict[Path, str], streamed: Dict[Path, Dict],
+                    stream: bool) -> Iterator[Path]:
+    """
+    Исходники с Яндекс Диска по мере готовности. При stream MP4/MOV с moov в начале файла не скачиваются:
+    они попадают в streamed, FFmpeg читает их по сети. Остальные скачиваются во временную папку.
+    Ссылка в urls нужна только для проверки исходника при поступлении: ссылки временные,
+    для кодирования берётся новая (_UploadPipeline.run_unit).
+    """
+    staged = list(remote_by_local.items())
+    if stream and staged:
+        items, staged = staged, []
+        with ThreadPoolExecutor(max_workers=client.download_workers, thread_name_prefix='yadisk-link') as pool:
+            for (local, vf), url in zip(items, pool.map(client.stream_url, [vf for _, vf in items])):
+                if url:
+                    urls[local] = url
+                    streamed[local] = vf
+                    yield local
+                else:
+                    staged.append((local, vf))
+    yield from client.download_videos([vf for _, vf in staged], disk_folder, local_folder, slots=slots)
+
+def _units_as_downloaded(arrivals: Iterable[Path], units: List[Tuple[Path, List[Path]]], progress: _JobProgress,
+                         on_drop: Optional[Callable[[Path], None]] = None,
+                         urls: Optional[Dict[Path, str]] = None,
+                         single: Optional[Callable[[Path, Path, ProbeInfo], bool]] = None,
+                         ) -> Iterator[Tuple[Path, List[Path]]]:
+    """
+    Единицы работы в порядке скачивания исходников: каждый пришедший файл проверяется ffprobe
+    и сразу уходит в кодирование. Нечитаемые исключаются из задач, как при пакетной проверке;
+    нескачанные отдаются в конце — _run_unit отметит их выходы как ошибку (нет файла).
+    Исходники из urls не скачаны: ffprobe читает их по ссылке, после чего ссылка из urls убирается.
+    Скачанный исходник, для которого single(вход, выход, probe) истинно, кодируется по одному выходу
+    на процесс (до скачивания ffprobe о нём ничего не знает, поэтому решение принимается здесь).
+    """
+    if urls is None:
+        urls = {}
+    by_source: Dict[Path, List[Tuple[Path, List[Path]]]] = {}
+    for inp, outs in units:
+        by_source.setdefault(inp, []).append((inp, outs))
+    total = len(by_source)
+    arrived = 0
+    for path in arrivals:
+        arrived += 1
+        source_units = by_source.pop(path, [])
+        url = urls.pop(path, None)
+        info = probe_url(url) if url else probe_media(path)
+        if not info.ok:
+            progress.drop_source(path, sum(len(outs) for _, outs in source_units), info.error or 'нет видеопотока')
+            if on_drop is not None:
+                on_drop(path)
+            continue
+        progress.log([f"{'STREAMED' if url else 'DOWNLOADED'} ({arrived}/{total}): {path.name}"])
+        outs = [out for _, unit_outs in source_units for out in unit_outs]
+        if not url and single is not None and len(source_units) < len(outs) and single(path, outs[0], info):
+            source_units = [(path, [out]) for out in outs]
+        yield from source_units
+    for source_units in by_source.values():
+        yield from source_units
+
+class _UploadPipeline:
+    """
+    Потоковая обработка задачи с Яндекс Диска: скачивание → кодирование → загрузка.
+    Исходник занимает место (slots) с начала скачивания до конца всех его копий, затем удаляется;
+    готовый выход сразу попадает в ограниченную очередь загрузки (кодирование ждёт, если загрузка
+    не успевает), её разбирают client.upload_workers потоков, загруженный выход удаляется.
+    Во временной папке лежат только файлы в работе.
+    """
+
+    def __init__(self, client, progress: _JobProgress, local_dir: Path, remote_dir: str, base_path: str,
+                 units: List[Tuple[Path, List[Path]]], slots: threading.Semaphore, queue_size: int):
+        self.client = client
+        self.progress = progress
+        self.ledger = progress.ledger
+        self.local_dir = local_dir
+        self.remote_dir = remote_dir.rstrip('/')
+        self.base_path = base_path
+        self.slots = slots
+        self.uploaded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._remaining: Dict[Path, int] = {}
+        # считаются выходы, а не единицы: единицы исходника могут перегруппироваться при скачивании
+        for inp, outs in units:
+            self._remaining[inp] = self._remaining.get(inp, 0) + len(outs)
+        self._arrived = set()
+        self._queued = set()
+        self.urls: Dict[Path, str] = {}
+        self.streamed: Dict[Path, Dict] = {}
+        self._restaged = set()
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        # время, когда шла хотя бы одна загрузка: скорость не занижается ожиданием кодирования
+        self._active = 0
+        self._busy_since = 0.0
+        self._busy_sec = 0.0
+        client._ensure_path_exists(remote_dir, base_path=base_path)
+        self._threads = [
+            threading.Thread(target=metrics.propagate(self._upload_loop), name=f'yadisk-upload-{i}', daemon=True)
+            for i in range(client.upload_workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def track(self, arrivals: Iterable[Path]) -> Iterator[Path]:
+        for path in arrivals:
+            if path not in self.streamed:
+                with self._lock:
+                    self._arrived.add(path)
+            yield path
+
+    def run_unit(self, progress: _JobProgress, inp: Path, outs: List[Path], *args) -> None:
+        try:
+            video_file = self.streamed.get(inp)
+            url = None
+            if video_file is not None:
+                # ссылка временная: берётся перед самым кодированием, а не при старте задачи
+                url = self.client.download_link(video_file)
+                if url is None:
+                    self._restage(inp)
+            _run_unit(progress, inp, outs, *args, input_url=url,
+                      restage=(lambda: self._restage(inp)) if url else None)
+        finally:
+            for out in outs:
+                if out.exists() and self.ledger.verified(out):
+                    self._enqueue(out)
+            with self._lock:
+                self._remaining[inp] = self._remaining.get(inp, len(outs)) - len(outs)
+                finished = self._remaining[inp] <= 0
+            if finished:
+                self.release_source(inp)
+
+    def _restage(self, inp: Path) -> bool:
+        """
+        Скачать исходник, который не удалось прочитать по ссылке. Место во временной папке не занимается:
+        ожидание места в потоке кодирования могло бы заблокировать задачу, а таких файлов единицы.
+        """
+        with self._lock:
+            if inp in self._restaged and inp.exists():
+                return True
+            self._restaged.add(inp)
+        video_file = self.streamed[inp]
+        self.progress.log([f"RESTAGE: {inp.name} скачивается во временную папку"])
+        return self.client.download_file(video_file['path'], inp, video_file.get('size')) is not None
+
+    def release_source(self, inp: Path) -> None:
+        """Исходник больше не нужен: удалить из временной папки и освободить место для следующего скачивания."""
+        with self._lock:
+            held = inp in self._arrived
+            self._arrived.discard(inp)
+            restaged = inp in self._restaged
+        if held or restaged:
+            inp.unlink(missing_ok=True)
+        if held:
+            self.slots.release()
+
+    def _enqueue(self, out: Path) -> None:
+        with self._lock:
+            if out in self._queued:
+                return
+            self._queued.add(out)
+        self._queue.put(out)
+
+    def _busy(self, delta: int) -> float:
+        """Учёт параллельных загрузок; возвращает суммарное время, когда шла хоть одна."""
+        with self._lock:
+            now = time.monotonic()
+            if self._active:
+                self._busy_sec += now - self._busy_since
+            self._busy_since = now
+            self._active += delta
+            return self._busy_sec
+
+    def _upload_loop(self) -> None:
+        while True:
+            out = self._queue.get()
+            if out is None:
+                return
+            # Исключение не должно завершать поток: очередь ограничена, и без потребителя
+            # put/finish заблокировались бы навсегда
+            remote = f"{self.remote_dir}/{out.name}"
+            busy = False
+            try:
+                remote = f"{self.remote_dir}/{out.relative_to(self.local_dir).as_posix()}"
+                size = out.stat().st_size
+                self._busy(+1)
+                busy = True
+                ok = self.client.upload_file(out, remote, overwrite=True, base_path=self.base_path)
+                busy_sec = self._busy(-1)
+                busy = False
+                if ok:
+                    self.ledger.record_uploaded(out, remote)
+                    out.unlink(missing_ok=True)
+                    with self._lock:
+                        self.uploaded += 1
+                    self.progress.upload_done(size, busy_sec)
+                else:
+                    with self._lock:
+                        self.failed += 1
+                    self.progress.log([f"UPLOAD FAILED: {out} -> {remote}"])
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                self.progress.log([f"UPLOAD FAILED: {out} -> {remote}: {e}"])
+            finally:
+                if busy:
+                    self._busy(-1)
+
+    def finish(self) -> None:
+        """Дозагрузить готовые выходы, оставшиеся с прошлого запуска, и дождаться очереди загрузки."""
+        if self.local_dir.exists():
+            for out in sorted(self.local_dir.iterdir()):
+                if out.is_file() and not self.ledger.uploaded(out) and self.ledger.verified(out):
+                    self._enqueue(out)
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+def _single_output(job: dict, inp: Path, outp: Path, params: dict, temp_assets_folder: Optional[Path],
+                   info: ProbeInfo, threads: int) -> bool:
+    """
+    Копии исходника кодируются по одной: кодирование частями и умная нарезка строятся только
+    для процесса с одним выходом, и при группировке копий в один процесс они бы не применялись.
+    Длинный исходник частями быстрее, чем все копии одним процессом: части идут параллельно.
+    """
+    p = _build_params(job, inp, outp, params, temp_assets_folder=temp_assets_folder)
+    min_sec = float(getattr(settings, 'ENCODE_SEGMENT_MIN_SEC', 600) or 600)
+    if _segment_count(threads) > 1 and segment_eligible(p, info, min_sec):
+        return True
+    return smart_cut_planned(p, info)
+
+def _group_tasks(tasks: List[Tuple[Path, Path]],
+                 single: Optional[Callable[[Path, Path], bool]] = None) -> List[Tuple[Path, List[Path]]]:
+    """
+    Группировка копий одного исходника в единицы работы.
+    При ENCODE_MULTI_OUTPUT копии кодируются одним процессом FFmpeg (декодирование один раз),
+    не более ENCODE_MULTI_OUTPUT_MAX выходов на процесс. Исходники, для которых single(вход, выход)
+    истинно, кодируются по одному выходу на процесс.
+    """
+    per_unit = max(1, int(getattr(settings, 'ENCODE_MULTI_OUTPUT_MAX', 5) or 1))
+    if not getattr(settings, 'ENCODE_MULTI_OUTPUT', True):
+        per_unit = 1
+    by_source: Dict[Path, List[Path]] = {}
+    for inp, outp in tasks:
+        by_source.setdefault(inp, []).append(outp)
+    units = []
+    for inp, outs in by_source.items():
+        step = 1 if per_unit > 1 and len(outs) > 1 and single is not None and single(inp, outs[0]) else per_unit
+        for i in range(0, len(outs), step):
+            units.append((inp, outs[i:i + step]))
+    return units
+
+def _run_ffmpeg_step(progress: _JobProgress, cmd: List[str], dur: float, out_durations: Dict[str, float],
+                     plan, lines: List[str], base: float = 0.0, span: float = 1.0,
+                     report: Optional[Callable[[str, int], None]] = None, stats: Optional[dict] = None) -> bool:
+    """
+    Один запуск FFmpeg с откатом NVENC -> libx264.
+    Прогресс выхода пересчитывается в долю [base, base+span] для многошаговых выходов,
+    либо передаётся в report(выход, процент). В stats['record'] остаётся последний ProgressRecord.
+    """
+    interval = int(getattr(settings, 'FFMPEG_PROGRESS_INTERVAL_MS', 500) or 0) / 1000.0
+    tried_nvenc_fallback = False
+    while True:
+        finished_ok = False
+        finished_err = False
+        for ev in run_ffmpeg_with_progress(cmd, dur, outputs=out_durations, cpus=plan.cpus, min_interval=interval):
+            if ev.get('event') == 'progress':
+                if stats is not None:
+                    stats['record'] = ev.get('record')
+                for key, pct in ev.get('outputs', {}).items():
+                    if report is not None:
+                        report(key, pct)
+                    else:
+                        record = ev.get('record') if base == 0.0 and span == 1.0 else None
+                        progress.task_progress(key, int(base * 100 + pct * span), record)
+            elif ev.get('event') == 'log':
+                lines.append(ev.get('line', ''))
+            elif ev.get('event') == 'done':
+                finished_ok = True
+            elif ev.get('event') == 'error':
+                finished_err = True
+        if finished_err and any(tok == 'h264_nvenc' for tok in cmd) and not tried_nvenc_fallback:
+            lines.append("NVENC error -> fallback to libx264")
+            if not get_capabilities().has_encoder('libx264'):
+                lines.append("WARNING: libx264 нет в сборке FFmpeg")
+            cmd = _nvenc_to_x264(cmd)
+            tried_nvenc_fallback = True
+            continue
+        if not finished_ok and finished_err:
+            lines.append("FFmpeg finished with error")
+        return finished_ok and not finished_err
+
+def _segment_count(threads: int) -> int:
+    configured = int(getattr(settings, 'ENCODE_SEGMENTS', 0) or 0)
+    if configured > 0:
+        return configured
+    return min(8, max(1, _thread_budget().total // threads))
+
+def _run_segmented(progress: _JobProgress, key: str, seg: SegmentedPlan, threads: int, lines: List[str]) -> bool:
+    """
+    Части кодируются параллельно, каждая со своей арендой потоков из общего бюджета;
+    затем склейка с аудио исходника. Прогресс выхода — доля готовой длительности.
+    """
+    seg_pct = [0] * len(seg.bounds)
+    seg_len = [end - start for start, end in seg.bounds]
+    pct_lock = threading.Lock()
+
+    def _encode(i: int) -> Tuple[bool, List[str]]:
+        seg_lines: List[str] = []
+
+        def _report(_key: str, pct: int) -> None:
+            with pct_lock:
+                seg_pct[i] = pct
+                done = sum(p * d for p, d in zip(seg_pct, seg_len)) / (seg.duration or 1.0)
+            progress.task_progress(key, int(done * 0.95))
+
+        with _thread_budget().acquire(threads) as plan:
+            cmd = seg.segment_command(i, plan)
+            seg_lines.append(f"SEGMENT {i + 1}/{len(seg.bounds)} CMD: {' '.join(cmd)}")
+            ok = _run_ffmpeg_step(progress, cmd, seg_len[i], {key: seg_len[i]}, plan, seg_lines, report=_report)
+        return ok, seg_lines
+
+    ok = True
+    with ThreadPoolExecutor(max_workers=len(seg.bounds), thread_name_prefix='segment') as pool:
+        for seg_ok, seg_lines in pool.map(metrics.propagate(_encode), range(len(seg.bounds))):
+            lines.extend(seg_lines)
+            ok = ok and seg_ok
+    if not ok:
+        return False
+    cmd = seg.concat_command()
+    lines.append(f"FFMPEG CMD: {' '.join(cmd)}")
+    with _thread_budget().acquire(1) as plan:
+        return _run_ffmpeg_step(progress, cmd, seg.duration, {key: seg.duration}, plan, lines, base=0.95, span=0.05)
+
+def _run_unit(progress: _JobProgress, inp: Path, outs: List[Path], params: dict,
+              temp_assets_folder: Optional[Path], threads: int, input_url: Optional[str] = None,
+              restage: Optional[Callable[[], bool]] = None) -> None:
+    """
+    Кодирование одного исходника в его выходы. Исходник по ссылке (input_url), который FFmpeg
+    не смог прочитать (ссылка истекла, обрыв), один раз скачивается через restage и кодируется заново.
+    """
+    keys = [str(o) for o in outs]
+    lines: List[str] = []
+    message = None
+    lease = None
+    ok = False
+    out_durations: Dict[str, float] = {}
+    step_stats: Dict[str, ProgressRecord] = {}
+    started = time.monotonic()
+    try:
+        if input_url is None and not inp.exists():
+            lines.append(f"INPUT NOT FOUND: {inp}")
+            message = f"Нет файла: {inp}"
+            return
+
+        if input_url is not None:
+            # исходник читается по сети: без сегментов и smart cut, которым нужны повторные чтения файла
+            info = probe_url(input_url)
+            dur = info.duration or probe_duration(inp)
+            lines.append(f"REMOTE INPUT: {inp.name} читается по ссылке без скачивания")
+        else:
+            info = probe_media(inp)
+            dur = info.duration or probe_duration(inp)
+        jps = [_build_params(progress.job, inp, outp, params, temp_assets_folder=temp_assets_folder) for outp in outs]
+        for p in jps:
+            p.input_url = input_url
+        jp = jps[0]
+        light = can_stream_copy(jp, info)
+        if light:
+            lines.append(f"LIGHT MODE: stream copy ({info.vcodec} {info.width}x{info.height})")
+        lease = _thread_budget().acquire(1 if light else threads * len(outs), outputs=len(outs))
+        plan = lease.plan
+        if len(jps) > 1:
+            cmd = build_ffmpeg_multi_command(jps, dur, thread_plan=plan, probe=info)
+        else:
+            cmd = build_ffmpeg_command(jp, dur, thread_plan=plan, probe=info)
+        out_durations = {key: float(jp.fixed_duration_sec or dur) for key in keys}
+
+        cmd_str = ' '.join(cmd)
+        lines.append(f"FFMPEG CMD: {cmd_str}")
+
+        filter_complex_idx = None
+        for i, arg in enumerate(cmd):
+            if arg == '-filter_complex' and i + 1 < len(cmd):
+                filter_complex_idx = i + 1
+                break
+        if filter_complex_idx is not None:
+            lines.append(f"FILTER_COMPLEX: {cmd[filter_complex_idx]}")
+
+        if jp.text.enabled:
+            if jp.text.fontfile:
+                if jp.text.fontfile.exists():
+                    lines.append(f"USING FONT: {jp.text.fontfile} (exists: {jp.text.fontfile.exists()})")
+                else:
+                    lines.append(f"FONT MISSING OR NOT FOUND: {jp.text.fontfile}")
+            else:
+                lines.append("FONT NOT SPECIFIED (using auto or default)")
+        if jp.badge.enabled:
+            if jp.badge.path:
+                exists_check = jp.badge.path.exists()
+                is_file_check = jp.badge.path.is_file() if exists_check else False
+                lines.append(f"BADGE CHECK: path={jp.badge.path}, exists={exists_check}, is_file={is_file_check}")
+                if not exists_check:
+                    lines.append(f"BADGE MISSING OR NOT FOUND: {jp.badge.path}")
+                else:
+                    lines.append(f"USING BADGE: {jp.badge.path}")
+            else:
+                lines.append("BADGE PATH IS NONE")
+
+        if plan.cpus:
+            lines.append(f"THREADS: decode={plan.threads} filter={plan.filter_threads} encoder={plan.encoder_threads} cpus={plan.cpus}")
+        else:
+            lines.append(f"THREADS: decode={plan.threads} filter={plan.filter_threads} encoder={plan.encoder_threads}")
+
+        if not light and len(jps) == 1 and input_url is None:
+            segments = _segment_count(threads)
+            seg = build_segmented(
+                jp, info, segments, float(getattr(settings, 'ENCODE_SEGMENT_MIN_SEC', 600) or 600)
+            ) if segments > 1 else None
+            if seg is not None:
+                lines.append(f"SEGMENTED: {len(seg.bounds)} частей по ключевым кадрам {[round(a, 2) for a, _ in seg.bounds]}")
+                lease.release()
+                lease = None
+                ok = _run_segmented(progress, keys[0], seg, threads, lines)
+                shutil.rmtree(seg.work_dir, ignore_errors=True)
+                if ok:
+                    return
+                lines.append("SEGMENTED failed -> full encode")
+                lease = _thread_budget().acquire(threads)
+                plan = lease.plan
+
+        smart = None
+        if not light and len(jps) == 1 and input_url is None:
+            smart = build_smart_cut(jp, info, thread_plan=plan)
+        if smart is not None:
+            lines.append(f"SMART CUT: перекодирование 0..{smart.head_end:.2f} с, остальное копируется")
+            spans = [0.9, 0.05, 0.05]
+            ok = True
+            base = 0.0
+            for (step_cmd, step_dur), span in zip(smart.steps, spans):
+                lines.append(f"FFMPEG CMD: {' '.join(step_cmd)}")
+                ok = _run_ffmpeg_step(progress, step_cmd, step_dur, {keys[0]: step_dur}, plan, lines, base, span)
+                if not ok:
+                    break
+                base += span
+            shutil.rmtree(smart.work_dir, ignore_errors=True)
+            if ok:
+                return
+            lines.append("SMART CUT failed -> full encode")
+
+        ok = _run_ffmpeg_step(progress, cmd, dur, out_durations, plan, lines, stats=step_stats)
+        if not ok and input_url is not None and restage is not None and input_failed(lines):
+            lines.append("REMOTE INPUT FAILED -> скачивание исходника и повтор")
+            if restage():
+                for p in jps:
+                    p.input_url = None
+                if len(jps) > 1:
+                    cmd = build_ffmpeg_multi_command(jps, dur, thread_plan=plan, probe=info)
+                else:
+                    cmd = build_ffmpeg_command(jp, dur, thread_plan=plan, probe=info)
+                lines.append(f"FFMPEG CMD: {' '.join(cmd)}")
+                step_stats.clear()
+                started = time.monotonic()
+                ok = _run_ffmpeg_step(progress, cmd, dur, out_durations, plan, lines, stats=step_stats)
+    finally:
+        if lease is not None:
+            lease.release()
+        if ok:
+            wall = time.monotonic() - started
+            for key in keys:
+                progress.task_stats(key, out_durations.get(key, 0.0), wall, step_stats.get('record'))
+        if progress.ledger is not None:
+            for out in outs:
+                entry = progress.ledger.record_result(inp, out, ok, error=message, stats=progress.pop_stats(str(out)))
+                if entry['status'] != 'done':
+                    lines.append(f"TASK FAILED: {out}: {entry.get('error')}")
+        if lines:
+            progress.log(lines)
+        for key in keys:
+            progress.task_done(key, message)
+
+def _save_job_metrics(job_id: Union[int, str], job_metrics: metrics.JobMetrics, failed: bool) -> None:
+    status = 'error' if failed else None
+    try:
+        job = read_job(job_id)
+        job['metrics'] = job_metrics.to_dict()
+        write_job(job)
+        status = status or job.get('status')
+    except (OSError, ValueError):
+        pass
+    metrics.inc('jobs_total', status=status or 'unknown')
+
+def _run_job(job_id: Union[int, str], queue_wait: Optional[float] = None):
+    """
+    Выполнение задачи со сводкой метрик: время стадий (скачивание, ffprobe, FFmpeg, загрузка),
+    объём данных, realtime-фактор кодирования и ожидание в очереди попадают в job.json (поле metrics).
+    """
+    job_metrics = metrics.JobMetrics()
+    if queue_wait is not None:
+        metrics.observe('queue_wait_seconds', queue_wait)
+        job_metrics.set('queue_wait_sec', queue_wait)
+    failed = True
+    try:
+        with metrics.bind(job_metrics), metrics.stage('job'):
+            _execute_job(job_id)
+        failed = False
+    finally:
+        _save_job_metrics(job_id, job_metrics, failed)
+
+def _execute_job(job_id: Union[int, str]):
+    _configure_probe_cache()
     job = read_job(job_id)
+    state = JobState(job)
     params = job.get('params') or {}
     is_test = params.get('is_test', False)
     use_yadisk = params.get('use_yadisk', False)
@@ -126,7 +894,7 @@ def _run_job(job_id: Union[int, str]):
         if not yadisk_client:
             job['status'] = 'error'
             job['message'] = 'Токен Яндекс Диска не настроен'
-            write_job(job)
+            state.save()
             return
         
         temp_base = Path(tempfile.gettempdir()) / f'job_{job_id}'
@@ -154,7 +922,7 @@ def _run_job(job_id: Union[int, str]):
         yadisk_output_path = job['output_folder']
         
         job['log_path'] = str(job_log_relpath(job_id, job['output_folder']))
-        write_job(job)
+        state.save()
         
         log_path = task_log_path
         
@@ -163,18 +931,20 @@ def _run_job(job_id: Union[int, str]):
         
         job['status'] = 'downloading'
         job['message'] = 'Загрузка видео с Яндекс Диска...'
-        write_job(job)
+        state.save()
         
-        downloaded_files = yadisk_client.download_folder_videos(yadisk_input_path, temp_input_folder)
+        remote_files = yadisk_client.get_video_files(yadisk_input_path)
         
-        if not downloaded_files:
+        if not remote_files:
             job['status'] = 'error'
             job['message'] = 'Не найдено видеофайлов на Яндекс Диске'
-            write_job(job)
+            state.save()
             return
+        if is_test:
+            remote_files = remote_files[:1]
         
         with open(log_path, 'a', encoding='utf-8') as logf:
-            logf.write(f"Скачано {len(downloaded_files)} видеофайлов\n")
+            logf.write(f"Найдено {len(remote_files)} видеофайлов, кодирование начинается по мере скачивания\n")
         
         input_folder = temp_input_folder
         if is_test:
@@ -182,7 +952,11 @@ def _run_job(job_id: Union[int, str]):
         else:
             output_folder = temp_videos_folder
         
-        video_files = downloaded_files
+        # Локальные пути известны заранее: задачи строятся сразу, файлы скачиваются параллельно с кодированием
+        remote_by_local = {
+            yadisk_client.local_path_for(vf, yadisk_input_path, temp_input_folder): vf for vf in remote_files
+        }
+        video_files = list(remote_by_local)
         
         temp_assets_folder = temp_base / 'assets'
         temp_assets_folder.mkdir(parents=True, exist_ok=True)
@@ -225,7 +999,7 @@ def _run_job(job_id: Union[int, str]):
         task_log_path = task_logs_folder / 'job.log'
         
         job['log_path'] = str(job_log_relpath(job_id, job['output_folder']))
-        write_job(job)
+        state.save()
         
         input_folder = Path(job['input_folder'])
         if is_test:
@@ -233,11 +1007,7 @@ def _run_job(job_id: Union[int, str]):
         else:
             output_folder = task_videos_folder
         
-        exts = ["*.mp4","*.MP4","*.mov","*.MOV","*.mkv","*.MKV","*.webm","*.WEBM"]
-        video_files_set = set()
-        for pattern in exts:
-            video_files_set.update(input_folder.rglob(pattern))
-        video_files: List[Path] = list(video_files_set)
+        video_files: List[Path] = _find_video_files(input_folder)
         
         if params.get('text_font_from_yadisk', False) or params.get('badge_from_yadisk', False):
             yadisk_client = get_yadisk_client()
@@ -273,14 +1043,27 @@ def _run_job(job_id: Union[int, str]):
         if not video_files:
             job['status'] = 'error'
             job['message'] = 'Не найдено видео для теста в папке.'
-            write_job(job)
+            state.save()
             return
         video_files = video_files[:1]
     copies_total = 1 if is_test else int(params.get('copies') or 1)
 
+    if use_yadisk:
+        unreadable = []  # скачанные файлы проверяются по мере прихода
+    else:
+        video_files, unreadable = _probe_sources(video_files, task_log_path)
+    job['unreadable_files'] = unreadable
+    if unreadable:
+        job['message'] = f"Пропущено нечитаемых файлов: {len(unreadable)}"
+    if not video_files:
+        job['status'] = 'error'
+        job['message'] = 'Нет читаемых видеофайлов' + (f" (нечитаемых: {len(unreadable)})" if unreadable else '')
+        state.save()
+        return
+
     job['src_files_total'] = len(video_files)
     job['src_files_done'] = 0
-    write_job(job)
+    state.save()
 
     tasks = []
     for f in video_files:
@@ -289,131 +1072,103 @@ def _run_job(job_id: Union[int, str]):
             out = output_folder / out_name
             tasks.append((f, out))
     total = len(tasks)
+    ledger = TaskLedger(job_id)
+    pending = [(f, out) for f, out in tasks if not ledger.verified(out)]
+    skipped = total - len(pending)
     job['total_tasks'] = total
-    job['done_tasks'] = 0
+    job['done_tasks'] = skipped
+    job['resumed_skipped'] = skipped
+    job['progress_overall'] = int(skipped * 100 / max(1, total))
     job['status'] = 'running'
-    write_job(job)
+    state.save()
     
     log_path = task_log_path
 
-    with open(log_path, 'a', encoding='utf-8') as logf:
-        for (inp, outp) in tasks:
-            if not inp.exists():
-                logf.write(f"INPUT NOT FOUND: {inp}\n")
-                job['message'] = f"Нет файла: {inp}"
-                job['done_tasks'] += 1
-                job['progress_overall'] = int(job['done_tasks'] * 100 / max(1, job['total_tasks']))
-                write_job(job)
-                continue
-
-            dur = probe_duration(inp)
-            jp = _build_params(job, inp, outp, params, temp_assets_folder=temp_assets_folder)
-            cmd = build_ffmpeg_command(jp, dur)
-            
-            cmd_str = ' '.join(cmd)
-            logf.write(f"FFMPEG CMD: {cmd_str}\n")
-            
-            filter_complex_idx = None
-            for i, arg in enumerate(cmd):
-                if arg == '-filter_complex' and i + 1 < len(cmd):
-                    filter_complex_idx = i + 1
-                    break
-            if filter_complex_idx is not None:
-                logf.write(f"FILTER_COMPLEX: {cmd[filter_complex_idx]}\n")
-            
-            if jp.text.enabled:
-                if jp.text.fontfile:
-                    if jp.text.fontfile.exists():
-                        logf.write(f"USING FONT: {jp.text.fontfile} (exists: {jp.text.fontfile.exists()})\n")
-                    else:
-                        logf.write(f"FONT MISSING OR NOT FOUND: {jp.text.fontfile}\n")
-                else:
-                    logf.write("FONT NOT SPECIFIED (using auto or default)\n")
-            if jp.badge.enabled:
-                if jp.badge.path:
-                    exists_check = jp.badge.path.exists()
-                    is_file_check = jp.badge.path.is_file() if exists_check else False
-                    logf.write(f"BADGE CHECK: path={jp.badge.path}, exists={exists_check}, is_file={is_file_check}\n")
-                    if not exists_check:
-                        logf.write(f"BADGE MISSING OR NOT FOUND: {jp.badge.path}\n")
-                    else:
-                        logf.write(f"USING BADGE: {jp.badge.path}\n")
-                else:
-                    logf.write("BADGE PATH IS NONE\n")
-
-            tried_nvenc_fallback = False
-            while True:
-                file_pct = 0
-                finished_ok = False
-                finished_err = False
-                for ev in run_ffmpeg_with_progress(cmd, dur):
-                    if ev.get('event') == 'progress':
-                        file_pct = ev.get('pct', 0)
-                    elif ev.get('event') == 'log':
-                        logf.write(ev.get('line','') + "\n")
-                    elif ev.get('event') == 'done':
-                        finished_ok = True
-                    elif ev.get('event') == 'error':
-                        finished_err = True
-                if finished_err and any(tok == 'h264_nvenc' for tok in cmd) and not tried_nvenc_fallback:
-                    logf.write("NVENC error -> fallback to libx264\n")
-                    cmd = _nvenc_to_x264(cmd)
-                    tried_nvenc_fallback = True
-                    continue
-                if not finished_ok and finished_err:
-                    logf.write("FFmpeg finished with error\n")
-                break
+    progress = _JobProgress(state, log_path, ledger)
+    progress.log([f"FFmpeg: {get_capabilities().summary()}"])
+    if skipped:
+        progress.log([f"Возобновление: готовых результатов {skipped} из {total}, осталось {len(pending)}"])
+    threads_per_encode = _threads_per_encode()
 
-            job['done_tasks'] += 1
-            job['progress_overall'] = int(job['done_tasks'] * 100 / max(1, job['total_tasks']))
-            write_job(job)
+    def single(inp: Path, outp: Path, info: Optional[ProbeInfo] = None) -> bool:
+        return _single_output(job, inp, outp, params, temp_assets_folder, info or probe_media(inp), threads_per_encode)
 
-    job['status'] = 'done' if not use_yadisk else 'uploading'
-    job['message'] = '' if not use_yadisk else 'Загрузка результатов на Яндекс Диск...'
-    write_job(job)
-    
-    if use_yadisk and yadisk_client and temp_output_folder:
-        log_path = task_log_path
-        yadisk_output_path = job['output_folder']
-        
-        original_output_path = yadisk_output_path
-        yadisk_output_path = yadisk_client._normalize_disk_path(yadisk_output_path)
-        
-        with open(log_path, 'a', encoding='utf-8') as logf:
-            logf.write(f"Исходный путь выходной папки: {original_output_path}\n")
-            logf.write(f"Нормализованный путь выходной папки: {yadisk_output_path}\n")
-        
+    # исходники с Яндекс Диска ещё не скачаны: для них решение принимает _units_as_downloaded
+    units = _group_tasks(pending, single=None if use_yadisk else single)
+    workers = min(_encode_workers(threads_per_encode), max(1, len(units)))
+    progress.log([f"Параллельных кодирований: {workers}, потоков на кодирование: {threads_per_encode}, процессов FFmpeg: {len(units)}"])
+
+    pipeline = None
+    run_unit = _run_unit
+    if use_yadisk:
+        original_output_path = job['output_folder']
+        yadisk_output_path = yadisk_client._normalize_disk_path(original_output_path)
         yadisk_task_path = f"{yadisk_output_path.rstrip('/')}/{job_id}"
         if is_test:
             yadisk_videos_path = f"{yadisk_task_path}/tests"
         else:
             yadisk_videos_path = f"{yadisk_task_path}/videos"
-        
-        temp_task_output = temp_output_folder / str(job_id)
-        if is_test:
-            temp_videos_src = temp_task_output / 'tests'
-        else:
-            temp_videos_src = temp_task_output / 'videos'
-        
-        with open(log_path, 'a', encoding='utf-8') as logf:
-            logf.write(f"Базовый путь выходной папки: {yadisk_output_path}\n")
-            logf.write(f"Путь к задаче: {yadisk_task_path}\n")
-            logf.write(f"Загрузка обработанных файлов на Яндекс Диск: {yadisk_videos_path}\n")
-            logf.write(f"Локальная папка источник: {temp_videos_src}\n")
-        
-        uploaded_count = 0
-        if temp_videos_src.exists():
-            uploaded_count = yadisk_client.upload_folder(
-                temp_videos_src, 
-                yadisk_videos_path, 
-                overwrite=True,
-                base_path=yadisk_output_path
-            )
+        prefetch = int(getattr(settings, 'YADISK_PREFETCH_FILES', 0) or 0) or workers + yadisk_client.download_workers
+        progress.log([
+            f"Исходный путь выходной папки: {original_output_path}",
+            f"Нормализованный путь выходной папки: {yadisk_output_path}",
+            f"Путь к задаче: {yadisk_task_path}",
+            f"Загрузка обработанных файлов на Яндекс Диск по мере готовности: {yadisk_videos_path}",
+            f"Исходников во временной папке одновременно: не больше {prefetch}",
+        ])
+        slots = threading.Semaphore(prefetch)
+        pipeline = _UploadPipeline(
+            yadisk_client, progress, output_folder, yadisk_videos_path, yadisk_output_path, units, slots,
+            int(getattr(settings, 'YADISK_UPLOAD_QUEUE', 8) or 1),
+        )
+        run_unit = pipeline.run_unit
+        needed = {inp for inp, _ in units}
+        arrivals = _remote_sources(
+            yadisk_client, {local: vf for local, vf in remote_by_local.items() if local in needed},
+            yadisk_input_path, temp_input_folder, slots, pipeline.urls, pipeline.streamed,
+            stream=bool(getattr(settings, 'YADISK_STREAM_INPUT', False)),
+        )
+        units = _units_as_downloaded(pipeline.track(arrivals), units, progress,
+                                     on_drop=pipeline.release_source, urls=pipeline.urls, single=single)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'job-{job_id}') as pool:
+            futures = [
+                pool.submit(metrics.propagate(run_unit), progress, inp, outs, params, temp_assets_folder, threads_per_encode)
+                for (inp, outs) in units
+            ]
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    progress.log([f"TASK FAILED: {e}"])
+    finally:
+        if pipeline is not None:
+            job['status'] = 'uploading'
+            job['message'] = 'Загрузка результатов на Яндекс Диск...'
+            state.save()
+            pipeline.finish()
+
+    if use_yadisk and job['unreadable_files'] and not job['total_tasks']:
+        job['status'] = 'error'
+        job['message'] = f"Нет читаемых видеофайлов (нечитаемых: {len(job['unreadable_files'])})"
+        state.save()
+        return
+
+    job['failed_tasks'] = ledger.summary().get('failed', 0)
+    state.save()
+    
+    if pipeline is not None:
+        log_path = task_log_path
+        uploaded_count = pipeline.uploaded
         
         yadisk_logs_path = f"{yadisk_task_path}/logs"
         if log_path.exists():
             yadisk_log_file_path = f"{yadisk_logs_path}/job.log"
             with open(log_path, 'a', encoding='utf-8') as logf:
+                speed = job.get('upload_bytes_per_sec')
+                logf.write(f"Загружено {pipeline.uploaded} видео, ошибок загрузки: {pipeline.failed}"
+                           + (f", скорость {speed / 1e6:.1f} МБ/с" if speed else '') + "\n")
                 logf.write(f"Загрузка логов на Яндекс Диск: {yadisk_log_file_path}\n")
             
             if yadisk_client.upload_file(log_path, yadisk_log_file_path, overwrite=True, base_path=yadisk_output_path):
@@ -421,6 +1176,12 @@ def _run_job(job_id: Union[int, str]):
         
         with open(log_path, 'a', encoding='utf-8') as logf:
             logf.write(f"Загружено {uploaded_count} файлов на Яндекс Диск\n")
+        
+        if pipeline.failed:
+            # незагруженные выходы остаются: возобновление задачи дозагрузит их без перекодирования
+            shutil.rmtree(temp_input_folder, ignore_errors=True)
+        else:
+            shutil.rmtree(temp_base, ignore_errors=True)
     
     if not use_yadisk and temp_base and temp_base.exists():
         log_path = task_log_path
@@ -434,6 +1195,6 @@ def _run_job(job_id: Union[int, str]):
     
     job['status'] = 'done'
     job['message'] = ''
-    write_job(job)
+    state.save()
 
 
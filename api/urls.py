@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import index, job_detail, JobViewSet, count_videos, yadisk_check, yadisk_list, yadisk_count_videos, download_log
+from .views import index, job_detail, job_events, job_resume, metrics_export, JobViewSet, count_videos, yadisk_check, yadisk_list, yadisk_count_videos, download_log
 
 router = DefaultRouter()
 router.register('api/jobs', JobViewSet, basename='job')
@@ -9,6 +9,9 @@ urlpatterns = [
     path('', index, name='index'),
     path('jobs/<str:pk>/', job_detail, name='job_detail'),
     path('jobs/<str:pk>/log', download_log, name='download_log'),
+    path('jobs/<str:pk>/resume', job_resume, name='job_resume'),
+    path('jobs/<str:pk>/events', job_events, name='job_events'),
+    path('metrics', metrics_export, name='metrics'),
     path('api/count_videos', count_videos, name='count_videos'),
     path('api/yadisk/check', yadisk_check, name='yadisk_check'),
     path('api/yadisk/list', yadisk_list, name='yadisk_list'),
@@ -2,17 +2,23 @@ from django.shortcuts import render, redirect
 from django.views.decorators.http import require_http_methods
 from rest_framework import viewsets
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
 from .serializers import JobSerializer
 from .forms import JobForm
-from .tasks import start_job_thread
-from .store import create_job, list_jobs, read_job, job_log_relpath
-from django.http import JsonResponse, FileResponse, Http404
+from .tasks import resume_job, submit_job
+from .store import count_jobs, create_job, list_jobs, read_job, job_log_relpath
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from pathlib import Path
 from django.conf import settings
 from .yadisk_client import get_yadisk_client
 import json
 import os
+import queue
+import sqlite3
+from video_core import metrics
+from . import job_queue, live
+from .job_state import TERMINAL_STATUSES
+from .ledger import TaskLedger
 
 @require_http_methods(["GET", "POST"])
 def index(request):
@@ -72,7 +78,7 @@ def index(request):
                 job_name = data.get('job_name', '') or 'run'
                 job_payload['job_name'] = f"test_{job_name}"
             new_job = create_job(job_payload)
-            start_job_thread(new_job['id'])
+            submit_job(new_job['id'])
             return redirect('job_detail', pk=new_job['id'])
     else:
         form = JobForm()
@@ -84,6 +90,42 @@ def job_detail(request, pk):
     job = read_job(pk)
     return render(request, 'job_detail.html', { 'job': job })
 
+def job_events(request, pk):
+    """
+    Поток Server-Sent Events с прогрессом задачи: общий, по текущим кодированиям (процент, fps,
+    скорость, ETA). Закрывается после завершения задачи.
+    """
+    try:
+        read_job(pk)
+    except FileNotFoundError:
+        raise Http404("Задача не найдена")
+
+    def stream():
+        q = live.subscribe(pk)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    payload = q.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                if payload.get('status') in TERMINAL_STATUSES:
+                    break
+        finally:
+            live.unsubscribe(pk, q)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@require_http_methods(["POST"])
+def job_resume(request, pk):
+    resume_job(pk)
+    return redirect('job_detail', pk=pk)
+
 def count_videos(request):
     base = request.GET.get('input') or ''
     try:
@@ -98,15 +140,45 @@ def count_videos(request):
     except Exception:
         return JsonResponse({"count": 0})
 
+def metrics_export(request):
+    """
+    Метрики в текстовом формате Prometheus: счётчики этого процесса и снимки воркеров
+    (METRICS_DIR) складываются, размер очереди считается в момент запроса.
+    """
+    snapshots = [metrics.snapshot()]
+    metrics_dir = getattr(settings, 'METRICS_DIR', '')
+    if metrics_dir:
+        snapshots += metrics.read_snapshots(Path(metrics_dir), exclude_pid=os.getpid())
+    gauges = {}
+    try:
+        gauges['queue_jobs'] = job_queue.queue_stats()
+    except sqlite3.Error:
+        pass
+    return HttpResponse(metrics.render_prometheus(snapshots, gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class JobViewSet(viewsets.ViewSet):
     def list(self, request):
-        jobs = list_jobs(50)
-        return Response(jobs)
+        status = request.query_params.get('status') or None
+        try:
+            limit = max(1, min(200, int(request.query_params.get('limit', 50))))
+            offset = max(0, int(request.query_params.get('offset', 0)))
+        except ValueError:
+            return Response({"error": "limit и offset должны быть числами"}, status=400)
+        jobs = list_jobs(limit, offset=offset, status=status)
+        return Response(jobs, headers={'X-Total-Count': str(count_jobs(status))})
 
     def retrieve(self, request, pk=None):
         job = read_job(pk)
+        # по выходам — из журнала задачи: в job.json хранятся только средние
+        job['task_throughput'] = TaskLedger(pk).throughput()
         return Response(job)
 
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        if not resume_job(pk):
+            return Response({"error": "Задача ещё выполняется"}, status=409)
+        return Response(read_job(pk))
+
 @api_view(['GET'])
 def yadisk_check(request):
     """Проверка подключения к Яндекс Диску"""
@@ -140,7 +212,7 @@ def yadisk_list(request):
     file_type = request.GET.get('type', 'all')  # 'all', 'files', 'dirs'
     
     try:
-        items = client.list_files(path)
+        items = client.list_files(path, refresh=request.GET.get('refresh') in ('1', 'true'))
         
         # Фильтруем по типу, если указан
         if file_type == 'files':
@@ -160,8 +232,9 @@ def yadisk_count_videos(request):
         return JsonResponse({"count": 0, "error": "Токен Яндекс Диска не настроен"})
     
     path = request.GET.get('path', '/')
+    refresh = request.GET.get('refresh') in ('1', 'true')
     try:
-        count = client.count_videos(path)
+        count = client.count_videos(path, refresh=refresh)
         return JsonResponse({"count": count})
     except Exception as e:
         return JsonResponse({"count": 0, "error": str(e)})
@@ -0,0 +1,128 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+from django.conf import settings
+from video_core import metrics
+from . import job_queue
+from .store import read_job, write_job
+from .tasks import _run_job, warm_up
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorker:
+    """
+    Отдельный процесс-исполнитель задач из очереди SQLite.
+    Держит не более concurrency задач одновременно и не превышает суммарный бюджет стоимости.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, cost_budget: Optional[float] = None,
+                 poll_interval: float = 1.0):
+        self.concurrency = max(1, int(concurrency or getattr(settings, 'JOB_WORKER_CONCURRENCY', 2)))
+        if cost_budget is None:
+            cost_budget = getattr(settings, 'JOB_WORKER_COST_BUDGET', 0)
+        self.cost_budget = float(cost_budget or 0)
+        self.poll_interval = poll_interval
+        self.stale_after = float(getattr(settings, 'JOB_WORKER_STALE_SEC', 60))
+        self.max_attempts = int(getattr(settings, 'JOB_MAX_ATTEMPTS', 3) or 0)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        metrics_dir = getattr(settings, 'METRICS_DIR', '')
+        self.metrics_path = Path(metrics_dir) / f"worker-{os.getpid()}.json" if metrics_dir else None
+        self.metrics_interval = float(getattr(settings, 'METRICS_SNAPSHOT_SEC', 15) or 15)
+        self._running: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _write_metrics(self) -> None:
+        """Снимок счётчиков процесса для /metrics веб-процесса."""
+        if self.metrics_path is None:
+            return
+        try:
+            metrics.write_snapshot(self.metrics_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить метрики воркера: {e}")
+
+    def _running_cost(self) -> float:
+        with self._lock:
+            return sum(item['cost'] for item in self._running.values())
+
+    @staticmethod
+    def _mark_error(job_id: str, message: str) -> None:
+        try:
+            job = read_job(job_id)
+            job['status'] = 'error'
+            job['message'] = message
+            write_job(job)
+        except Exception:
+            pass
+
+    def _requeue_stale(self) -> List[str]:
+        requeued, failed = job_queue.requeue_stale(self.stale_after, self.max_attempts)
+        for job_id in failed:
+            logger.error(f"Задача {job_id} не возвращена в очередь: исчерпаны попытки ({self.max_attempts})")
+            self._mark_error(job_id, f"Воркер аварийно завершался на этой задаче (попыток: {self.max_attempts}), задача остановлена")
+        return requeued
+
+    def _execute(self, item: Dict) -> None:
+        job_id = item['job_id']
+        try:
+            _run_job(job_id, queue_wait=item.get('queue_wait'))
+        except Exception as e:
+            logger.exception(f"Задача {job_id} завершилась с ошибкой")
+            self._mark_error(job_id, f"Ошибка выполнения: {e}")
+        finally:
+            job_queue.finish(job_id)
+            with self._lock:
+                self._running.pop(job_id, None)
+            self._write_metrics()
+
+    def _fill_slots(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._running) >= self.concurrency:
+                    return
+            item = job_queue.claim_next(self.worker_id, self._running_cost(), self.cost_budget)
+            if not item:
+                return
+            logger.info(f"Запуск задачи {item['job_id']} (стоимость {item['cost']:.0f}, ожидание {item['queue_wait']:.1f} с)")
+            with self._lock:
+                self._running[item['job_id']] = item
+            t = threading.Thread(target=self._execute, args=(item,), name=f"job-{item['job_id']}", daemon=True)
+            t.start()
+
+    def run_forever(self) -> None:
+        try:
+            logger.info(f"FFmpeg: {warm_up()}")
+        except Exception:
+            logger.exception("Не удалось опросить возможности FFmpeg")
+        requeued = self._requeue_stale()
+        if requeued:
+            logger.info(f"Возвращены в очередь незавершённые задачи: {', '.join(requeued)}")
+        last_beat = 0.0
+        last_metrics = 0.0
+        while not self._stop.is_set():
+            now = time.time()
+            if now - last_beat >= self.stale_after / 4:
+                job_queue.heartbeat(self.worker_id)
+                self._requeue_stale()
+                last_beat = now
+            if now - last_metrics >= self.metrics_interval:
+                self._write_metrics()
+                last_metrics = now
+            self._fill_slots()
+            self._stop.wait(self.poll_interval)
+        while True:
+            with self._lock:
+                if not self._running:
+                    break
+            job_queue.heartbeat(self.worker_id)
+            time.sleep(self.poll_interval)
+        self._write_metrics()
@@ -0,0 +1,67 @@
+import json
+import time
+from typing import Dict, List, Optional
+from .db import ensure_schema, get_connection
+
+# Записи, не использовавшиеся неделю, удаляются при следующей записи
+_KEEP_SEC = 7 * 24 * 3600
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS yadisk_listing (
+        account TEXT NOT NULL,
+        path TEXT NOT NULL,
+        modified TEXT,
+        items TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        listed_at REAL NOT NULL,
+        PRIMARY KEY (account, path)
+    )""",
+]
+
+def _ensure():
+    ensure_schema('yadisk_cache', _SCHEMA)
+
+def get(account: str, path: str) -> Optional[Dict]:
+    """
+    Закэшированное содержимое папки: {'items', 'modified', 'fetched_at', 'listed_at'} или None.
+    fetched_at — последняя сверка с API (листинг или совпавший modified), listed_at — последний листинг.
+    """
+    _ensure()
+    row = get_connection().execute(
+        "SELECT modified, items, fetched_at, listed_at FROM yadisk_listing WHERE account = ? AND path = ?",
+        (account, path),
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        items = json.loads(row['items'])
+    except ValueError:
+        return None
+    return {'items': items, 'modified': row['modified'], 'fetched_at': row['fetched_at'], 'listed_at': row['listed_at']}
+
+def put(account: str, path: str, modified: Optional[str], items: List[Dict]) -> None:
+    _ensure()
+    now = time.time()
+    conn = get_connection()
+    conn.execute(
+        """INSERT INTO yadisk_listing (account, path, modified, items, fetched_at, listed_at)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT(account, path) DO UPDATE SET
+               modified = excluded.modified, items = excluded.items,
+               fetched_at = excluded.fetched_at, listed_at = excluded.listed_at""",
+        (account, path, modified, json.dumps(items, ensure_ascii=False), now, now),
+    )
+    conn.execute("DELETE FROM yadisk_listing WHERE fetched_at < ?", (now - _KEEP_SEC,))
+
+def touch(account: str, path: str) -> None:
+    """Папка не изменилась (совпал modified) — запись снова свежая."""
+    _ensure()
+    get_connection().execute(
+        "UPDATE yadisk_listing SET fetched_at = ? WHERE account = ? AND path = ?",
+        (time.time(), account, path),
+    )
+
+def invalidate(account: str, path: str) -> None:
+    """Содержимое папки изменил сам сервис (загрузка, создание папки)."""
+    _ensure()
+    get_connection().execute("DELETE FROM yadisk_listing WHERE account = ? AND path = ?", (account, path))
@@ -1,29 +1,155 @@
+import hashlib
 import os
+import random
+import sqlite3
 import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+import requests
 from yadisk import YaDisk
 import logging
+from video_core import metrics
+from video_core.remote import can_stream
+from . import yadisk_cache
 
 try:
     from yadisk.exceptions import YaDiskException
 except ImportError:
     YaDiskException = Exception
 
+try:
+    from yadisk import exceptions as _yadisk_exceptions
+except ImportError:
+    _yadisk_exceptions = None
+
 logger = logging.getLogger(__name__)
 
 
+def _exception_types(*names: str) -> tuple:
+    """Классы исключений yadisk, которые есть в установленной версии."""
+    found = (getattr(_yadisk_exceptions, name, None) for name in names)
+    return tuple(cls for cls in found if isinstance(cls, type))
+
+
+# Только временные ошибки: 429, 500/502/503/504 и сеть. Остальные (401, 403, 404, 409, сбой
+# асинхронной операции...) повтором не исправить — сразу ошибка
+_RETRIABLE = _exception_types(
+    'TooManyRequestsError', 'InternalServerError', 'BadGatewayError', 'UnavailableError',
+    'GatewayTimeoutError', 'YaDiskConnectionError', 'RequestTimeoutError',
+) + (requests.ConnectionError, requests.Timeout)
+_DIR_EXISTS = _exception_types('DirectoryExistsError', 'PathExistsError')
+_BACKOFF_BASE = 1.0
+_BACKOFF_MAX = 30.0
+
+_CHUNK = 1024 * 1024
+_RANGE_ATTEMPTS = 3
+_HTTP_TIMEOUT = (10, 60)
+
+
+class RangeNotSupported(Exception):
+    """Сервер отдал файл целиком (200) в ответ на запрос диапазона."""
+
+
+_http_local = threading.local()
+
+
+def _http_session() -> requests.Session:
+    """Сессия requests своя у каждого потока: keep-alive без разделения состояния между потоками."""
+    session = getattr(_http_local, 'session', None)
+    if session is None:
+        session = _http_local.session = requests.Session()
+    return session
+
+
+def _fetch_range(url: str, local_path: Path, start: int, end: int) -> int:
+    """
+    Скачать байты [start, end] в файл по тому же смещению. Обрыв соединения — повтор с места остановки.
+    Возвращает число записанных байт.
+    """
+    pos = start
+    for attempt in range(_RANGE_ATTEMPTS):
+        try:
+            headers = {'Range': f'bytes={pos}-{end}'}
+            with _http_session().get(url, headers=headers, stream=True, timeout=_HTTP_TIMEOUT) as r:
+                if r.status_code == 200:
+                    raise RangeNotSupported(url)
+                r.raise_for_status()
+                with open(local_path, 'r+b') as f:
+                    f.seek(pos)
+                    for chunk in r.iter_content(_CHUNK):
+                        f.write(chunk)
+                        pos += len(chunk)
+            if pos > end:
+                return pos - start
+        except requests.RequestException as e:
+            if attempt == _RANGE_ATTEMPTS - 1:
+                raise
+            logger.debug(f"Повтор диапазона {pos}-{end}: {e}")
+    raise IOError(f"Диапазон {start}-{end} скачан не полностью: {pos - start} байт")
+
+
+def download_url(url: str, local_path: Path, size: int, connections: int = 4) -> None:
+    """
+    Скачать файл размером size по прямой ссылке в connections параллельных HTTP-запросов с Range.
+    Если сервер не поддерживает диапазоны — одним потоком.
+    """
+    local_path = Path(local_path)
+    connections = max(1, min(connections, -(-size // _CHUNK)))
+    if size <= 0:
+        local_path.write_bytes(b'')
+        return
+    with open(local_path, 'wb') as f:
+        f.truncate(size)
+    part = -(-size // connections)
+    ranges = [(start, min(size, start + part) - 1) for start in range(0, size, part)]
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix='yadisk-range') as pool:
+            list(pool.map(lambda r: _fetch_range(url, local_path, *r), ranges))
+    except RangeNotSupported:
+        with _http_session().get(url, stream=True, timeout=_HTTP_TIMEOUT) as r:
+            r.raise_for_status()
+            with open(local_path, 'wb') as f:
+                for chunk in r.iter_content(_CHUNK):
+                    f.write(chunk)
+
+
 class YandexDiskClient:
     """Клиент для работы с Яндекс Диском"""
     
-    def __init__(self, token: str):
+    def __init__(self, token: str, download_workers: int = 4, download_connections: int = 4,
+                 range_min_bytes: int = 16 * 1024 * 1024, list_ttl: float = 60, list_workers: int = 8,
+                 list_max_age: float = 900, upload_workers: int = 4, retries: int = 4):
         """
         Инициализация клиента Яндекс Диска
         
         Args:
             token: OAuth токен Яндекс Диска
+            download_workers: Сколько файлов скачивается одновременно
+            download_connections: Сколько HTTP-соединений (диапазонов Range) на один большой файл
+            range_min_bytes: Файлы от этого размера скачиваются по диапазонам
+            list_ttl: Сколько секунд листинг папки из кэша используется без сверки с API
+            list_workers: Сколько папок листится одновременно при рекурсивном обходе
+            list_max_age: Листинг старше этого (секунд) перечитывается, даже если modified папки не изменился
+            upload_workers: Сколько файлов загружается одновременно
+            retries: Повторов запроса при 429, 5xx и сетевых ошибках
         """
         self.disk = YaDisk(token=token)
+        self.download_workers = max(1, download_workers)
+        self.download_connections = max(1, download_connections)
+        self.range_min_bytes = range_min_bytes
+        self.list_ttl = max(0.0, float(list_ttl))
+        self.list_workers = max(1, list_workers)
+        self.list_max_age = max(self.list_ttl, float(list_max_age))
+        # Кэш листингов общий для процессов: записи разных аккаунтов разделяются по хэшу токена
+        self._account = hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+        self.upload_workers = max(1, upload_workers)
+        self.retries = max(0, retries)
+        # Папки, которые уже есть на диске: mkdir для каждой — не больше одного раза за жизнь клиента
+        self._known_dirs = set()
+        self._dirs_lock = threading.Lock()
         self.temp_dir = Path(tempfile.gettempdir()) / 'yadisk_videos'
         self.temp_dir.mkdir(parents=True, exist_ok=True)
     
@@ -52,89 +178,152 @@ class YandexDiskClient:
             else:
                 return False, f"Ошибка подключения: {error_msg}"
     
-    def list_files(self, path: str = '/', limit: int = 1000) -> List[Dict]:
+    def _item_dict(self, item) -> Dict:
+        return {
+            'name': item.name,
+            'path': item.path,
+            'type': 'dir' if item.type == 'dir' else 'file',
+            'size': getattr(item, 'size', 0),
+            'modified': str(item.modified) if getattr(item, 'modified', None) is not None else None,
+        }
+    
+    def _list_dir(self, path: str, modified: Optional[str] = None, refresh: bool = False) -> Tuple[List[Dict], bool]:
+        """
+        Содержимое папки через общий кэш листингов (SQLite, общий для веб-процесса и воркеров).
+        Моложе list_ttl — без запросов к API; старше — сверка modified папки (известного из свежего
+        листинга родителя или одним запросом get_meta) и повторный листинг, только если папка изменилась.
+        Каждая папка сверяется по своему modified, но Яндекс Диск не обещает менять его при любом
+        изменении содержимого, поэтому листинг старше list_max_age перечитывается без сверки.
+        
+        Args:
+            path: Путь к папке на Яндекс Диске
+            modified: modified папки из только что полученного листинга родителя
+            refresh: Не использовать кэш
+            
+        Returns:
+            tuple (элементы папки, листинг получен из API только что)
+        """
+        key = self._path_for_api(path)
+        entry = None if refresh else yadisk_cache.get(self._account, key)
+        if entry is not None:
+            now = time.time()
+            if now - entry['fetched_at'] < self.list_ttl:
+                metrics.inc('yadisk_list_cache_total', result='hit')
+                return entry['items'], False
+            if now - entry['listed_at'] < self.list_max_age:
+                if modified is None:
+                    modified = self._folder_modified(key)
+                if modified is not None and modified == entry['modified']:
+                    yadisk_cache.touch(self._account, key)
+                    metrics.inc('yadisk_list_cache_total', result='revalidated')
+                    return entry['items'], False
+        if modified is None:
+            # modified запрашивается до листинга: изменение между запросами заметит следующая сверка
+            modified = self._folder_modified(key)
+        metrics.inc('yadisk_list_cache_total', result='miss')
+        items = [self._item_dict(item) for item in self.disk.listdir(key)]
+        yadisk_cache.put(self._account, key, modified, items)
+        return items, True
+    
+    def _folder_modified(self, key: str) -> Optional[str]:
+        meta = self.disk.get_meta(key, limit=0)
+        return str(meta.modified) if getattr(meta, 'modified', None) is not None else None
+    
+    def invalidate_listing(self, disk_path: str) -> None:
+        """Сбросить кэш листинга папки после изменений, сделанных этим сервисом."""
+        try:
+            yadisk_cache.invalidate(self._account, self._path_for_api(disk_path))
+        except sqlite3.Error as e:
+            logger.debug(f"Не удалось сбросить кэш листинга {disk_path}: {e}")
+    
+    def list_files(self, path: str = '/', limit: int = 1000, refresh: bool = False) -> List[Dict]:
         """
         Получить список файлов и папок на Яндекс Диске
         
         Args:
             path: Путь на Яндекс Диске (по умолчанию корень)
             limit: Максимальное количество элементов
+            refresh: Не использовать кэш листингов
             
         Returns:
             Список словарей с информацией о файлах/папках
         """
         try:
-            items = []
-            for item in self.disk.listdir(path, limit=limit):
-                items.append({
-                    'name': item.name,
-                    'path': item.path,
-                    'type': 'dir' if item.type == 'dir' else 'file',
-                    'size': getattr(item, 'size', 0),
-                    'modified': str(item.modified) if hasattr(item, 'modified') else None,
-                })
-            return items
+            with metrics.stage('yadisk_list'):
+                items, _ = self._list_dir(path, refresh=refresh)
+            return items[:limit]
         except YaDiskException as e:
             logger.error(f"Ошибка получения списка файлов: {e}")
             return []
     
-    def get_video_files(self, path: str = '/') -> List[Dict]:
+    def get_video_files(self, path: str = '/', refresh: bool = False) -> List[Dict]:
         """
-        Получить список только видеофайлов из указанной папки (рекурсивно)
+        Получить список только видеофайлов из указанной папки (рекурсивно).
+        Соседние подпапки обходятся параллельно (до list_workers запросов одновременно),
+        листинги берутся из общего кэша.
         
         Args:
             path: Путь к папке на Яндекс Диске
+            refresh: Не использовать кэш листингов
             
         Returns:
-            Список словарей с информацией о видеофайлах
+            Список словарей с информацией о видеофайлах (по пути)
         """
         video_extensions = {'.mp4', '.MP4', '.mov', '.MOV', '.mkv', '.MKV', '.webm', '.WEBM'}
         video_files = []
         
         try:
-            def _scan_folder(folder_path: str):
-                try:
-                    for item in self.disk.listdir(folder_path):
-                        if item.type == 'dir':
-                            _scan_folder(item.path)
-                        elif item.type == 'file':
-                            file_name = item.name
-                            file_ext = Path(file_name).suffix
-                            if file_ext in video_extensions:
+            with metrics.stage('yadisk_list'), \
+                    ThreadPoolExecutor(max_workers=self.list_workers, thread_name_prefix='yadisk-ls') as pool:
+                pending = {pool.submit(self._list_dir, path, None, refresh): path}
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        folder_path = pending.pop(fut)
+                        try:
+                            items, fresh = fut.result()
+                        except YaDiskException as e:
+                            logger.error(f"Ошибка при сканировании папки {folder_path}: {e}")
+                            continue
+                        for item in items:
+                            if item['type'] == 'dir':
+                                # modified подпапки из свежего листинга родителя избавляет от сверки через get_meta
+                                child = pool.submit(self._list_dir, item['path'], item['modified'] if fresh else None, refresh)
+                                pending[child] = item['path']
+                            elif Path(item['name']).suffix in video_extensions:
                                 video_files.append({
-                                    'name': file_name,
-                                    'path': item.path,
-                                    'size': getattr(item, 'size', 0),
-                                    'modified': str(item.modified) if hasattr(item, 'modified') else None,
+                                    'name': item['name'],
+                                    'path': item['path'],
+                                    'size': item['size'],
+                                    'modified': item['modified'],
                                 })
-                except YaDiskException as e:
-                    logger.error(f"Ошибка при сканировании папки {folder_path}: {e}")
-            
-            _scan_folder(path)
+            video_files.sort(key=lambda f: f['path'])
             return video_files
         except Exception as e:
             logger.error(f"Ошибка получения видеофайлов: {e}")
             return []
     
-    def count_videos(self, path: str = '/') -> int:
+    def count_videos(self, path: str = '/', refresh: bool = False) -> int:
         """
         Подсчитать количество видеофайлов в папке
         
         Args:
             path: Путь к папке на Яндекс Диске
+            refresh: Не использовать кэш листингов
             
         Returns:
             Количество видеофайлов
         """
-        return len(self.get_video_files(path))
+        return len(self.get_video_files(path, refresh=refresh))
     
-    def download_file(self, disk_path: str, local_path: Optional[Path] = None) -> Optional[Path]:
+    def download_file(self, disk_path: str, local_path: Optional[Path] = None, size: Optional[int] = None) -> Optional[Path]:
         """
         Скачать файл с Яндекс Диска
         
         Args:
             disk_path: Путь к файлу на Яндекс Диске
             local_path: Локальный путь для сохранения (если None - используется временная папка)
+            size: Размер файла из листинга; большие файлы скачиваются параллельными диапазонами
             
         Returns:
             Path к скачанному файлу или None в случае ошибки
@@ -146,14 +335,86 @@ class YandexDiskClient:
             
             local_path.parent.mkdir(parents=True, exist_ok=True)
             
-            # Скачиваем файл
-            self.disk.download(disk_path, str(local_path))
+            with metrics.stage('download'):
+                if size and size >= self.range_min_bytes and self.download_connections > 1:
+                    url = self.disk.get_download_link(disk_path)
+                    download_url(url, local_path, size, self.download_connections)
+                else:
+                    self.disk.download(disk_path, str(local_path))
+            metrics.add_bytes('download', local_path.stat().st_size)
             
             return local_path
-        except YaDiskException as e:
+        except (YaDiskException, requests.RequestException, OSError) as e:
             logger.error(f"Ошибка скачивания файла {disk_path}: {e}")
             return None
     
+    def local_path_for(self, video_file: Dict, disk_folder_path: str, local_folder: Path) -> Path:
+        """Локальный путь файла из листинга: структура подпапок относительно disk_folder_path сохраняется."""
+        file_path = self._path_for_api(video_file['path'])
+        folder_path = self._path_for_api(disk_folder_path).rstrip('/')
+        if folder_path and file_path.startswith(folder_path + '/'):
+            file_path = file_path[len(folder_path):]
+        return local_folder / file_path.lstrip('/')
+    
+    def download_link(self, video_file: Dict) -> Optional[str]:
+        """Прямая ссылка на файл из листинга. Ссылка временная: её берут непосредственно перед чтением."""
+        try:
+            return self.disk.get_download_link(video_file['path'])
+        except YaDiskException as e:
+            logger.warning(f"Не удалось получить ссылку на {video_file['path']}: {e}")
+            return None
+    
+    def stream_url(self, video_file: Dict) -> Optional[str]:
+        """
+        Прямая ссылка на файл из листинга, если его можно кодировать по сети без скачивания
+        (MP4/MOV с moov в начале файла). None — файл нужно скачать.
+        """
+        url = self.download_link(video_file)
+        return url if url and can_stream(video_file['name'], url) else None
+    
+    def download_videos(self, video_files: List[Dict], disk_folder_path: str, local_folder: Path,
+                        slots: Optional[threading.Semaphore] = None) -> Iterator[Path]:
+        """
+        Параллельно скачать файлы из листинга get_video_files (до download_workers одновременно)
+        
+        Args:
+            video_files: Файлы из get_video_files
+            disk_folder_path: Путь к папке на Яндекс Диске, относительно которого строятся локальные пути
+            local_folder: Локальная папка для сохранения файлов
+            slots: Места во временной папке: каждое скачивание занимает место и ждёт, пока оно освободится.
+                Место файла, скачанного с ошибкой, освобождается здесь; скачанного — освобождает вызывающий
+            
+        Yields:
+            Пути к скачанным файлам по мере готовности (файлы с ошибкой пропускаются)
+        """
+        local_folder.mkdir(parents=True, exist_ok=True)
+        if not video_files:
+            return
+        workers = min(self.download_workers, len(video_files))
+        stop = threading.Event()
+        
+        def _download(vf: Dict) -> Optional[Path]:
+            if slots is not None:
+                while not slots.acquire(timeout=1.0):
+                    if stop.is_set():
+                        return None
+            path = self.download_file(vf['path'], self.local_path_for(vf, disk_folder_path, local_folder), vf.get('size'))
+            if path is None and slots is not None:
+                slots.release()
+            return path
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='yadisk-dl') as pool:
+            futures = [pool.submit(metrics.propagate(_download), vf) for vf in video_files]
+            try:
+                for fut in as_completed(futures):
+                    path = fut.result()
+                    if path:
+                        yield path
+            finally:
+                stop.set()
+                for fut in futures:
+                    fut.cancel()
+    
     def download_folder_videos(self, disk_folder_path: str, local_folder: Path) -> List[Path]:
         """
         Скачать все видеофайлы из папки на Яндекс Диске
@@ -165,21 +426,8 @@ class YandexDiskClient:
         Returns:
             Список путей к скачанным файлам
         """
-        local_folder.mkdir(parents=True, exist_ok=True)
         video_files = self.get_video_files(disk_folder_path)
-        downloaded_files = []
-        
-        for video_file in video_files:
-            disk_path = video_file['path']
-            relative_path = disk_path.replace(disk_folder_path, '').lstrip('/')
-            local_path = local_folder / relative_path
-            local_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            downloaded_path = self.download_file(disk_path, local_path)
-            if downloaded_path:
-                downloaded_files.append(downloaded_path)
-        
-        return downloaded_files
+        return list(self.download_videos(video_files, disk_folder_path, local_folder))
     
     def _normalize_disk_path(self, disk_path: str, for_api: bool = False) -> str:
         """
@@ -231,6 +479,53 @@ class YandexDiskClient:
         """
         return self._normalize_disk_path(disk_path, for_api=True)
     
+    def _retrying(self, call: Callable, op: str):
+        """
+        Запрос к API с повтором при 429, 5xx и сетевых ошибках:
+        экспоненциальная пауза (1, 2, 4... с, не больше 30) со случайным разбросом.
+        Собственные повторы yadisk в call должны быть выключены (n_retries=0), иначе они
+        умножаются на наши, а 429 yadisk повторяет без паузы.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return call()
+            except _RETRIABLE as e:
+                if attempt >= self.retries:
+                    raise
+                delay = min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                metrics.inc('yadisk_retries_total', op=op)
+                logger.warning(f"Яндекс Диск ({op}): {type(e).__name__} {e}; повтор через {delay:.1f} с")
+                time.sleep(delay)
+    
+    def _ensure_dir(self, api_path: str) -> None:
+        """
+        Создать папку и недостающих родителей. Созданные и уже существующие папки запоминаются,
+        поэтому для файлов одной папки mkdir не повторяется. Ошибка создания (кроме «уже существует»)
+        пробрасывается.
+        """
+        current = ''
+        for part in api_path.strip('/').split('/'):
+            if not part:
+                continue
+            parent = current or '/'
+            current = f"{current}/{part}"
+            with self._dirs_lock:
+                if current in self._known_dirs:
+                    continue
+            try:
+                self._retrying(lambda: self.disk.mkdir(current, n_retries=0), 'mkdir')
+                self.invalidate_listing(parent)
+            except _DIR_EXISTS:
+                pass
+            except YaDiskException as e:
+                error_str = str(e).lower()
+                if 'already exists' not in error_str and 'существует' not in error_str:
+                    # без этой папки не создать вложенные и не загрузить файлы — дальше не идём
+                    logger.error(f"Ошибка создания папки {current}: {type(e).__name__} {e}")
+                    raise
+            with self._dirs_lock:
+                self._known_dirs.add(current)
+    
     def _ensure_path_exists(self, disk_path: str, base_path: Optional[str] = None):
         """
         Создает промежуточные папки на Яндекс Диске для указанного пути.
@@ -240,53 +535,16 @@ class YandexDiskClient:
             disk_path: Полный путь на Яндекс Диске
             base_path: Базовый путь, который уже существует (опционально)
         """
-        disk_path = self._normalize_disk_path(disk_path)
-        
+        api_path = self._path_for_api(disk_path)
         if base_path:
-            base_path = self._normalize_disk_path(base_path)
-            
-            if not disk_path.startswith(base_path.rstrip('/')):
-                base_path = None
-            else:
-                relative = disk_path[len(base_path.rstrip('/')):].lstrip('/')
-                if not relative:
-                    return
-                
-                parts = relative.split('/')
-                current_path = base_path.rstrip('/')
-                
-                for part in parts:
-                    if not part:
-                        continue
-                    current_path = f"{current_path}/{part}"
-                    api_path = self._path_for_api(current_path)
-                    try:
-                        self.disk.mkdir(api_path)
-                    except YaDiskException as e:
-                        error_str = str(e).lower()
-                        if 'already exists' not in error_str and 'существует' not in error_str:
-                            logger.debug(f"Ошибка создания папки {current_path}: {e}")
-                        pass
-                return
-        
-        parts = disk_path.strip('/').split('/')
-        if not parts or parts[0] == '':
-            return
-        
-        current_path = ''
-        for part in parts:
-            if not part:
-                continue
-            if current_path:
-                current_path = f"{current_path}/{part}"
-            else:
-                current_path = f"/{part}"
-            
-            api_path = self._path_for_api(current_path)
-            try:
-                self.disk.mkdir(api_path)
-            except YaDiskException:
-                pass
+            base = self._path_for_api(base_path).rstrip('/')
+            if base and (api_path == base or api_path.startswith(base + '/')):
+                with self._dirs_lock:
+                    current = ''
+                    for part in base.strip('/').split('/'):
+                        current = f"{current}/{part}"
+                        self._known_dirs.add(current)
+        self._ensure_dir(api_path)
     
     def upload_file(self, local_path: Path, disk_path: str, overwrite: bool = True, base_path: Optional[str] = None) -> bool:
         """
@@ -312,12 +570,50 @@ class YandexDiskClient:
                     self._ensure_path_exists(parent_dir, base_path=base_path)
             
             api_path = self._path_for_api(disk_path)
-            self.disk.upload(str(local_path), api_path, overwrite=overwrite)
+            with metrics.stage('upload'):
+                self._retrying(
+                    lambda: self.disk.upload(str(local_path), api_path, overwrite=overwrite, n_retries=0), 'upload',
+                )
+            metrics.add_bytes('upload', Path(local_path).stat().st_size)
+            self.invalidate_listing(api_path.rsplit('/', 1)[0] or '/')
             return True
-        except YaDiskException as e:
+        except (YaDiskException, requests.RequestException, OSError) as e:
+            # сетевые ошибки после исчерпания повторов тоже — иначе одна упавшая загрузка
+            # прервала бы всю папку в upload_files
             logger.error(f"Ошибка загрузки файла {local_path} на {disk_path}: {e}")
             return False
     
+    def upload_files(self, files: List[Tuple[Path, str]], overwrite: bool = True, base_path: Optional[str] = None) -> int:
+        """
+        Загрузить файлы в upload_workers потоков. Папки назначения создаются заранее, по одному разу.
+        
+        Args:
+            files: Пары (локальный файл, путь на Яндекс Диске)
+            overwrite: Перезаписывать существующие файлы
+            base_path: Базовый путь, который уже существует (опционально)
+            
+        Returns:
+            Количество успешно загруженных файлов
+        """
+        if not files:
+            return 0
+        parents = {self._normalize_disk_path(disk_path).rstrip('/').rsplit('/', 1)[0] for _, disk_path in files}
+        for parent in sorted(parents):
+            if parent:
+                try:
+                    self._ensure_path_exists(parent, base_path=base_path)
+                except (YaDiskException, requests.RequestException) as e:
+                    # папку ещё раз попробует создать upload_file каждого её файла и вернёт ошибку
+                    logger.warning(f"Не удалось заранее создать папку {parent}: {e}")
+        
+        def _upload(item: Tuple[Path, str]) -> bool:
+            local_path, disk_path = item
+            return self.upload_file(local_path, disk_path, overwrite=overwrite, base_path=base_path)
+        
+        workers = min(self.upload_workers, len(files))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='yadisk-up') as pool:
+            return sum(pool.map(metrics.propagate(_upload), files))
+    
     def upload_folder(self, local_folder: Path, disk_folder_path: str, overwrite: bool = True, base_path: Optional[str] = None) -> int:
         """
         Загрузить все файлы из локальной папки на Яндекс Диск
@@ -331,21 +627,18 @@ class YandexDiskClient:
         Returns:
             Количество успешно загруженных файлов
         """
-        uploaded_count = 0
-        
         disk_folder_path = self._normalize_disk_path(disk_folder_path)
         
         self._ensure_path_exists(disk_folder_path, base_path=base_path)
         
+        files = []
         for file_path in local_folder.rglob('*'):
             if file_path.is_file():
                 relative_path = file_path.relative_to(local_folder)
                 disk_file_path = f"{disk_folder_path.rstrip('/')}/{str(relative_path).replace(chr(92), '/')}"
-                
-                if self.upload_file(file_path, disk_file_path, overwrite=overwrite, base_path=base_path):
-                    uploaded_count += 1
+                files.append((file_path, disk_file_path))
         
-        return uploaded_count
+        return self.upload_files(files, overwrite=overwrite, base_path=base_path)
     
     def cleanup_temp(self):
         """Очистить временные файлы"""
@@ -369,6 +662,16 @@ def get_yadisk_client() -> Optional[YandexDiskClient]:
     if not token or not token.strip():
         logger.warning("YANDEX_DISK_TOKEN не настроен или пуст")
         return None
-    return YandexDiskClient(token.strip())
+    return YandexDiskClient(
+        token.strip(),
+        download_workers=int(getattr(settings, 'YADISK_DOWNLOAD_WORKERS', 4) or 1),
+        download_connections=int(getattr(settings, 'YADISK_DOWNLOAD_CONNECTIONS', 4) or 1),
+        range_min_bytes=int(getattr(settings, 'YADISK_RANGE_MIN_MB', 16) or 0) * 1024 * 1024,
+        list_ttl=float(getattr(settings, 'YADISK_LIST_TTL_SEC', 60) or 0),
+        list_workers=int(getattr(settings, 'YADISK_LIST_WORKERS', 8) or 1),
+        list_max_age=float(getattr(settings, 'YADISK_LIST_MAX_AGE_SEC', 900) or 0),
+        upload_workers=int(getattr(settings, 'YADISK_UPLOAD_WORKERS', 4) or 1),
+        retries=int(getattr(settings, 'YADISK_RETRIES', 4) or 0),
+    )
 
 
@@ -0,0 +1,292 @@
+"""
+Воспроизводимый замер кодирования: python -m video_core.bench
+
+Исходники генерируются lavfi (testsrc2 + sine) в нескольких разрешениях и длительностях,
+каждый прогоняется через профили эффектов командой build_ffmpeg_command.
+random засевается от --seed, профиля и исходника, поэтому команды повторяются от запуска к запуску.
+По каждому прогону: время, процессорное время (os.wait4), realtime-фактор, пиковая память
+и битрейт выхода. С --baseline результаты сравниваются с сохранённым JSON.
+В Windows os.wait4 нет: процессорное время и память не замеряются (None) и не сравниваются.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from .params import BadgeParams, EffectsParams, JobParams, TextParams
+from .probe import probe_media
+from .ffmpeg_builder import build_ffmpeg_command, can_stream_copy
+
+DEFAULT_SOURCES = "1280x720:10,720x1280:10,1920x1080:20"
+DEFAULT_PROFILES = "safe,default,strong,badge_text"
+# Метрики, рост которых считается регрессией, и метрики, регрессией считается падение
+_HIGHER_IS_WORSE = ('wall_sec', 'cpu_sec', 'peak_rss_mb')
+_LOWER_IS_WORSE = ('realtime_factor',)
+
+
+@dataclass
+class BenchSource:
+    width: int
+    height: int
+    duration: float
+
+    @property
+    def name(self) -> str:
+        return f"{self.width}x{self.height}_{self.duration:g}s"
+
+
+@dataclass
+class BenchResult:
+    profile: str
+    source: str
+    ok: bool
+    mode: str = 'encode'
+    wall_sec: Optional[float] = None
+    cpu_sec: Optional[float] = None
+    realtime_factor: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    bitrate_kbps: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.profile}/{self.source}"
+
+
+def parse_sources(spec: str) -> List[BenchSource]:
+    """'1280x720:10,1920x1080:20' -> исходники (ширина x высота : секунды)."""
+    out = []
+    for part in filter(None, (s.strip() for s in spec.split(','))):
+        size, _, dur = part.partition(':')
+        w, _, h = size.partition('x')
+        out.append(BenchSource(int(w), int(h), float(dur or 10)))
+    return out
+
+
+def _run(cmd: List[str]) -> Tuple[int, float, Optional[float], Optional[float], str]:
+    """
+    Запуск с учётом ресурсов процесса: (код, время, процессорное время, пиковая память МБ, хвост stderr).
+    Без os.wait4 (Windows) процессорное время и память — None.
+    """
+    usage = None
+    with tempfile.TemporaryFile(mode='w+') as err:
+        t0 = time.monotonic()
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        else:
+            proc.wait()
+        wall = time.monotonic() - t0
+        err.seek(0)
+        tail = err.read()[-500:].strip()
+    if usage is None:
+        return proc.returncode, wall, None, None, tail
+    cpu = usage.ru_utime + usage.ru_stime
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return proc.returncode, wall, cpu, rss_mb, tail
+
+
+def make_source(src: BenchSource, folder: Path) -> Path:
+    """Детерминированный клип testsrc2 + sine; уже сгенерированный файл переиспользуется."""
+    path = folder / f"src_{src.name}.mp4"
+    if path.exists() and path.stat().st_size > 0:
+        return path
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size={src.width}x{src.height}:rate=30:duration={src.duration:g}",
+        '-f', 'lavfi', '-i', f"sine=frequency=1000:sample_rate=48000:duration={src.duration:g}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-g', '60',
+        '-c:a', 'aac', '-b:a', '128k', '-shortest', '-movflags', '+faststart', str(path),
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+def make_badge(folder: Path) -> Path:
+    path = folder / 'badge.png'
+    if not path.exists():
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', 'color=c=red@0.8:s=399x225,format=rgba',
+            '-frames:v', '1', str(path),
+        ], check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+def _profile_safe(src: Path, out: Path, badge: Path) -> JobParams:
+    return JobParams(input_path=src, output_path=out)
+
+
+def _profile_default(src: Path, out: Path, badge: Path) -> JobParams:
+    return JobParams(input_path=src, output_path=out, effects=EffectsParams(safe_mode=False))
+
+
+def _profile_strong(src: Path, out: Path, badge: Path) -> JobParams:
+    return JobParams(input_path=src, output_path=out, effects=EffectsParams(safe_mode=False, profile_strong=True))
+
+
+def _profile_badge_text(src: Path, out: Path, badge: Path) -> JobParams:
+    return JobParams(
+        input_path=src, output_path=out,
+        effects=EffectsParams(safe_mode=False),
+        text=TextParams(enabled=True, content='Benchmark'),
+        badge=BadgeParams(enabled=True, path=badge),
+    )
+
+
+PROFILES: Dict[str, Callable[[Path, Path, Path], JobParams]] = {
+    'safe': _profile_safe,
+    'default': _profile_default,
+    'strong': _profile_strong,
+    'badge_text': _profile_badge_text,
+}
+
+
+def run_one(profile: str, src: BenchSource, src_path: Path, badge: Path, out_dir: Path,
+            seed: int, repeat: int = 1) -> BenchResult:
+    """Один профиль на одном исходнике; при repeat > 1 берутся медианы времени."""
+    out = out_dir / f"{profile}_{src.name}.mp4"
+    info = probe_media(src_path)
+    walls, cpus, rss = [], [], []
+    mode = 'encode'
+    for _ in range(max(1, repeat)):
+        random.seed(f"{seed}:{profile}:{src.name}")
+        p = PROFILES[profile](src_path, out, badge)
+        mode = 'copy' if can_stream_copy(p, info) else 'encode'
+        cmd = build_ffmpeg_command(p, info.duration or src.duration, nvenc_ok=False, probe=info)
+        cmd = cmd[:2] + ['-nostats', '-v', 'error'] + cmd[2:]
+        code, wall, cpu, rss_mb, tail = _run(cmd)
+        if code != 0:
+            return BenchResult(profile, src.name, ok=False, mode=mode, error=tail or f"ffmpeg exit code {code}")
+        walls.append(wall)
+        cpus.append(cpu)
+        rss.append(rss_mb)
+    wall = statistics.median(walls)
+    out_info = probe_media(out)
+    out_dur = out_info.duration or src.duration
+    return BenchResult(
+        profile, src.name, ok=True, mode=mode,
+        wall_sec=round(wall, 3),
+        cpu_sec=round(statistics.median(cpus), 3) if None not in cpus else None,
+        realtime_factor=round(out_dur / wall, 2) if wall > 0 else None,
+        peak_rss_mb=round(max(rss), 1) if None not in rss else None,
+        bitrate_kbps=round(out.stat().st_size * 8 / out_dur / 1000, 1) if out_dur else None,
+    )
+
+
+def _ffmpeg_version() -> str:
+    try:
+        r = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+        return (r.stdout.splitlines() or [''])[0]
+    except OSError:
+        return ''
+
+
+def compare(results: List[BenchResult], baseline: Dict, tolerance: float) -> List[str]:
+    """Регрессии относительно базовой линии: ухудшение больше tolerance (доля)."""
+    base = baseline.get('results', {})
+    problems = []
+    for r in results:
+        b = base.get(r.key)
+        if b is None:
+            continue
+        if not r.ok:
+            if b.get('ok'):
+                problems.append(f"{r.key}: прогон завершился ошибкой")
+            continue
+        for field_name in _HIGHER_IS_WORSE + _LOWER_IS_WORSE:
+            cur, old = getattr(r, field_name), b.get(field_name)
+            if not cur or not old:
+                continue
+            change = (cur - old) / old
+            if field_name in _LOWER_IS_WORSE:
+                change = -change
+            if change > tolerance:
+                problems.append(f"{r.key}: {field_name} {old} -> {cur} ({change * 100:+.0f}%)")
+    return problems
+
+
+def _print_table(results: List[BenchResult]) -> None:
+    cols = ('profile', 'source', 'mode', 'wall_sec', 'cpu_sec', 'realtime_factor', 'peak_rss_mb', 'bitrate_kbps')
+    rows = [[str(getattr(r, c) if r.ok or c in ('profile', 'source', 'mode') else 'ERROR') for c in cols] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(cols)]
+    print('  '.join(c.ljust(w) for c, w in zip(cols, widths)))
+    for row in rows:
+        print('  '.join(v.ljust(w) for v, w in zip(row, widths)))
+    for r in results:
+        if not r.ok:
+            print(f"{r.key}: {r.error}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m video_core.bench', description="Замер кодирования на сгенерированных lavfi исходниках")
+    ap.add_argument('--sources', default=DEFAULT_SOURCES, help=f"ШxВ:секунды через запятую (по умолчанию {DEFAULT_SOURCES})")
+    ap.add_argument('--profiles', default=DEFAULT_PROFILES, help=f"Профили через запятую: {', '.join(PROFILES)}")
+    ap.add_argument('--seed', type=int, default=1234)
+    ap.add_argument('--repeat', type=int, default=1, help="Повторов каждого прогона (берётся медиана времени)")
+    ap.add_argument('--work-dir', type=Path, default=Path(tempfile.gettempdir()) / 'video_bench',
+                    help="Папка для исходников и выходов (исходники переиспользуются)")
+    ap.add_argument('--output', type=Path, help="Сохранить результаты в JSON (подходит как --baseline)")
+    ap.add_argument('--baseline', type=Path, help="Сравнить с сохранённым JSON; при регрессиях код выхода 1")
+    ap.add_argument('--tolerance', type=float, default=0.10, help="Допустимое ухудшение (доля, по умолчанию 0.10)")
+    args = ap.parse_args(argv)
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        ap.error(f"Неизвестные профили: {', '.join(unknown)}")
+
+    src_dir = args.work_dir / 'sources'
+    out_dir = args.work_dir / 'out'
+    src_dir.mkdir(parents=True, exist_ok=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    badge = make_badge(src_dir)
+
+    results = []
+    for src in parse_sources(args.sources):
+        src_path = make_source(src, src_dir)
+        for profile in profiles:
+            r = run_one(profile, src, src_path, badge, out_dir, args.seed, args.repeat)
+            print(f"{r.key}: {'ok' if r.ok else 'ERROR'} {r.wall_sec or ''}", file=sys.stderr)
+            results.append(r)
+    _print_table(results)
+
+    report = {
+        'meta': {
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'ffmpeg': _ffmpeg_version(),
+            'cpu_count': os.cpu_count(),
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {r.key: asdict(r) for r in results},
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        if baseline.get('meta', {}).get('ffmpeg') != report['meta']['ffmpeg']:
+            print(f"Внимание: другая версия FFmpeg в базовой линии: {baseline.get('meta', {}).get('ffmpeg')}", file=sys.stderr)
+        problems = compare(results, baseline, args.tolerance)
+        if problems:
+            print("Регрессии относительно базовой линии:")
+            for line in problems:
+                print(f"  {line}")
+            return 1
+        print("Регрессий относительно базовой линии нет")
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Кодеры, которые стоит отметить в сводке, если сборка FFmpeg их содержит
+KNOWN_ENCODERS = (
+    'libx264', 'libx265', 'libsvtav1', 'libaom-av1', 'libvpx-vp9', 'libopenh264',
+    'h264_nvenc', 'hevc_nvenc', 'h264_vaapi', 'hevc_vaapi', 'h264_qsv', 'hevc_qsv', 'aac',
+)
+_TRIAL_SRC = ['-f', 'lavfi', '-i', 'color=size=64x64:rate=1:duration=1']
+_VAAPI_DEVICE = '/dev/dri/renderD128'
+_TRIAL_TIMEOUT = 20
+
+
+@dataclass
+class Capabilities:
+    """Возможности FFmpeg на этом хосте: версия, кодеры, фильтры, работающие аппаратные кодеры."""
+    version: str = ''
+    ffmpeg_path: str = ''
+    ffmpeg_id: str = ''
+    host: str = ''
+    encoders: List[str] = field(default_factory=list)
+    filters: List[str] = field(default_factory=list)
+    hwaccels: List[str] = field(default_factory=list)
+    nvenc_ok: bool = False
+    vaapi_ok: bool = False
+    qsv_ok: bool = False
+    probed_at: float = 0.0
+
+    def has_encoder(self, name: str) -> bool:
+        return name in self.encoders
+
+    def has_filter(self, name: str) -> bool:
+        return name in self.filters
+
+    def summary(self) -> str:
+        hw = [name for name, ok in (('nvenc', self.nvenc_ok), ('vaapi', self.vaapi_ok), ('qsv', self.qsv_ok)) if ok]
+        enc = [e for e in KNOWN_ENCODERS if e in self.encoders]
+        return f"{self.version or 'ffmpeg ?'}; кодеры: {', '.join(enc) or '—'}; аппаратное кодирование: {', '.join(hw) or 'нет'}"
+
+
+_lock = threading.Lock()
+_current: Optional[Capabilities] = None
+_cache_dir: Optional[Path] = None
+_ttl = 24 * 3600.0
+
+
+def configure_capabilities(cache_dir: Optional[Path], ttl_sec: float = 24 * 3600) -> None:
+    """Дисковый кэш возможностей (None — только память процесса) и срок его жизни."""
+    global _cache_dir, _ttl
+    _cache_dir = Path(cache_dir) if cache_dir else None
+    _ttl = max(0.0, float(ttl_sec))
+
+
+def _ffmpeg_identity() -> Tuple[str, str]:
+    """Путь к ffmpeg и его идентичность (размер, mtime): обновление FFmpeg сбрасывает кэш."""
+    path = shutil.which('ffmpeg') or 'ffmpeg'
+    try:
+        st = os.stat(path)
+        return path, f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return path, ''
+
+
+def _run(args: List[str], timeout: float = _TRIAL_TIMEOUT) -> Optional[subprocess.CompletedProcess]:
+    try:
+        return subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def parse_encoders(text: str) -> List[str]:
+    """Имена из вывода ffmpeg -encoders (строки после разделителя ------)."""
+    names, started = [], False
+    for line in text.splitlines():
+        if line.strip().startswith('------'):
+            started = True
+            continue
+        parts = line.split()
+        if started and len(parts) >= 2 and parts[0][:1] in 'VAS':
+            names.append(parts[1])
+    return names
+
+
+def parse_filters(text: str) -> List[str]:
+    """Имена из вывода ffmpeg -filters (строки вида 'TSC name  V->V  описание')."""
+    names = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and '->' in parts[2]:
+            names.append(parts[1])
+    return names
+
+
+def _trial_encode(args: List[str]) -> bool:
+    r = _run(['ffmpeg', '-hide_banner', '-v', 'error'] + args + ['-f', 'null', '-'])
+    return r is not None and r.returncode == 0
+
+
+def probe_capabilities() -> Capabilities:
+    """Полный опрос FFmpeg: несколько коротких запусков и пробные кодирования аппаратных кодеров."""
+    path, ident = _ffmpeg_identity()
+    caps = Capabilities(ffmpeg_path=path, ffmpeg_id=ident, host=socket.gethostname(), probed_at=time.time())
+    r = _run(['ffmpeg', '-hide_banner', '-version'])
+    if r is None or r.returncode != 0:
+        return caps
+    caps.version = (r.stdout.splitlines() or [''])[0].strip()
+    r = _run(['ffmpeg', '-hide_banner', '-encoders'])
+    caps.encoders = parse_encoders(r.stdout) if r and r.returncode == 0 else []
+    r = _run(['ffmpeg', '-hide_banner', '-filters'])
+    caps.filters = parse_filters(r.stdout) if r and r.returncode == 0 else []
+    r = _run(['ffmpeg', '-hide_banner', '-hwaccels'])
+    if r and r.returncode == 0:
+        caps.hwaccels = [l.strip() for l in r.stdout.splitlines()[1:] if l.strip()]
+
+    if caps.has_encoder('h264_nvenc'):
+        caps.nvenc_ok = _trial_encode(_TRIAL_SRC + ['-c:v', 'h264_nvenc'])
+    if caps.has_encoder('h264_vaapi') and os.path.exists(_VAAPI_DEVICE):
+        caps.vaapi_ok = _trial_encode(['-vaapi_device', _VAAPI_DEVICE] + _TRIAL_SRC
+                                      + ['-vf', 'format=nv12,hwupload', '-c:v', 'h264_vaapi'])
+    if caps.has_encoder('h264_qsv'):
+        caps.qsv_ok = _trial_encode(_TRIAL_SRC + ['-c:v', 'h264_qsv'])
+    return caps
+
+
+def _cache_file() -> Optional[Path]:
+    if not _cache_dir:
+        return None
+    return _cache_dir / f"ffmpeg-{socket.gethostname()}.json"
+
+
+def _load_cached() -> Optional[Capabilities]:
+    p = _cache_file()
+    if not p or not p.exists():
+        return None
+    try:
+        caps = Capabilities(**json.loads(p.read_text(encoding='utf-8')))
+    except (OSError, ValueError, TypeError):
+        return None
+    path, ident = _ffmpeg_identity()
+    if caps.ffmpeg_path != path or caps.ffmpeg_id != ident or time.time() - caps.probed_at > _ttl:
+        return None
+    return caps
+
+
+def _store(caps: Capabilities) -> None:
+    p = _cache_file()
+    if not p or not caps.version:
+        return
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(asdict(caps), ensure_ascii=False), encoding='utf-8')
+        tmp.replace(p)
+    except OSError:
+        pass
+
+
+def get_capabilities(refresh: bool = False) -> Capabilities:
+    """
+    Возможности FFmpeg: из памяти процесса, затем из дискового кэша хоста (пока не истёк TTL
+    и не сменился бинарник ffmpeg), иначе — опрос. Опрашивает один поток, остальные ждут результат.
+    """
+    global _current
+    caps = _current
+    if caps is not None and not refresh and time.time() - caps.probed_at <= _ttl:
+        return caps
+    with _lock:
+        caps = _current
+        if caps is not None and not refresh and time.time() - caps.probed_at <= _ttl:
+            return caps
+        caps = None if refresh else _load_cached()
+        if caps is None:
+            caps = probe_capabilities()
+            _store(caps)
+        _current = caps
+        return caps
+
+
+def mark_unusable(encoder: str) -> None:
+    """
+    Кодер упал во время работы (например, NVENC без свободной сессии) — этот процесс не выбирает его
+    до следующего опроса. Дисковый кэш не меняется: сбой может быть временным.
+    """
+    with _lock:
+        caps = _current
+        if caps is None:
+            return
+        flags: Dict[str, str] = {'h264_nvenc': 'nvenc_ok', 'h264_vaapi': 'vaapi_ok', 'h264_qsv': 'qsv_ok'}
+        attr = flags.get(encoder)
+        if attr is None or not getattr(caps, attr):
+            return
+        setattr(caps, attr, False)
@@ -4,30 +4,23 @@ from pathlib import Path
 from typing import List, Optional, Tuple
 from .params import JobParams
 from .positions import calc_position
-from .probe import probe_badge
+from .probe import ProbeInfo, probe_badge
+from .filter_graph import optimize_chain
+from .capabilities import get_capabilities
+from .remote import HTTP_INPUT_OPTIONS
 from .metadata import random_metadata
+from .threads import ThreadPlan
 
 
 def detect_nvenc() -> bool:
-    """Проверка наличия NVENC кодеков."""
-    import subprocess
-    try:
-        out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True)
-        return out.returncode == 0 and ("h264_nvenc" in out.stdout or "hevc_nvenc" in out.stdout)
-    except Exception:
-        return False
+    """Проверка наличия NVENC кодеков (по реестру возможностей FFmpeg)."""
+    caps = get_capabilities()
+    return caps.has_encoder('h264_nvenc') or caps.has_encoder('hevc_nvenc')
 
 
 def validate_nvenc_runtime() -> bool:
-    """Валидация NVENC в runtime."""
-    import subprocess
-    try:
-        test = ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "color=size=64x64:rate=1:duration=1",
-                "-c:v", "h264_nvenc", "-f", "null", "-"]
-        r = subprocess.run(test, capture_output=True, text=True)
-        return r.returncode == 0
-    except Exception:
-        return False
+    """Валидация NVENC в runtime: пробное кодирование выполняется один раз при опросе возможностей."""
+    return get_capabilities().nvenc_ok
 
 
 def _escape_text_for_drawtext(text: str) -> str:
@@ -188,40 +181,255 @@ def _build_filter_chain(
     video_w: int,
     video_h: int,
     text_filters: List[str],
-    output_label: str
+    output_label: str,
+    src_size: Optional[Tuple[int, int]] = None
 ) -> str:
     """
     Построение цепочки фильтров для видео потока.
-    Структура: [input]effects,scale,pad,setsar,text[output]
+    Структура: [input]effects,scale,pad,setsar,text[output]; эффекты и масштаб упорядочиваются
+    и сводятся filter_graph.optimize_chain (src_size — размер кадра исходника, если известен).
     """
-    parts = []
+    parts = optimize_chain(video_effects, (video_w, video_h), src_size)
     
-    chain = input_label
+    parts.extend(text_filters)
     
-    if video_effects:
-        chain += video_effects[0]
-        if len(video_effects) > 1:
-            parts.extend(video_effects[1:])
+    return input_label + ",".join(parts) + output_label
+
+
+def _source_size(probe: Optional[ProbeInfo]) -> Optional[Tuple[int, int]]:
+    """Размер кадра исходника с учётом поворота (после автоповорота FFmpeg)."""
+    if probe is None or not probe.width or not probe.height:
+        return None
+    if probe.rotation in (90, 270):
+        return probe.height, probe.width
+    return probe.width, probe.height
+
+
+def _target_size(fmt: str) -> Tuple[int, int]:
+    """Размер кадра на выходе для формата."""
+    return (720, 720) if fmt == "1:1" else (720, 1280) if fmt == "9:16" else (1280, 720)
+
+
+def _input_args(p: JobParams, duration_sec: float, thread_plan: Optional[ThreadPlan]) -> List[str]:
+    """Начало команды: потоки, зацикливание под фиксированную длительность и основной вход."""
+    threads = thread_plan.threads if thread_plan else (os.cpu_count() or 4)
+    cmd = ['ffmpeg', '-y', '-threads', str(threads)]
     
-    parts.append(f"scale={video_w}:{video_h}:force_original_aspect_ratio=decrease")
-    parts.append(f"pad={video_w}:{video_h}:(ow-iw)/2:(oh-ih)/2:black")
-    parts.append("setsar=1")
+    if p.fixed_duration_sec and p.fixed_duration_sec > 0 and duration_sec < p.fixed_duration_sec:
+        loops_needed = int((p.fixed_duration_sec / duration_sec) + 1)
+        cmd.extend(['-stream_loop', str(loops_needed)])
     
-    parts.extend(text_filters)
+    cmd.extend(source_args(p))
+    return cmd
+
+
+def source_args(p: JobParams) -> List[str]:
+    """Основной вход: локальный файл или HTTP-ссылка с опциями переподключения."""
+    if p.input_url:
+        return HTTP_INPUT_OPTIONS + ['-i', p.input_url]
+    return ['-i', str(p.input_path).replace('\\', '/')]
+
+
+def _use_badge(p: JobParams) -> bool:
+    return bool(
+        p.badge.enabled
+        and p.badge.path
+        and isinstance(p.badge.path, Path)
+        and p.badge.path.exists()
+        and p.badge.path.is_file()
+    )
+
+
+def _badge_behavior(p: JobParams) -> str:
+    return getattr(p.badge, 'behavior', 'Исчезновение') or 'Исчезновение'
+
+
+def _probe_badge_safe(path: Path) -> Tuple[int, int, bool, Optional[float]]:
+    try:
+        return probe_badge(path)
+    except Exception as e:
+        print(f"[ffmpeg_builder] WARNING: Failed to probe badge {path}: {e}")
+        return 399, 225, False, None
+
+
+def _badge_input_args(p: JobParams) -> List[str]:
+    """Флаги зацикливания и вход бейджа."""
+    badge_file = str(p.badge.path).replace('\\', '/')
+    ext_lower = badge_file.lower()
+    
+    loop_flag = []
+    if _badge_behavior(p) == 'Луп до конца':
+        if ext_lower.endswith(('.png', '.jpg', '.jpeg')):
+            loop_flag = ['-loop', '1']
+        else:
+            loop_flag = ['-stream_loop', '-1']
     
-    if parts:
-        chain += "," + ",".join(parts)
+    return loop_flag + ['-i', badge_file]
+
+
+def _build_badge_overlay(
+    p: JobParams,
+    badge_info: Tuple[int, int, bool, Optional[float]],
+    video_w: int,
+    video_h: int,
+    badge_label: str,
+    badge_pre_filters: List[str],
+    logo_label: str,
+    bg_label: str,
+    output_label: str
+) -> List[str]:
+    """
+    Цепочки масштабирования бейджа и наложения его на фон.
+    Возвращает [badge_chain, overlay_chain].
+    """
+    badge_w, badge_h, has_alpha, _badge_dur = badge_info
+    
+    badge_scale_percent = getattr(p.badge, 'scale_percent', 30) or 30
+    if getattr(p.badge, 'random_scale', False):
+        scale_percent = max(10, min(80, int(badge_scale_percent)))
+        badge_scale_percent = random.randint(max(10, scale_percent - 10), min(80, scale_percent + 20))
+    
+    badge_scale_rel = badge_scale_percent / 100.0
+    badge_target_w = max(64, int(video_w * badge_scale_rel))
+    est_badge_h = int((badge_h or 225) * (badge_target_w / float(badge_w or 399)))
     
-    chain += output_label
+    ext_lower = str(p.badge.path).lower()
     
-    return chain
+    bx, by, _ = calc_position(False, video_w, video_h, badge_target_w, est_badge_h, p.badge.position)
+    bx = str(bx) if bx is not None else "0"
+    by = str(by) if by is not None else "0"
+    
+    badge_parts = list(badge_pre_filters) + [f'scale={badge_target_w}:-1:flags=bilinear']
+    
+    if not has_alpha and ext_lower.endswith(('.gif', '.png')):
+        badge_parts.append('colorkey=0xFFFFFF:0.1:0.1')
+    
+    badge_parts.append('format=rgba')
+    badge_chain = badge_label + ','.join(badge_parts) + logo_label
+    
+    overlay_opts = f'overlay={bx}:{by}:eof_action=pass'
+    if _badge_behavior(p) == 'Обрезать по короткому':
+        overlay_opts += ':shortest=1'
+    
+    overlay_chain = f'{bg_label}{logo_label}{overlay_opts}{output_label}'
+    
+    return [badge_chain, overlay_chain]
 
 
-def build_ffmpeg_command(p: JobParams, duration_sec: float, nvenc_ok: Optional[bool] = None) -> List[str]:
-    """Построение команды FFmpeg из параметров."""
+def _resolve_nvenc(nvenc_ok: Optional[bool]) -> bool:
+    if nvenc_ok is not None:
+        return bool(nvenc_ok)
+    try:
+        return get_capabilities().nvenc_ok
+    except Exception:
+        return False
+
+
+def _filter_threads(thread_plan: Optional[ThreadPlan]) -> str:
+    return str(thread_plan.filter_threads if thread_plan else 2)
+
+
+def _video_codec_args(E, use_nvenc: bool, thread_plan: Optional[ThreadPlan] = None) -> List[str]:
+    """Параметры видеокодека (NVENC или x264, при codec_random — случайные crf/preset)."""
+    args = []
+    if use_nvenc:
+        args.extend(['-c:v', 'h264_nvenc', '-preset', 'p3', '-cq', '23', '-g', '48', '-pix_fmt', 'yuv420p'])
+    else:
+        if E.codec_random and not E.safe_mode:
+            crf = random.randint(20, 24)
+            preset = random.choice(["veryfast", "superfast"])
+            args.extend(['-c:v', 'libx264', '-crf', str(crf), '-g', '48', '-preset', preset, '-pix_fmt', 'yuv420p'])
+        else:
+            args.extend(['-c:v', 'libx264', '-crf', '22', '-g', '48', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'])
     
-    fmt = p.fmt
-    video_w, video_h = (720, 720) if fmt == "1:1" else (720, 1280) if fmt == "9:16" else (1280, 720)
+    if thread_plan:
+        args.extend(['-threads:v', str(thread_plan.encoder_threads)])
+    return args
+
+
+def _output_args(p: JobParams, audio_filter: Optional[str], use_nvenc: bool, thread_plan: Optional[ThreadPlan] = None) -> List[str]:
+    """Параметры одного выхода: метаданные, аудиофильтр, длительность, кодеки и путь."""
+    args = random_metadata()
+    
+    if audio_filter:
+        args.extend(['-af', audio_filter])
+    
+    if p.fixed_duration_sec and p.fixed_duration_sec > 0:
+        args.extend(['-t', str(p.fixed_duration_sec)])
+    
+    args.extend(_video_codec_args(p.effects, use_nvenc, thread_plan))
+    
+    args.extend(['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'])
+    args.append(str(p.output_path))
+    return args
+
+
+def can_stream_copy(p: JobParams, probe: Optional[ProbeInfo]) -> bool:
+    """
+    Лёгкий режим: видео можно скопировать без перекодирования.
+    Нужны включённая опция stream_copy, безопасный режим (contrast/brightness_sat в нём
+    почти незаметны и пропускаются), отсутствие текста, бейджа, сетки и фиксированной длительности,
+    и исходник уже H.264 yuv420p в целевом разрешении без поворота.
+    """
+    E = p.effects
+    if not getattr(E, 'stream_copy', False) or probe is None or not probe.ok:
+        return False
+    if not E.safe_mode or E.hidden_pattern:
+        return False
+    if p.text.enabled and p.text.content.strip():
+        return False
+    if _use_badge(p) or (p.fixed_duration_sec and p.fixed_duration_sec > 0):
+        return False
+    video_w, video_h = _target_size(p.fmt)
+    return (
+        probe.vcodec == 'h264'
+        and probe.pix_fmt == 'yuv420p'
+        and probe.width == video_w
+        and probe.height == video_h
+        and probe.rotation == 0
+    )
+
+
+def _stream_copy_output_args(p: JobParams, probe: ProbeInfo) -> List[str]:
+    """
+    Выход лёгкого режима: видео копируется как есть, уникальность дают метаданные,
+    пользовательский SEI в потоке H.264, таймскейл контейнера и перекодированное аудио.
+    """
+    sei_payload = ''.join(random.choice('0123456789abcdef') for _ in range(16))
+    args = ['-map', '0:v:0', '-map', '0:a?', '-map_metadata', '-1', '-map_chapters', '-1']
+    args.extend(['-c:v', 'copy', '-bsf:v', f'h264_metadata=sei_user_data=dc45e9bde6d948b7962cd820d923eeef+{sei_payload}'])
+    args.extend(random_metadata())
+    if probe.has_audio:
+        args.extend([
+            '-af', f'volume={random.uniform(0.97, 1.03):.3f}',
+            '-c:a', 'aac', '-b:a', random.choice(['96k', '128k', '160k']),
+        ])
+    args.extend(['-video_track_timescale', random.choice(['15360', '30000', '60000', '90000'])])
+    args.extend(['-movflags', '+faststart'])
+    args.append(str(p.output_path))
+    return args
+
+
+def build_stream_copy_command(params: List[JobParams], probe: ProbeInfo) -> List[str]:
+    """Команда лёгкого режима: один проход чтения исходника, N выходов без перекодирования видео."""
+    cmd = ['ffmpeg', '-y'] + source_args(params[0])
+    for p in params:
+        cmd.extend(_stream_copy_output_args(p, probe))
+    return cmd
+
+
+def build_ffmpeg_command(p: JobParams, duration_sec: float, nvenc_ok: Optional[bool] = None,
+                         thread_plan: Optional[ThreadPlan] = None, probe: Optional[ProbeInfo] = None) -> List[str]:
+    """
+    Построение команды FFmpeg из параметров.
+    thread_plan — потоки декодера, фильтров и кодера из общего бюджета (без него — все ядра на декодер).
+    probe — сведения об исходнике; если он уже подходит под цель, см. can_stream_copy.
+    """
+    if can_stream_copy(p, probe):
+        return build_stream_copy_command([p], probe)
+    
+    
+    video_w, video_h = _target_size(p.fmt)
     
     E = p.effects
     safe = E.safe_mode
@@ -231,146 +439,94 @@ def build_ffmpeg_command(p: JobParams, duration_sec: float, nvenc_ok: Optional[b
     
     text_filters = _build_text_filters(p.text, video_w, video_h, safe)
     
-    input_loop_needed = False
-    input_loop_count = -1
-    if p.fixed_duration_sec and p.fixed_duration_sec > 0 and duration_sec < p.fixed_duration_sec:
-        loops_needed = int((p.fixed_duration_sec / duration_sec) + 1)
-        input_loop_needed = True
-        input_loop_count = loops_needed
-    
-    use_badge = (
-        p.badge.enabled
-        and p.badge.path
-        and isinstance(p.badge.path, Path)
-        and p.badge.path.exists()
-        and p.badge.path.is_file()
-    )
-    
-    cmd = ['ffmpeg', '-y', '-threads', str(os.cpu_count() or 4)]
-    
-    if input_loop_needed:
-        cmd.extend(['-stream_loop', str(input_loop_count)])
+    cmd = _input_args(p, duration_sec, thread_plan)
     
-    cmd.extend(['-i', str(p.input_path).replace('\\', '/')])
-    
-    if use_badge:
-        try:
-            badge_w, badge_h, has_alpha, badge_dur = probe_badge(p.badge.path)
-        except Exception as e:
-            print(f"[ffmpeg_builder] WARNING: Failed to probe badge {p.badge.path}: {e}")
-            badge_w, badge_h, has_alpha, badge_dur = 399, 225, False, None
-        
-        badge_scale_percent = getattr(p.badge, 'scale_percent', 30) or 30
-        if getattr(p.badge, 'random_scale', False):
-            scale_percent = max(10, min(80, int(badge_scale_percent)))
-            badge_scale_percent = random.randint(max(10, scale_percent - 10), min(80, scale_percent + 20))
-        
-        badge_scale_rel = badge_scale_percent / 100.0
-        badge_target_w = max(64, int(video_w * badge_scale_rel))
-        est_badge_h = int((badge_h or 225) * (badge_target_w / float(badge_w or 399)))
-        
-        badge_file = str(p.badge.path).replace('\\', '/')
-        ext_lower = badge_file.lower()
-        
-        loop_flag = []
-        force_shortest = False
-        badge_behavior = getattr(p.badge, 'behavior', 'Исчезновение') or 'Исчезновение'
-        
-        if badge_behavior == 'Луп до конца':
-            if ext_lower.endswith(('.png', '.jpg', '.jpeg')):
-                loop_flag = ['-loop', '1']
-            else:
-                loop_flag = ['-stream_loop', '-1']
-        elif badge_behavior == 'Обрезать по короткому':
-            force_shortest = True
-        
-        cmd.extend(loop_flag)
-        cmd.extend(['-i', badge_file])
-        
-        bx, by, _ = calc_position(False, video_w, video_h, badge_target_w, est_badge_h, p.badge.position)
-        bx = str(bx) if bx is not None else "0"
-        by = str(by) if by is not None else "0"
+    if _use_badge(p):
+        badge_info = _probe_badge_safe(p.badge.path)
+        cmd.extend(_badge_input_args(p))
         
-        base_chain = _build_filter_chain('[0:v]', video_effects, video_w, video_h, text_filters, '[bg]')
-        
-        badge_parts = ['[1:v]fps=30', f'scale={badge_target_w}:-1:flags=bilinear']
-        
-        if not has_alpha and ext_lower.endswith(('.gif', '.png')):
-            badge_parts.append('colorkey=0xFFFFFF:0.1:0.1')
-        
-        badge_parts.append('format=rgba')
-        badge_chain = ','.join(badge_parts) + '[logo]'
-        
-        overlay_opts = f'overlay={bx}:{by}:eof_action=pass'
-        if force_shortest:
-            overlay_opts += ':shortest=1'
-        
-        overlay_chain = f'[bg][logo]{overlay_opts}[outv]'
+        base_chain = _build_filter_chain('[0:v]', video_effects, video_w, video_h, text_filters, '[bg]',
+                                         _source_size(probe))
+        badge_chain, overlay_chain = _build_badge_overlay(
+            p, badge_info, video_w, video_h, '[1:v]', ['fps=30'], '[logo]', '[bg]', '[outv]'
+        )
         
         filter_complex = ';'.join([base_chain, badge_chain, overlay_chain])
         
         cmd.extend([
-            '-filter_complex_threads', '2',
+            '-filter_complex_threads', _filter_threads(thread_plan),
             '-filter_complex', filter_complex,
             '-map', '[outv]',
             '-map', '0:a?'
         ])
         
-        if badge_behavior == 'Обрезать по короткому':
+        if _badge_behavior(p) == 'Обрезать по короткому':
             cmd.append('-shortest')
     
     else:
         if p.badge.enabled and p.badge.path:
             print(f"[ffmpeg_builder] WARNING: badge_path is not a real file: {p.badge.path}")
         
-        filter_parts = []
-        
-        filter_parts.extend(video_effects)
-        
-        filter_parts.append(f'scale={video_w}:{video_h}:force_original_aspect_ratio=decrease')
-        filter_parts.append(f'pad={video_w}:{video_h}:(ow-iw)/2:(oh-ih)/2:black')
-        filter_parts.append('setsar=1')
-        
-        filter_parts.extend(text_filters)
-        
-        vf_chain = ','.join(filter_parts)
+        vf_chain = _build_filter_chain('', video_effects, video_w, video_h, text_filters, '', _source_size(probe))
         
-        cmd.extend(['-filter_threads', '2', '-vf', vf_chain])
+        cmd.extend(['-filter_threads', _filter_threads(thread_plan), '-vf', vf_chain])
     
-    cmd.extend(random_metadata())
+    cmd.extend(_output_args(p, audio_filter, _resolve_nvenc(nvenc_ok), thread_plan))
     
-    if audio_filter:
-        cmd.extend(['-af', audio_filter])
+    return cmd
+
+
+def build_ffmpeg_multi_command(params: List[JobParams], duration_sec: float, nvenc_ok: Optional[bool] = None,
+                               thread_plan: Optional[ThreadPlan] = None, probe: Optional[ProbeInfo] = None) -> List[str]:
+    """
+    Одна команда FFmpeg на несколько копий одного исходника.
+    Вход декодируется один раз, split раздаёт кадры N веткам со своими
+    случайными эффектами, текстом, бейджем и метаданными; каждая ветка пишет свой выход.
+    Все params должны ссылаться на один input_path и отличаться только output_path.
+    """
+    if len(params) == 1:
+        return build_ffmpeg_command(params[0], duration_sec, nvenc_ok=nvenc_ok, thread_plan=thread_plan, probe=probe)
+    if can_stream_copy(params[0], probe):
+        return build_stream_copy_command(params, probe)
     
-    use_nvenc = bool(nvenc_ok)
-    if nvenc_ok is None:
-        try:
-            use_nvenc = detect_nvenc() and validate_nvenc_runtime()
-        except Exception:
-            use_nvenc = False
+    p0 = params[0]
+    n = len(params)
+    video_w, video_h = _target_size(p0.fmt)
     
-    if use_nvenc:
-        cmd.extend(['-c:v', 'h264_nvenc', '-preset', 'p3', '-cq', '23', '-g', '48', '-pix_fmt', 'yuv420p'])
-    else:
-        if E.codec_random and not safe:
-            crf = random.randint(20, 24)
-            preset = random.choice(["veryfast", "superfast"])
-            cmd.extend(['-c:v', 'libx264', '-crf', str(crf), '-g', '48', '-preset', preset, '-pix_fmt', 'yuv420p'])
-        else:
-            cmd.extend(['-c:v', 'libx264', '-crf', '22', '-g', '48', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'])
+    cmd = _input_args(p0, duration_sec, thread_plan)
     
-    cmd.extend(['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart'])
+    use_badge = _use_badge(p0)
+    if not use_badge and p0.badge.enabled and p0.badge.path:
+        print(f"[ffmpeg_builder] WARNING: badge_path is not a real file: {p0.badge.path}")
     
-    if p.fixed_duration_sec and p.fixed_duration_sec > 0:
-        target_dur = p.fixed_duration_sec
-        insert_pos = len(cmd)
-        for i, arg in enumerate(cmd):
-            if arg in ['-c:v', '-c:a']:
-                insert_pos = i
-                break
-        cmd.insert(insert_pos, str(target_dur))
-        cmd.insert(insert_pos, '-t')
-    
-    cmd.append(str(p.output_path))
+    graph = ['[0:v]split=' + str(n) + ''.join(f'[src{i}]' for i in range(n))]
+    badge_info = None
+    if use_badge:
+        badge_info = _probe_badge_safe(p0.badge.path)
+        cmd.extend(_badge_input_args(p0))
+        graph.append('[1:v]fps=30,split=' + str(n) + ''.join(f'[b{i}]' for i in range(n)))
+    
+    use_nvenc = _resolve_nvenc(nvenc_ok)
+    src_size = _source_size(probe)
+    outputs: List[str] = []
+    
+    for i, p in enumerate(params):
+        E = p.effects
+        video_effects, audio_filter = _build_video_effects_filters(E, video_w, video_h, E.safe_mode, E.profile_strong)
+        text_filters = _build_text_filters(p.text, video_w, video_h, E.safe_mode)
+        
+        if use_badge:
+            graph.append(_build_filter_chain(f'[src{i}]', video_effects, video_w, video_h, text_filters, f'[bg{i}]', src_size))
+            graph.extend(_build_badge_overlay(p, badge_info, video_w, video_h, f'[b{i}]', [], f'[logo{i}]', f'[bg{i}]', f'[v{i}]'))
+        else:
+            graph.append(_build_filter_chain(f'[src{i}]', video_effects, video_w, video_h, text_filters, f'[v{i}]', src_size))
+        
+        outputs.extend(['-map', f'[v{i}]', '-map', '0:a?'])
+        if use_badge and _badge_behavior(p) == 'Обрезать по короткому':
+            outputs.append('-shortest')
+        outputs.extend(_output_args(p, audio_filter, use_nvenc, thread_plan))
+    
+    cmd.extend(['-filter_complex_threads', _filter_threads(thread_plan), '-filter_complex', ';'.join(graph)])
+    cmd.extend(outputs)
     
     return cmd
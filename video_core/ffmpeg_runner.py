@@ -1,12 +1,100 @@
+import os
 import subprocess
-from typing import Dict, Iterator, List
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional
+from . import metrics
 
 def _calc_pct(out_time_ms: float, duration_sec: float) -> int:
     if duration_sec>0:
         return int(min(100, max(0, (out_time_ms / (duration_sec*1000.0))*100 )))
     return 0
 
-def run_ffmpeg_with_progress(cmd: List[str], duration_sec: float) -> Iterator[Dict]:
+@dataclass
+class ProgressRecord:
+    """Один блок вывода -progress FFmpeg (от frame= до progress=)."""
+    out_time_sec: float = 0.0
+    frame: Optional[int] = None
+    fps: Optional[float] = None
+    bitrate_kbps: Optional[float] = None
+    total_size: Optional[int] = None
+    speed: Optional[float] = None
+    dup_frames: int = 0
+    drop_frames: int = 0
+    pct: int = 0
+    eta_sec: Optional[float] = None
+    end: bool = False
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+def _num(val: Optional[str], cast=float):
+    if val is None:
+        return None
+    val = val.strip().rstrip('x')
+    if val.endswith('kbits/s'):
+        val = val[:-len('kbits/s')]
+    try:
+        return cast(float(val))
+    except ValueError:
+        return None
+
+def parse_progress_block(values: Dict[str, str], duration_sec: float) -> ProgressRecord:
+    """
+    Разбор блока key=value. out_time_ms у FFmpeg исторически тоже в микросекундах,
+    поэтому берётся out_time_us, а при его отсутствии — out_time_ms как микросекунды.
+    """
+    out_us = _num(values.get('out_time_us'))
+    if out_us is None:
+        out_us = _num(values.get('out_time_ms'))
+    out_time_sec = max(0.0, (out_us or 0.0) / 1e6)
+    speed = _num(values.get('speed'))
+    rec = ProgressRecord(
+        out_time_sec=out_time_sec,
+        frame=_num(values.get('frame'), int),
+        fps=_num(values.get('fps')),
+        bitrate_kbps=_num(values.get('bitrate')),
+        total_size=_num(values.get('total_size'), int),
+        speed=speed,
+        dup_frames=_num(values.get('dup_frames'), int) or 0,
+        drop_frames=_num(values.get('drop_frames'), int) or 0,
+        pct=_calc_pct(out_time_sec * 1000.0, duration_sec),
+        end=values.get('progress') == 'end',
+    )
+    if duration_sec > 0 and speed:
+        rec.eta_sec = round(max(0.0, duration_sec - out_time_sec) / speed, 1)
+    return rec
+
+def _progress_event(rec: ProgressRecord, outputs: Optional[Dict[str, float]]) -> Dict:
+    ev = {"event":"progress","pct": rec.pct, "fps": rec.fps, "speed": rec.speed, "record": rec}
+    if outputs:
+        ev["outputs"] = {path: _calc_pct(rec.out_time_sec * 1000.0, dur) for path, dur in outputs.items()}
+    return ev
+
+def _pin_cpus(pid: int, cpus: Optional[List[int]]) -> None:
+    """
+    Привязка уже запущенного процесса к ядрам. Делается после Popen, а не в preexec_fn:
+    preexec_fn небезопасен в многопоточном процессе (fork без exec может зависнуть на чужой блокировке).
+    FFmpeg создаёт рабочие потоки после открытия входа, поэтому они наследуют привязку.
+    """
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return
+    try:
+        os.sched_setaffinity(pid, cpus)
+    except OSError:
+        # процесс уже завершился или ядра недоступны — работаем без привязки
+        pass
+
+def run_ffmpeg_with_progress(cmd: List[str], duration_sec: float, outputs: Optional[Dict[str, float]] = None,
+                             cpus: Optional[List[int]] = None, min_interval: float = 0.0) -> Iterator[Dict]:
+    """
+    Запуск FFmpeg с разбором -progress.
+    События progress содержат record — ProgressRecord со всеми полями блока и ETA.
+    outputs — {путь выхода: ожидаемая длительность} для команд с несколькими выходами;
+    тогда события progress дополнительно содержат процент по каждому выходу.
+    cpus — привязать процесс к этим ядрам (Linux, sched_setaffinity).
+    min_interval — не чаще одного события progress за столько секунд (последний блок отдаётся всегда).
+    """
     try:
         if len(cmd)>=2 and cmd[0]=="ffmpeg":
             insert_pos = 2
@@ -15,6 +103,7 @@ def run_ffmpeg_with_progress(cmd: List[str], duration_sec: float) -> Iterator[Di
     except Exception:
         pass
 
+    started = time.monotonic()
     proc = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -23,31 +112,28 @@ def run_ffmpeg_with_progress(cmd: List[str], duration_sec: float) -> Iterator[Di
         bufsize=1,
         universal_newlines=True,
     )
-    out_time_ms = 0.0
+    _pin_cpus(proc.pid, cpus)
+    block: Dict[str, str] = {}
+    last_emit = 0.0
     try:
         for line in proc.stdout:
             line = line.strip()
             if not line:
                 continue
-            if line.startswith("out_time_ms="):
-                try:
-                    out_time_ms = float(line.split("=",1)[1])
-                except Exception:
-                    pass
-                yield {"event":"progress","pct": _calc_pct(out_time_ms, duration_sec)}
-            elif line.startswith("out_time_us="):
-                try:
-                    val = line.split("=",1)[1]
-                    if val != "N/A":
-                        out_time_ms = float(val)/1000.0
-                except Exception:
-                    pass
-                yield {"event":"progress","pct": _calc_pct(out_time_ms, duration_sec)}
-            elif line.startswith("progress="):
-                yield {"event":"progress","pct": _calc_pct(out_time_ms, duration_sec)}
+            key, sep, val = line.partition("=")
+            if sep and " " not in key:
+                block[key] = val
+                if key == "progress":
+                    rec = parse_progress_block(block, duration_sec)
+                    now = time.monotonic()
+                    if rec.end or now - last_emit >= min_interval:
+                        last_emit = now
+                        yield _progress_event(rec, outputs)
             else:
                 yield {"event":"log","line": line}
         code = proc.wait()
+        metrics.record_stage('ffmpeg', time.monotonic() - started)
+        metrics.inc('ffmpeg_runs_total', result='ok' if code == 0 else 'error')
         if code==0:
             yield {"event":"done","code":0}
         else:
@@ -57,5 +143,3 @@ def run_ffmpeg_with_progress(cmd: List[str], duration_sec: float) -> Iterator[Di
             proc.terminate()
         except Exception:
             pass
-
-
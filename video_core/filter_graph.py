@@ -0,0 +1,329 @@
+"""
+Оптимизация цепочки видеофильтров перед сборкой команды FFmpeg.
+
+Эффекты собираются как независимые фильтры (eq, hue, второй eq, gblur, vignette, rotate,
+scale с eval=frame, noise), и каждый из них — отдельный проход по кадру исходного разрешения.
+optimize_chain строит эквивалентную по виду цепочку дешевле:
+  - идущие подряд точечные цветовые операции (eq, hue) сводятся в один eq и не более одного hue;
+    порядок остальных фильтров не меняется;
+  - покачивание rotate / scale eval=frame убирается, если его амплитуда меньше полпикселя;
+  - при уменьшении кадра масштаб под цель ставится первым: crop, rotate, покачивание и попиксельные
+    фильтры (цвет, шум, размытие, виньетка, сетка) работают уже в выходном разрешении;
+    смещения crop, радиус размытия и шаг сетки делятся на коэффициент уменьшения,
+    доли crop, углы поворота и относительная амплитуда покачивания от разрешения не зависят;
+    сетка и шум так пересчитываются лишь приближённо (см. _rescale_per_pixel).
+Результат сравнивается с исходной цепочкой по модели стоимости chain_cost и берётся более дешёвый.
+"""
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+Size = Tuple[int, int]
+
+# Относительная стоимость фильтра на пиксель входного кадра
+FILTER_COST: Dict[str, float] = {
+    'trim': 0.0, 'setpts': 0.0, 'setsar': 0.0, 'crop': 0.05,
+    'eq': 1.0, 'hue': 1.5, 'drawgrid': 0.5, 'drawtext': 0.3, 'pad': 0.5,
+    'noise': 2.0, 'vignette': 3.0, 'gblur': 4.0, 'scale': 3.0, 'rotate': 6.0,
+}
+# scale с eval=frame пересоздаёт контекст swscale и меняет размер кадра на каждом кадре
+EVAL_FRAME_SCALE_COST = 8.0
+_DEFAULT_COST = 1.0
+
+_COLOR = ('eq', 'hue')
+_GEOMETRY = ('crop', 'rotate')
+_PER_PIXEL = ('noise', 'gblur', 'vignette', 'drawgrid')
+_TEMPORAL = ('trim', 'setpts')
+_EQ_KEYS = ('contrast', 'brightness', 'saturation')
+_HUE_KEYS = ('h', 's', 'b')
+
+# Ниже этого радиуса (в пикселях) gblur не меняет соседние пиксели
+_MIN_BLUR_SIGMA = 0.1
+_SUBPIXEL = 0.5
+
+
+@dataclass
+class FilterNode:
+    name: str
+    args: str = ''
+    options: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        return f"{self.name}={self.args}" if self.args else self.name
+
+    @property
+    def is_wobble_scale(self) -> bool:
+        return self.name == 'scale' and 'eval=frame' in self.args
+
+
+def split_filters(chain: str) -> List[str]:
+    """Разбиение 'a=1,b=x(1,2)' на фильтры с учётом скобок, кавычек и экранирования."""
+    parts, buf, depth, quote, escape = [], [], 0, False, False
+    for ch in chain:
+        if escape:
+            buf.append(ch)
+            escape = False
+            continue
+        if ch == '\\':
+            buf.append(ch)
+            escape = True
+            continue
+        if ch == "'":
+            quote = not quote
+        elif not quote and ch == '(':
+            depth += 1
+        elif not quote and ch == ')':
+            depth -= 1
+        elif not quote and depth == 0 and ch == ',':
+            parts.append(''.join(buf))
+            buf = []
+            continue
+        buf.append(ch)
+    if buf:
+        parts.append(''.join(buf))
+    return [p for p in parts if p]
+
+
+def parse_filter(text: str) -> FilterNode:
+    name, _, args = text.partition('=')
+    node = FilterNode(name.strip(), args)
+    if node.name in _COLOR:
+        for item in args.split(':'):
+            key, sep, val = item.partition('=')
+            if sep:
+                node.options[key] = val
+    return node
+
+
+def parse_chain(filters: List[str]) -> List[FilterNode]:
+    return [parse_filter(f) for chunk in filters for f in split_filters(chunk)]
+
+
+def _float(val: Optional[str]) -> Optional[float]:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fit(size: Size, target: Size) -> Size:
+    """Размер после scale=W:H:force_original_aspect_ratio=decrease."""
+    w, h = size
+    tw, th = target
+    k = min(tw / w, th / h)
+    return max(1, int(w * k)), max(1, int(h * k))
+
+
+def _crop_size(node: FilterNode, size: Size) -> Size:
+    m = re.match(r'iw\*([\d.]+):ih\*([\d.]+)', node.args)
+    if not m:
+        return size
+    return max(1, int(size[0] * float(m.group(1)))), max(1, int(size[1] * float(m.group(2))))
+
+
+def _wobble_amplitude(node: FilterNode, size: Size) -> Optional[float]:
+    """Наибольшее смещение пикселя (в пикселях) от rotate или scale с eval=frame."""
+    w, h = size
+    if node.name == 'rotate':
+        m = re.match(r'([\d.]+)\*sin\(', node.args)
+        return float(m.group(1)) * math.hypot(w, h) / 2 if m else None
+    if node.is_wobble_scale:
+        m = re.search(r'iw\*\(1\+([\d.]+)\*sin\(', node.args)
+        return float(m.group(1)) * max(w, h) / 2 if m else None
+    return None
+
+
+def chain_cost(nodes: List[FilterNode], src: Size, target: Size) -> float:
+    """
+    Оценка стоимости цепочки: сумма по фильтрам (стоимость на пиксель × пиксели на входе фильтра),
+    в мегапикселях на кадр. Размер кадра отслеживается через crop и масштабирование под цель.
+    """
+    size = src
+    total = 0.0
+    for node in nodes:
+        fit_scale = node.name == 'scale' and 'force_original_aspect_ratio=decrease' in node.args
+        if node.is_wobble_scale:
+            weight = EVAL_FRAME_SCALE_COST
+        elif fit_scale and _fit(size, target) == size:
+            weight = 0.0  # размер не меняется — scale пропускает кадр без swscale
+        else:
+            weight = FILTER_COST.get(node.name, _DEFAULT_COST)
+        total += weight * size[0] * size[1] / 1e6
+        if node.name == 'crop':
+            size = _crop_size(node, size)
+        elif fit_scale:
+            size = _fit(size, target)
+        elif node.name == 'pad':
+            size = target
+    return total
+
+
+def _merge_color(nodes: List[FilterNode]) -> Optional[List[FilterNode]]:
+    """
+    Свести последовательность eq/hue в один eq (яркость, контраст) и один hue (поворот, насыщенность).
+    eq: y' = (y - 0.5)·c + 0.5 + b, насыщенность умножает цветность; hue поворачивает и масштабирует цветность,
+    его b — сдвиг яркости в десятых долях шкалы eq. None — есть параметры, которые так не сводятся.
+    """
+    c, b, s, h = 1.0, 0.0, 1.0, 0.0
+    for node in nodes:
+        allowed = _EQ_KEYS if node.name == 'eq' else _HUE_KEYS
+        if any(k not in allowed for k in node.options) or not node.options:
+            return None
+        vals = {k: _float(v) for k, v in node.options.items()}
+        if any(v is None for v in vals.values()):
+            return None
+        if node.name == 'eq':
+            c2 = vals.get('contrast', 1.0)
+            c, b = c * c2, b * c2 + vals.get('brightness', 0.0)
+            s *= vals.get('saturation', 1.0)
+        else:
+            h += vals.get('h', 0.0)
+            s *= vals.get('s', 1.0)
+            b += vals.get('b', 0.0) / 10.0
+    merged = []
+    if abs(h) < 0.005:
+        eq = [f"contrast={c:.3f}"] if abs(c - 1) >= 0.0005 else []
+        eq += [f"brightness={b:.3f}"] if abs(b) >= 0.0005 else []
+        eq += [f"saturation={s:.3f}"] if abs(s - 1) >= 0.0005 else []
+        if eq:
+            merged.append(parse_filter("eq=" + ":".join(eq)))
+        return merged
+    hue = [f"h={h:.2f}"] + ([f"s={s:.3f}"] if abs(s - 1) >= 0.0005 else [])
+    if abs(c - 1) < 0.0005:
+        # без контраста сдвиг яркости делает сам hue — один проход
+        if abs(b) >= 0.0005:
+            hue.append(f"b={b * 10:.3f}")
+    else:
+        eq = [f"contrast={c:.3f}"] + ([f"brightness={b:.3f}"] if abs(b) >= 0.0005 else [])
+        merged.append(parse_filter("eq=" + ":".join(eq)))
+    merged.append(parse_filter("hue=" + ":".join(hue)))
+    return merged
+
+
+def _rescale_per_pixel(node: FilterNode, k: float) -> Optional[FilterNode]:
+    """
+    Параметры попиксельного фильтра после уменьшения кадра в k раз (None — фильтр больше не виден).
+    Точно пересчитываются gblur (sigma / k) и виньетка (от разрешения не зависит). Приближённо:
+      - drawgrid: тоньше 1 пикселя линию не нарисовать, поэтому линия толщиной t при уменьшении
+        в k раз заменяется линией max(1, t/k) с прозрачностью, уменьшенной в той же пропорции, —
+        средняя яркость линии та же, но она чуть шире и мягче, чем после масштаба;
+      - noise: масштаб усредняет k² независимых отсчётов, и амплитуда шума падает в k раз —
+        alls делится на k (0 — шум не виден). Зерно крупнее: пиксель выхода, а не исходника.
+    """
+    if node.name == 'gblur':
+        m = re.match(r'sigma=([\d.]+)', node.args)
+        if m:
+            sigma = float(m.group(1)) / k
+            if sigma < _MIN_BLUR_SIGMA:
+                return None
+            return parse_filter(f"gblur={node.args.replace(m.group(0), f'sigma={sigma:.3f}', 1)}")
+    if node.name == 'drawgrid':
+        args = re.sub(r'(width|height)=(\d+)', lambda m: f"{m.group(1)}={max(2, round(int(m.group(2)) / k))}", node.args)
+        m = re.search(r'thickness=(\d+)', args)
+        thickness = int(m.group(1)) if m else 1
+        scaled = thickness / k
+        if m:
+            args = args.replace(m.group(0), f"thickness={max(1, round(scaled))}", 1)
+        if scaled < 1:
+            a = re.search(r'@([\d.]+)', args)
+            if a:
+                args = args.replace(a.group(0), f"@{float(a.group(1)) * scaled:.4f}", 1)
+        return parse_filter(f"drawgrid={args}")
+    if node.name == 'noise':
+        m = re.search(r'alls=(\d+)', node.args)
+        if m:
+            alls = round(int(m.group(1)) / k)
+            if alls < 1:
+                return None
+            return parse_filter(f"noise={node.args.replace(m.group(0), f'alls={alls}', 1)}")
+    return node
+
+
+def _fit_scale(target: Size) -> FilterNode:
+    return parse_filter(f"scale={target[0]}:{target[1]}:force_original_aspect_ratio=decrease")
+
+
+def _tail(target: Size) -> List[FilterNode]:
+    return [
+        _fit_scale(target),
+        parse_filter(f"pad={target[0]}:{target[1]}:(ow-iw)/2:(oh-ih)/2:black"),
+        parse_filter("setsar=1"),
+    ]
+
+
+def _rescale_crop(node: FilterNode, k: float) -> FilterNode:
+    """crop после уменьшения кадра в k раз: доли ширины/высоты те же, смещения в пикселях делятся на k."""
+    m = re.match(r'(iw\*[\d.]+:ih\*[\d.]+):([\d.]+):([\d.]+)$', node.args)
+    if not m:
+        return node
+    return parse_filter(f"crop={m.group(1)}:{float(m.group(2)) / k:.2f}:{float(m.group(3)) / k:.2f}")
+
+
+def _optimize(nodes: List[FilterNode], src: Size, target: Size) -> List[FilterNode]:
+    known = _COLOR + _GEOMETRY + _PER_PIXEL + _TEMPORAL + ('scale',)
+    if any(n.name not in known or (n.name == 'scale' and not n.is_wobble_scale) for n in nodes):
+        return nodes + _tail(target)
+
+    # Уменьшение кадра — первым: геометрия и попиксельные фильтры работают не больше чем с пикселями цели
+    fitted = _fit(src, target)
+    k = src[0] / fitted[0]
+    downscale = k > 1.0
+    size = fitted if downscale else src
+
+    # Порядок фильтров сохраняется: eq/hue не коммутируют с виньеткой, шумом и заливкой углов rotate,
+    # а выражения rotate/scale зависят от t, который меняет setpts. Сводятся только соседние eq/hue;
+    # перед масштабом остаются лишь trim/setpts из начала цепочки — им всё равно, какого размера кадр
+    lead = 0
+    while lead < len(nodes) and nodes[lead].name in _TEMPORAL:
+        lead += 1
+    head, body, run = nodes[:lead], [], []
+    geometry = False
+
+    def flush_color():
+        if run:
+            merged = _merge_color(run)
+            body.extend(run if merged is None else merged)
+            run.clear()
+
+    for node in nodes[lead:]:
+        if node.name in _COLOR:
+            run.append(node)
+            continue
+        flush_color()
+        if node.name == 'crop':
+            node = _rescale_crop(node, k) if downscale else node
+            size = _crop_size(node, size)
+            geometry = True
+        elif node.name == 'rotate' or node.is_wobble_scale:
+            amp = _wobble_amplitude(node, size)
+            if amp is not None and amp < _SUBPIXEL:
+                continue
+            geometry = True
+        elif node.name in _PER_PIXEL and downscale:
+            node = _rescale_per_pixel(node, k)
+            if node is None:
+                continue
+        body.append(node)
+    flush_color()
+
+    if not downscale:
+        return head + body + _tail(target)
+    # после crop/покачивания кадр снова вписывается в цель; без них остаются только pad и setsar
+    tail = _tail(target) if geometry else _tail(target)[1:]
+    return head + [_fit_scale(target)] + body + tail
+
+
+def optimize_chain(filters: List[str], target: Size, src: Optional[Size] = None) -> List[str]:
+    """
+    Цепочка эффектов + масштаб/pad/setsar под цель в оптимизированном порядке.
+    src — размер исходного кадра (с учётом поворота); без него считается, что он равен цели.
+    """
+    nodes = parse_chain(filters)
+    src = src or target
+    original = nodes + _tail(target)
+    optimized = _optimize(nodes, src, target)
+    if chain_cost(optimized, src, target) > chain_cost(original, src, target):
+        optimized = original
+    return [n.text for n in optimized]
@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PREFIX = 'videosvc_'
+
+_HELP = {
+    'stage_seconds': ('summary', 'Время стадий конвейера (скачивание, ffprobe, FFmpeg, загрузка, задача целиком)'),
+    'queue_wait_seconds': ('summary', 'Ожидание задачи в очереди до запуска воркером'),
+    'encode_realtime_factor': ('summary', 'Длительность ролика / время кодирования'),
+    'bytes_total': ('counter', 'Переданные и записанные байты по направлениям'),
+    'ffmpeg_runs_total': ('counter', 'Запуски FFmpeg по результату'),
+    'probe_cache_total': ('counter', 'Обращения к кэшу ffprobe'),
+    'yadisk_list_cache_total': ('counter', 'Листинги папок Яндекс Диска: из кэша, сверены по modified, запрошены'),
+    'yadisk_retries_total': ('counter', 'Повторы запросов к Яндекс Диску после 429, 5xx и сетевых ошибок'),
+    'jobs_total': ('counter', 'Завершённые задачи по статусу'),
+    'queue_jobs': ('gauge', 'Задачи в очереди по состоянию'),
+}
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_counters: Dict[_Key, float] = {}
+_summaries: Dict[_Key, List[float]] = {}
+_local = threading.local()
+
+
+def _key(name: str, labels: Dict) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class JobMetrics:
+    """Сводка по одной задаче: время стадий, объём данных, realtime-фактор кодирования."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.bytes: Dict[str, int] = {}
+        self.values: Dict[str, float] = {}
+        self.observations: Dict[str, Dict[str, float]] = {}
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            s = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0})
+            s['count'] += 1
+            s['seconds'] += seconds
+
+    def add_bytes(self, direction: str, n: int) -> None:
+        with self._lock:
+            self.bytes[direction] = self.bytes.get(direction, 0) + int(n)
+
+    def set(self, name: str, value: float) -> None:
+        with self._lock:
+            self.values[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            o = self.observations.get(name)
+            if o is None:
+                self.observations[name] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+            else:
+                o['count'] += 1
+                o['sum'] += value
+                o['min'] = min(o['min'], value)
+                o['max'] = max(o['max'], value)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            out = {
+                'wall_sec': round(time.time() - self.started, 2),
+                'stages': {k: {'count': v['count'], 'seconds': round(v['seconds'], 3)} for k, v in self.stages.items()},
+                'bytes': dict(self.bytes),
+            }
+            out.update({k: round(v, 3) for k, v in self.values.items()})
+            for name, o in self.observations.items():
+                out[name] = {
+                    'count': o['count'],
+                    'avg': round(o['sum'] / o['count'], 3),
+                    'min': round(o['min'], 3),
+                    'max': round(o['max'], 3),
+                }
+            return out
+
+
+def current() -> Optional[JobMetrics]:
+    return getattr(_local, 'job', None)
+
+
+@contextmanager
+def bind(job: Optional[JobMetrics]) -> Iterator[Optional[JobMetrics]]:
+    """Пока блок выполняется, стадии этого потока попадают и в сводку задачи job."""
+    prev = current()
+    _local.job = job
+    try:
+        yield job
+    finally:
+        _local.job = prev
+
+
+def propagate(fn: Callable) -> Callable:
+    """Обернуть fn для запуска в пуле потоков: внутри неё действует сводка задачи вызывающего потока."""
+    job = current()
+
+    def _run(*args, **kwargs):
+        with bind(job):
+            return fn(*args, **kwargs)
+    return _run
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    k = _key(name, labels)
+    with _lock:
+        s = _summaries.setdefault(k, [0, 0.0])
+        s[0] += 1
+        s[1] += value
+    job = current()
+    if job is not None and not labels:
+        job.observe(name, value)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    observe('stage_seconds', seconds, stage=stage)
+    job = current()
+    if job is not None:
+        job.add_stage(stage, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Замер стадии: время уходит в реестр процесса и в сводку текущей задачи."""
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        record_stage(name, time.monotonic() - t0)
+
+
+def add_bytes(direction: str, n: int) -> None:
+    if not n:
+        return
+    inc('bytes_total', n, direction=direction)
+    job = current()
+    if job is not None:
+        job.add_bytes(direction, n)
+
+
+def snapshot() -> Dict:
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'ts': time.time(),
+            'counters': [[name, dict(labels), v] for (name, labels), v in _counters.items()],
+            'summaries': [[name, dict(labels), c, s] for (name, labels), (c, s) in _summaries.items()],
+        }
+
+
+def write_snapshot(path: Path) -> None:
+    """Снимок реестра процесса для /metrics веб-процесса (атомарная запись)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(snapshot()), encoding='utf-8')
+    tmp.replace(path)
+
+
+def read_snapshots(folder: Path, exclude_pid: Optional[int] = None) -> List[Dict]:
+    out = []
+    for p in sorted(Path(folder).glob('*.json')):
+        try:
+            snap = json.loads(p.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        if exclude_pid is not None and snap.get('pid') == exclude_pid:
+            continue
+        out.append(snap)
+    return out
+
+
+def _fmt_labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render_prometheus(snapshots: Iterable[Dict], gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """
+    Текстовый формат Prometheus: счётчики и суммы из снимков всех процессов складываются.
+    gauges — {имя: {значение метки state: число}} для величин, считаемых в момент запроса.
+    """
+    counters: Dict[_Key, float] = {}
+    summaries: Dict[_Key, List[float]] = {}
+    for snap in snapshots:
+        for name, labels, v in snap.get('counters', []):
+            k = _key(name, labels)
+            counters[k] = counters.get(k, 0) + v
+        for name, labels, c, s in snap.get('summaries', []):
+            k = _key(name, labels)
+            acc = summaries.setdefault(k, [0, 0.0])
+            acc[0] += c
+            acc[1] += s
+
+    series: Dict[str, List[str]] = {}
+    for (name, labels), v in sorted(counters.items()):
+        series.setdefault(name, []).append(f"{PREFIX}{name}{_fmt_labels(dict(labels))} {v:g}")
+    for (name, labels), (c, s) in sorted(summaries.items()):
+        lbl = _fmt_labels(dict(labels))
+        series.setdefault(name, []).extend([f"{PREFIX}{name}_count{lbl} {c:g}", f"{PREFIX}{name}_sum{lbl} {s:.6f}"])
+    for name, values in (gauges or {}).items():
+        if not values:
+            continue
+        series[name] = [f"{PREFIX}{name}{_fmt_labels({'state': k})} {v:g}" for k, v in sorted(values.items())]
+
+    lines = []
+    for name, rows in series.items():
+        kind, text = _HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {PREFIX}{name} {text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        lines.extend(rows)
+    return '\n'.join(lines) + '\n'
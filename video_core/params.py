@@ -45,6 +45,7 @@ class EffectsParams:
     safe_mode: bool = True
     color_mod: bool = False
     hidden_pattern: bool = False
+    stream_copy: bool = False
 
 @dataclass
 class JobParams:
@@ -57,5 +58,7 @@ class JobParams:
     effects: EffectsParams = field(default_factory=EffectsParams)
     fixed_duration_sec: Optional[int] = None
     extra: Dict[str, Any] = field(default_factory=dict)
+    # Прямая ссылка на исходник: FFmpeg читает его по HTTP, input_path остаётся ключом задачи
+    input_url: Optional[str] = None
 
 
@@ -1,35 +1,278 @@
+import hashlib
+import json
+import os
 import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+from . import metrics
+from .remote import HTTP_INPUT_OPTIONS, is_remote
 
-def probe_duration(path: Path) -> float:
-    cmd = [
-        "ffprobe","-v","error","-show_entries","format=duration",
-        "-of","default=noprint_wrappers=1:nokey=1", str(path).replace('\\','/')
-    ]
+
+@dataclass
+class ProbeInfo:
+    """Сведения о медиафайле из ffprobe."""
+    duration: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    vcodec: Optional[str] = None
+    acodec: Optional[str] = None
+    pix_fmt: Optional[str] = None
+    has_audio: bool = False
+    rotation: int = 0
+    format_name: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.vcodec is not None
+
+
+_CACHE_MAX = 4096
+_cache: 'OrderedDict[Tuple, ProbeInfo]' = OrderedDict()
+_cache_lock = threading.Lock()
+_disk_dir: Optional[Path] = None
+
+
+def configure_probe_cache(cache_dir: Optional[Path], max_entries: int = 4096) -> None:
+    """Включить дисковый слой кэша (None — только память) и задать размер LRU."""
+    global _disk_dir, _CACHE_MAX
+    _disk_dir = Path(cache_dir) if cache_dir else None
+    if _disk_dir:
+        _disk_dir.mkdir(parents=True, exist_ok=True)
+    _CACHE_MAX = max(1, int(max_entries))
+
+
+def _file_key(path: Path) -> Optional[Tuple]:
+    """Идентичность файла: путь, размер, mtime, inode. None — файл недоступен."""
     try:
-        r = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return float(r.stdout.strip() or "12.63")
-    except Exception:
-        return 12.63
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (str(Path(path).resolve()), st.st_size, st.st_mtime_ns, st.st_ino)
 
-def probe_badge(path: Path) -> Tuple[int,int,bool,Optional[float]]:
-    badge_path = str(path).replace('\\','/')
+
+def _disk_file(key: Tuple) -> Optional[Path]:
+    if not _disk_dir:
+        return None
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    return _disk_dir / digest[:2] / f"{digest}.json"
+
+
+def _cache_get(key: Tuple) -> Optional[ProbeInfo]:
+    with _cache_lock:
+        info = _cache.get(key)
+        if info is not None:
+            _cache.move_to_end(key)
+            return info
+    p = _disk_file(key)
+    if p and p.exists():
+        try:
+            info = ProbeInfo(**json.loads(p.read_text(encoding='utf-8')))
+        except Exception:
+            return None
+        _cache_put(key, info, persist=False)
+        return info
+    return None
+
+
+def _cache_put(key: Tuple, info: ProbeInfo, persist: bool = True) -> None:
+    with _cache_lock:
+        _cache[key] = info
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_MAX:
+            _cache.popitem(last=False)
+    p = _disk_file(key) if persist and info.error is None else None
+    if p:
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            tmp.write_text(json.dumps(asdict(info)), encoding='utf-8')
+            tmp.replace(p)
+        except OSError:
+            pass
+
+
+def _parse_rate(rate: Optional[str]) -> Optional[float]:
+    if not rate or rate in ('0/0', 'N/A'):
+        return None
+    try:
+        if '/' in rate:
+            num, den = rate.split('/', 1)
+            return float(num) / float(den) if float(den) else None
+        return float(rate)
+    except ValueError:
+        return None
+
+
+def _parse_float(val) -> Optional[float]:
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_rotation(stream: Dict) -> int:
+    rotate = (stream.get('tags') or {}).get('rotate')
+    if rotate is not None:
+        try:
+            return int(float(rotate)) % 360
+        except ValueError:
+            pass
+    for side in stream.get('side_data_list') or []:
+        if 'rotation' in side:
+            try:
+                return int(float(side['rotation'])) % 360
+            except (TypeError, ValueError):
+                pass
+    return 0
+
+
+def parse_probe_json(data: Dict) -> ProbeInfo:
+    """Разбор вывода ffprobe -show_format -show_streams -of json."""
+    fmt = data.get('format') or {}
+    streams = data.get('streams') or []
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    info = ProbeInfo(
+        duration=_parse_float(fmt.get('duration')),
+        format_name=fmt.get('format_name'),
+        has_audio=audio is not None,
+        acodec=audio.get('codec_name') if audio else None,
+    )
+    if video:
+        info.vcodec = video.get('codec_name')
+        info.width = video.get('width')
+        info.height = video.get('height')
+        info.pix_fmt = video.get('pix_fmt')
+        info.fps = _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate'))
+        info.rotation = _parse_rotation(video)
+        if info.duration is None:
+            info.duration = _parse_float(video.get('duration'))
+    return info
+
+
+def _ffprobe_cmd(target: str) -> list:
+    if is_remote(target):
+        return ["ffprobe", "-v", "error"] + HTTP_INPUT_OPTIONS + ["-show_format", "-show_streams", "-of", "json", target]
+    return ["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", target]
+
+
+def _run_ffprobe(path: Union[Path, str]) -> ProbeInfo:
+    target = path if isinstance(path, str) else str(path).replace('\\', '/')
+    try:
+        with metrics.stage('probe'):
+            r = subprocess.run(_ffprobe_cmd(target), capture_output=True, text=True)
+    except Exception as e:
+        return ProbeInfo(error=str(e))
+    if r.returncode != 0:
+        return ProbeInfo(error=(r.stderr or '').strip()[-500:] or f"ffprobe exit code {r.returncode}")
+    try:
+        return parse_probe_json(json.loads(r.stdout or '{}'))
+    except ValueError as e:
+        return ProbeInfo(error=f"Некорректный вывод ffprobe: {e}")
+
+
+def probe_media(path: Path) -> ProbeInfo:
+    """
+    Полные сведения о файле с кэшированием по (путь, размер, mtime, inode):
+    LRU в памяти и, если настроен, JSON-файлы на диске.
+    """
+    key = _file_key(path)
+    if key is None:
+        return ProbeInfo(error=f"Файл недоступен: {path}")
+    info = _cache_get(key)
+    if info is not None:
+        metrics.inc('probe_cache_total', result='hit')
+        return info
+    metrics.inc('probe_cache_total', result='miss')
+    info = _run_ffprobe(path)
+    _cache_put(key, info)
+    return info
+
+
+def probe_url(url: str) -> ProbeInfo:
+    """
+    Сведения об исходнике по HTTP-ссылке (FFmpeg читает только заголовок и moov).
+    Кэшируется только в памяти: прямые ссылки временные, на диске их ключи бесполезны.
+    """
+    key = ('url', url)
+    with _cache_lock:
+        info = _cache.get(key)
+    if info is not None:
+        metrics.inc('probe_cache_total', result='hit')
+        return info
+    metrics.inc('probe_cache_total', result='miss')
+    info = _run_ffprobe(url)
+    _cache_put(key, info, persist=False)
+    return info
+
+
+def probe_many(paths: Iterable[Path], max_workers: int = 8) -> Iterator[Tuple[Path, ProbeInfo]]:
+    """
+    Пакетное получение сведений о файлах: результаты из кэша отдаются сразу,
+    остальные файлы проверяются ограниченным пулом ffprobe и отдаются по мере готовности.
+    """
+    pending = []
+    for path in paths:
+        key = _file_key(path)
+        if key is None:
+            yield path, ProbeInfo(error=f"Файл недоступен: {path}")
+            continue
+        info = _cache_get(key)
+        if info is not None:
+            metrics.inc('probe_cache_total', result='hit')
+            yield path, info
+        else:
+            metrics.inc('probe_cache_total', result='miss')
+            pending.append((path, key))
+    if not pending:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending))), thread_name_prefix='ffprobe') as pool:
+        futures = {pool.submit(metrics.propagate(_run_ffprobe), path): (path, key) for path, key in pending}
+        for fut in as_completed(futures):
+            path, key = futures[fut]
+            info = fut.result()
+            _cache_put(key, info)
+            yield path, info
+
+
+def probe_keyframe_after(path: Path, t: float, window: float = 30.0) -> Optional[float]:
+    """Время первого ключевого кадра видео не раньше t (ищется в окне [t, t+window])."""
     cmd = [
-        "ffprobe","-v","error","-select_streams","v:0",
-        "-show_entries","stream=width,height,pix_fmt,duration",
-        "-of","default=noprint_wrappers=1:nokey=1", badge_path
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-skip_frame", "nokey",
+        "-read_intervals", f"{max(0.0, t):.3f}%+{window:.3f}",
+        "-show_entries", "frame=pts_time,best_effort_timestamp_time",
+        "-of", "csv=p=0", str(path).replace('\\', '/'),
     ]
     try:
-        r = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        lines = r.stdout.strip().splitlines()
-        w = int(lines[0]) if lines and lines[0].strip() else 399
-        h = int(lines[1]) if len(lines)>1 and lines[1].strip() else 225
-        pix_fmt = (lines[2].strip() if len(lines)>2 else "").lower()
-        has_alpha = "a" in pix_fmt
-        dur = float(lines[3]) if len(lines)>3 and lines[3].strip() else None
-        return w,h,has_alpha,dur
-    except Exception as e:
-        return 399,225,False,None
+        with metrics.stage('probe'):
+            r = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except Exception:
+        return None
+    for line in r.stdout.splitlines():
+        for val in line.split(','):
+            ts = _parse_float(val.strip())
+            if ts is not None and ts >= t:
+                return ts
+    return None
+
+
+def probe_duration(path: Path) -> float:
+    info = probe_media(path)
+    return info.duration or 12.63
 
 
+def probe_badge(path: Path) -> Tuple[int,int,bool,Optional[float]]:
+    info = probe_media(path)
+    if info.error or info.vcodec is None:
+        return 399,225,False,None
+    w = info.width or 399
+    h = info.height or 225
+    has_alpha = "a" in (info.pix_fmt or "").lower()
+    return w,h,has_alpha,info.duration
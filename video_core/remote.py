@@ -0,0 +1,82 @@
+"""
+Чтение исходника по HTTP-ссылке без сохранения на диск.
+
+FFmpeg читает MP4/MOV по сети последовательно, только если атом moov (индекс сэмплов) стоит
+перед mdat (faststart). Иначе демультиплексору приходится прыгать в конец файла и обратно
+на каждом запросе — такие исходники выгоднее сначала скачать.
+"""
+import struct
+import urllib.error
+import urllib.request
+from pathlib import PurePosixPath
+from typing import List, Optional
+
+# Опции HTTP-демультиплексора: переподключение при обрыве и таймаут чтения (мкс)
+HTTP_INPUT_OPTIONS: List[str] = [
+    '-reconnect', '1',
+    '-reconnect_streamed', '1',
+    '-reconnect_on_network_error', '1',
+    '-reconnect_delay_max', '10',
+    '-rw_timeout', '30000000',
+]
+STREAMABLE_EXTENSIONS = ('.mp4', '.mov', '.m4v')
+# Строки stderr FFmpeg, по которым видно, что сбой в чтении входа по сети, а не в кодировании
+INPUT_ERROR_MARKERS = (
+    'HTTP error', 'Server returned', 'Input/output error', 'Connection refused', 'Connection reset',
+    'Connection timed out', 'Error opening input', 'Operation timed out',
+)
+
+_TIMEOUT = 15
+_MAX_ATOMS = 32
+
+
+def is_remote(source: str) -> bool:
+    return source.startswith(('http://', 'https://'))
+
+
+def read_range(url: str, offset: int, length: int, timeout: float = _TIMEOUT) -> bytes:
+    """Прочитать length байт с позиции offset запросом с Range. Сервер без Range — только с нуля."""
+    req = urllib.request.Request(url, headers={'Range': f'bytes={offset}-{offset + length - 1}'})
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        if r.status != 206 and offset > 0:
+            return b''
+        return r.read(length)
+
+
+def mp4_faststart(url: str) -> Optional[bool]:
+    """
+    Порядок атомов верхнего уровня MP4/MOV по ссылке: True — moov перед mdat, False — mdat раньше,
+    None — не удалось определить (не MP4, ошибка сети, сервер без Range).
+    Читаются только заголовки атомов (по 16 байт), сами атомы пропускаются.
+    """
+    offset = 0
+    try:
+        for _ in range(_MAX_ATOMS):
+            head = read_range(url, offset, 16)
+            if len(head) < 8:
+                return None
+            size, kind = struct.unpack('>I4s', head[:8])
+            if size == 1 and len(head) >= 16:
+                size = struct.unpack('>Q', head[8:16])[0]
+            if kind == b'moov':
+                return True
+            if kind == b'mdat':
+                return False
+            if size < 8:
+                return None
+            offset += size
+    except (OSError, urllib.error.URLError, ValueError):
+        return None
+    return None
+
+
+def input_failed(lines: List[str]) -> bool:
+    """В логе FFmpeg есть ошибка чтения входа (истёкшая ссылка, обрыв, 4xx/5xx)."""
+    return any(marker in line for line in lines for marker in INPUT_ERROR_MARKERS)
+
+
+def can_stream(name: str, url: str) -> bool:
+    """Исходник можно кодировать прямо по ссылке: MP4/MOV с moov в начале файла."""
+    if PurePosixPath(name).suffix.lower() not in STREAMABLE_EXTENSIONS:
+        return False
+    return mp4_faststart(url) is True
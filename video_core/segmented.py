@@ -0,0 +1,144 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+from .params import JobParams
+from .probe import ProbeInfo, probe_keyframe_after
+from .metadata import random_metadata
+from .threads import ThreadPlan
+from .ffmpeg_builder import (
+    _build_filter_chain,
+    _source_size,
+    _build_text_filters,
+    _build_video_effects_filters,
+    _filter_threads,
+    _resolve_nvenc,
+    _target_size,
+    _use_badge,
+    _video_codec_args,
+)
+
+
+@dataclass
+class SegmentedPlan:
+    """
+    Кодирование длинного исходника частями.
+    bounds — отрезки [начало, конец) по ключевым кадрам; граф фильтров и параметры кодека
+    разыграны один раз на копию и одинаковы во всех частях.
+    """
+    p: JobParams
+    work_dir: Path
+    bounds: List[Tuple[float, float]]
+    duration: float
+    filter_chain: str
+    codec_args: List[str]
+    audio_filter: Optional[str] = None
+    cut_start: float = 0.0
+    segment_paths: List[Path] = field(default_factory=list)
+
+    def segment_command(self, i: int, thread_plan: Optional[ThreadPlan] = None) -> List[str]:
+        """
+        Команда кодирования части i (только видео).
+        Сдвиг setpts=PTS+start/TB возвращает кадрам исходное время, поэтому выражения с t
+        (геометрия, движение текста) продолжаются без скачков на границах; микросрез начала
+        применяется только к первой части и учитывается в сдвиге остальных.
+        В конце цепочки время части снова начинается с нуля.
+        """
+        start, end = self.bounds[i]
+        threads = str(thread_plan.threads) if thread_plan else '2'
+        if i == 0 and self.cut_start:
+            head = f"trim=start={self.cut_start:.2f},setpts=PTS-STARTPTS"
+        else:
+            head = f"setpts=PTS+{max(0.0, start - self.cut_start):.6f}/TB"
+        graph = f"[0:v]{head},{self.filter_chain},setpts=PTS-STARTPTS[outv]"
+        cmd = [
+            'ffmpeg', '-y', '-threads', threads,
+            '-ss', f"{start:.6f}", '-t', f"{end - start:.6f}",
+            '-i', str(self.p.input_path).replace('\\', '/'),
+            '-filter_complex_threads', _filter_threads(thread_plan),
+            '-filter_complex', graph,
+            '-map', '[outv]', '-an',
+        ]
+        cmd.extend(self.codec_args)
+        if thread_plan:
+            cmd.extend(['-threads:v', str(thread_plan.encoder_threads)])
+        cmd.append(str(self.segment_paths[i]))
+        return cmd
+
+    def concat_command(self) -> List[str]:
+        """Склейка частей concat-демультиплексором и аудио исходника с аудиофильтром копии."""
+        concat_list = self.work_dir / 'concat.txt'
+        concat_list.write_text(
+            ''.join(f"file '{path.as_posix()}'\n" for path in self.segment_paths), encoding='utf-8'
+        )
+        cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', str(concat_list),
+            '-i', str(self.p.input_path).replace('\\', '/'),
+            '-map', '0:v:0', '-map', '1:a?', '-c:v', 'copy',
+        ]
+        cmd.extend(random_metadata())
+        if self.audio_filter:
+            cmd.extend(['-af', self.audio_filter])
+        cmd.extend(['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', str(self.p.output_path)])
+        return cmd
+
+
+def segment_eligible(p: JobParams, probe: Optional[ProbeInfo], min_duration: float,
+                     nvenc_ok: Optional[bool] = None) -> bool:
+    """
+    Частями кодируются только длинные исходники без бейджа и фиксированной длительности
+    (у бейджа своё время и зацикливание) и только на libx264: NVENC ограничен числом сессий
+    и на параллельных частях не ускоряется.
+    """
+    if probe is None or not probe.ok or not probe.duration or probe.duration < min_duration:
+        return False
+    if _use_badge(p) or (p.fixed_duration_sec and p.fixed_duration_sec > 0):
+        return False
+    return not _resolve_nvenc(nvenc_ok)
+
+
+def _segment_bounds(path: Path, duration: float, segments: int) -> List[Tuple[float, float]]:
+    """Границы частей: ближайший ключевой кадр после равномерной точки разреза."""
+    cuts = [0.0]
+    for k in range(1, segments):
+        target = duration * k / segments
+        if target <= cuts[-1]:
+            continue
+        kf = probe_keyframe_after(path, target)
+        if kf is not None and cuts[-1] < kf < duration - 1.0:
+            cuts.append(kf)
+    cuts.append(duration)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def build_segmented(p: JobParams, probe: ProbeInfo, segments: int, min_duration: float,
+                    nvenc_ok: Optional[bool] = None) -> Optional[SegmentedPlan]:
+    """План кодирования частями или None, если режим неприменим или ключевых кадров не хватило."""
+    if segments < 2 or not segment_eligible(p, probe, min_duration, nvenc_ok):
+        return None
+    bounds = _segment_bounds(p.input_path, probe.duration, segments)
+    if len(bounds) < 2:
+        return None
+
+    video_w, video_h = _target_size(p.fmt)
+    E = p.effects
+    video_effects, audio_filter = _build_video_effects_filters(E, video_w, video_h, E.safe_mode, E.profile_strong)
+    cut_start = 0.0
+    if video_effects and video_effects[0].startswith('trim=start='):
+        cut_start = float(video_effects.pop(0).split(',', 1)[0].split('=')[-1])
+    text_filters = _build_text_filters(p.text, video_w, video_h, E.safe_mode)
+    filter_chain = _build_filter_chain('', video_effects, video_w, video_h, text_filters, '', _source_size(probe))
+
+    out = Path(p.output_path)
+    work_dir = out.parent / f".{out.stem}.segments"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    return SegmentedPlan(
+        p=p,
+        work_dir=work_dir,
+        bounds=bounds,
+        duration=probe.duration,
+        filter_chain=filter_chain,
+        codec_args=_video_codec_args(E, False),
+        audio_filter=audio_filter,
+        cut_start=cut_start,
+        segment_paths=[work_dir / f"part{i:03d}.mp4" for i in range(len(bounds))],
+    )
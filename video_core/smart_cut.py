@@ -0,0 +1,144 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple
+from .params import JobParams
+from .probe import ProbeInfo, probe_keyframe_after
+from .metadata import random_metadata
+from .threads import ThreadPlan
+from .ffmpeg_builder import (
+    _badge_behavior,
+    _badge_input_args,
+    _build_badge_overlay,
+    _build_filter_chain,
+    _source_size,
+    _build_text_filters,
+    _build_video_effects_filters,
+    _filter_threads,
+    _probe_badge_safe,
+    _resolve_nvenc,
+    _target_size,
+    _use_badge,
+    _video_codec_args,
+)
+
+
+@dataclass
+class SmartCutPlan:
+    """
+    Кодирование только головы ролика с бейджем.
+    steps — команды FFmpeg по порядку с длительностью для прогресса:
+    голова с наложением до ключевого кадра, копия остатка, склейка с аудио исходника.
+    """
+    head_end: float
+    work_dir: Path
+    steps: List[Tuple[List[str], float]] = field(default_factory=list)
+
+
+def _has_whole_clip_effects(p: JobParams) -> bool:
+    """Есть ли эффекты, которые меняют весь ролик (их нельзя применить только к голове)."""
+    E = p.effects
+    if E.hidden_pattern or E.contrast or E.brightness_sat:
+        return True
+    if not E.safe_mode and any((E.cut, E.color_shift, E.noise, E.crop_edges, E.geom,
+                                E.overlays, E.time_mod, E.color_mod)):
+        return True
+    return bool(p.text.enabled and p.text.content.strip())
+
+
+def smart_cut_eligible(p: JobParams, probe: Optional[ProbeInfo], badge_dur: Optional[float]) -> bool:
+    """
+    Умная нарезка применима, когда бейдж исчезает раньше конца ролика, эффектов на весь ролик нет,
+    а исходник уже H.264 yuv420p в целевом разрешении (остаток копируется без перекодирования).
+    Для «Обрезать по короткому» выход и так заканчивается вместе с бейджем.
+    """
+    if probe is None or not probe.ok or not probe.duration or not badge_dur:
+        return False
+    if not _use_badge(p) or _badge_behavior(p) != 'Исчезновение':
+        return False
+    if p.fixed_duration_sec and p.fixed_duration_sec > 0:
+        return False
+    if _has_whole_clip_effects(p):
+        return False
+    video_w, video_h = _target_size(p.fmt)
+    return (
+        probe.vcodec == 'h264'
+        and probe.pix_fmt == 'yuv420p'
+        and probe.width == video_w
+        and probe.height == video_h
+        and probe.rotation == 0
+        and badge_dur < probe.duration * 0.9
+    )
+
+
+def smart_cut_planned(p: JobParams, probe: Optional[ProbeInfo]) -> bool:
+    """
+    Выход пойдёт умной нарезкой (если найдётся ключевой кадр): проверка до группировки копий,
+    умная нарезка строится только для процесса с одним выходом.
+    """
+    if not _use_badge(p) or _badge_behavior(p) != 'Исчезновение':
+        return False
+    return smart_cut_eligible(p, probe, _probe_badge_safe(p.badge.path)[3])
+
+
+def build_smart_cut(p: JobParams, probe: ProbeInfo, nvenc_ok: Optional[bool] = None,
+                    thread_plan: Optional[ThreadPlan] = None) -> Optional[SmartCutPlan]:
+    """
+    План умной нарезки или None, если она неприменима либо ключевой кадр
+    после исчезновения бейджа слишком близко к концу.
+    """
+    if not _use_badge(p) or _badge_behavior(p) != 'Исчезновение':
+        return None
+    badge_info = _probe_badge_safe(p.badge.path)
+    badge_dur = badge_info[3]
+    if not smart_cut_eligible(p, probe, badge_dur):
+        return None
+    head_end = probe_keyframe_after(p.input_path, badge_dur)
+    if head_end is None or head_end >= probe.duration * 0.9:
+        return None
+
+    video_w, video_h = _target_size(p.fmt)
+    src = str(p.input_path).replace('\\', '/')
+    out = Path(p.output_path)
+    work_dir = out.parent / f".{out.stem}.smartcut"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    head_ts = work_dir / 'head.ts'
+    tail_ts = work_dir / 'tail.ts'
+    concat_list = work_dir / 'concat.txt'
+    concat_list.write_text(
+        f"file '{head_ts.as_posix()}'\nfile '{tail_ts.as_posix()}'\n", encoding='utf-8'
+    )
+
+    threads = str(thread_plan.threads) if thread_plan else '2'
+    video_effects, _audio_filter = _build_video_effects_filters(p.effects, video_w, video_h, True, False)
+    text_filters = _build_text_filters(p.text, video_w, video_h, True)
+    base_chain = _build_filter_chain('[0:v]', video_effects, video_w, video_h, text_filters, '[bg]', _source_size(probe))
+    badge_chain, overlay_chain = _build_badge_overlay(
+        p, badge_info, video_w, video_h, '[1:v]', ['fps=30'], '[logo]', '[bg]', '[outv]'
+    )
+    head_cmd = ['ffmpeg', '-y', '-threads', threads, '-t', f"{head_end:.6f}", '-i', src]
+    head_cmd.extend(_badge_input_args(p))
+    head_cmd.extend([
+        '-filter_complex_threads', _filter_threads(thread_plan),
+        '-filter_complex', ';'.join([base_chain, badge_chain, overlay_chain]),
+        '-map', '[outv]', '-an',
+    ])
+    head_cmd.extend(_video_codec_args(p.effects, _resolve_nvenc(nvenc_ok), thread_plan))
+    head_cmd.extend(['-bsf:v', 'h264_mp4toannexb', '-f', 'mpegts', str(head_ts)])
+
+    tail_cmd = [
+        'ffmpeg', '-y', '-ss', f"{head_end:.6f}", '-i', src,
+        '-map', '0:v:0', '-c:v', 'copy', '-bsf:v', 'h264_mp4toannexb', '-f', 'mpegts', str(tail_ts),
+    ]
+
+    final_cmd = [
+        'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', str(concat_list), '-i', src,
+        '-map', '0:v:0', '-map', '1:a?', '-c:v', 'copy',
+    ]
+    final_cmd.extend(random_metadata())
+    final_cmd.extend(['-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart', str(out)])
+
+    return SmartCutPlan(
+        head_end=head_end,
+        work_dir=work_dir,
+        steps=[(head_cmd, head_end), (tail_cmd, probe.duration - head_end), (final_cmd, probe.duration)],
+    )
@@ -0,0 +1,109 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class ThreadPlan:
+    """Потоки одного процесса FFmpeg: декодер (-threads), фильтры и кодер (-threads:v)."""
+    threads: int
+    filter_threads: int
+    encoder_threads: int
+    cpus: Optional[List[int]] = None
+
+
+def split_threads(n: int, outputs: int = 1) -> ThreadPlan:
+    """Разбиение выделенных потоков между декодером, графом фильтров и кодерами выходов."""
+    n = max(1, n)
+    decode = max(1, n // 4)
+    filters = max(1, n // 4)
+    encoder = max(1, (n - decode - filters) // max(1, outputs))
+    return ThreadPlan(threads=decode, filter_threads=filters, encoder_threads=encoder)
+
+
+def _available_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return list(range(os.cpu_count() or 4))
+
+
+class ThreadLease:
+    """Выделенная доля бюджета; возвращается в бюджет при выходе из with."""
+
+    def __init__(self, budget: 'ThreadBudget', n: int, plan: ThreadPlan):
+        self._budget = budget
+        self.n = n
+        self.plan = plan
+
+    def release(self) -> None:
+        if self._budget is not None:
+            self._budget._release(self)
+            self._budget = None
+
+    def __enter__(self) -> ThreadPlan:
+        return self.plan
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class ThreadBudget:
+    """
+    Общий бюджет потоков для всех одновременно запущенных процессов FFmpeg.
+    Сумма выданных потоков не превышает total (по умолчанию — число доступных ядер),
+    сколько бы задач ни выполнялось параллельно. При pin=True каждой аренде
+    достаётся свой набор ядер для sched_setaffinity.
+    """
+
+    def __init__(self, total: Optional[int] = None, pin: bool = False):
+        cpus = _available_cpus()
+        self.total = max(1, int(total or len(cpus)))
+        self.pin = pin and hasattr(os, 'sched_setaffinity')
+        self._free_cpus = cpus[:self.total] if self.pin else []
+        self._used = 0
+        self._cond = threading.Condition()
+
+    @property
+    def used(self) -> int:
+        with self._cond:
+            return self._used
+
+    def acquire(self, want: int, outputs: int = 1, timeout: Optional[float] = None) -> ThreadLease:
+        """
+        Получить до want потоков. Если свободно меньше половины запрошенного — ждать,
+        иначе выдать сколько есть, чтобы не простаивать.
+        """
+        want = max(1, min(int(want), self.total))
+        min_grant = max(1, want // 2)
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.total - self._used >= min_grant, timeout=timeout):
+                raise TimeoutError("Нет свободных потоков в бюджете FFmpeg")
+            n = min(want, self.total - self._used)
+            self._used += n
+            plan = split_threads(n, outputs)
+            if self.pin:
+                plan.cpus = self._free_cpus[:n] or None
+                self._free_cpus = self._free_cpus[n:]
+        return ThreadLease(self, n, plan)
+
+    def _release(self, lease: ThreadLease) -> None:
+        with self._cond:
+            self._used -= lease.n
+            if lease.plan.cpus:
+                self._free_cpus = sorted(self._free_cpus + lease.plan.cpus)
+            self._cond.notify_all()
+
+
+_budget: Optional[ThreadBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_thread_budget(total: Optional[int] = None, pin: bool = False) -> ThreadBudget:
+    """Бюджет потоков процесса (создаётся при первом обращении с переданными параметрами)."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = ThreadBudget(total=total, pin=pin)
+        return _budget
@@ -62,5 +62,69 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 YANDEX_DISK_TOKEN = os.getenv('YANDEX_DISK_TOKEN', '')
-
-
+# Скачивание с Яндекс Диска: файлов одновременно, HTTP-соединений (Range) на файл от YADISK_RANGE_MIN_MB
+YADISK_DOWNLOAD_WORKERS = int(os.getenv('YADISK_DOWNLOAD_WORKERS', '4'))
+YADISK_DOWNLOAD_CONNECTIONS = int(os.getenv('YADISK_DOWNLOAD_CONNECTIONS', '4'))
+YADISK_RANGE_MIN_MB = int(os.getenv('YADISK_RANGE_MIN_MB', '16'))
+# Конвейер скачивание → кодирование → загрузка: исходников во временной папке одновременно
+# (0 — параллельных кодирований + скачиваний) и готовых выходов в очереди на загрузку
+YADISK_PREFETCH_FILES = int(os.getenv('YADISK_PREFETCH_FILES', '0'))
+YADISK_UPLOAD_QUEUE = int(os.getenv('YADISK_UPLOAD_QUEUE', '8'))
+# Параллельные загрузки на Яндекс Диск и повторы запросов при 429/5xx (экспоненциальная пауза)
+YADISK_UPLOAD_WORKERS = int(os.getenv('YADISK_UPLOAD_WORKERS', '4'))
+YADISK_RETRIES = int(os.getenv('YADISK_RETRIES', '4'))
+# MP4/MOV с moov в начале файла кодируются прямо по ссылке Яндекс Диска, без скачивания во временную папку
+YADISK_STREAM_INPUT = os.getenv('YADISK_STREAM_INPUT', 'False') == 'True'
+# Кэш листингов папок Яндекс Диска (SQLite, общий для веб-процесса и воркеров): без сверки с API
+# используется YADISK_LIST_TTL_SEC, затем сверяется modified папки; соседние папки обходятся параллельно
+YADISK_LIST_TTL_SEC = int(os.getenv('YADISK_LIST_TTL_SEC', '60'))
+YADISK_LIST_WORKERS = int(os.getenv('YADISK_LIST_WORKERS', '8'))
+# Яндекс Диск не обещает менять modified папки при любом изменении внутри: листинг старше
+# YADISK_LIST_MAX_AGE_SEC перечитывается целиком, даже если modified совпал
+YADISK_LIST_MAX_AGE_SEC = int(os.getenv('YADISK_LIST_MAX_AGE_SEC', '900'))
+
+# Параллельное кодирование: 0 — вычислить из числа ядер и потоков на кодирование
+ENCODE_WORKERS = int(os.getenv('ENCODE_WORKERS', '0'))
+ENCODE_THREADS_PER_TASK = int(os.getenv('ENCODE_THREADS_PER_TASK', '4'))
+
+# Копии одного исходника кодируются одним процессом FFmpeg (decode once, split на N выходов)
+ENCODE_MULTI_OUTPUT = os.getenv('ENCODE_MULTI_OUTPUT', 'True') == 'True'
+ENCODE_MULTI_OUTPUT_MAX = int(os.getenv('ENCODE_MULTI_OUTPUT_MAX', '5'))
+
+# Длинные исходники (от ENCODE_SEGMENT_MIN_SEC секунд) кодируются частями параллельно;
+# ENCODE_SEGMENTS — число частей, 0 — по бюджету потоков, 1 — не делить
+ENCODE_SEGMENT_MIN_SEC = float(os.getenv('ENCODE_SEGMENT_MIN_SEC', '600'))
+ENCODE_SEGMENTS = int(os.getenv('ENCODE_SEGMENTS', '0'))
+
+# Воркер задач (python manage.py run_worker): очередь в SQLite под MEDIA_ROOT/jobs
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '2'))
+# Суммарная стоимость (исходники × копии) одновременно выполняемых задач, 0 — без ограничения
+JOB_WORKER_COST_BUDGET = float(os.getenv('JOB_WORKER_COST_BUDGET', '0'))
+JOB_WORKER_STALE_SEC = int(os.getenv('JOB_WORKER_STALE_SEC', '60'))
+# Сколько раз задача упавшего воркера возвращается в очередь; затем она помечается ошибкой (0 — без ограничения)
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# job.json выполняющейся задачи переписывается не чаще раза в JOB_STATE_FLUSH_MS,
+# промежуточные изменения дописываются в events.jsonl
+JOB_STATE_FLUSH_MS = int(os.getenv('JOB_STATE_FLUSH_MS', '1000'))
+# Живой прогресс страницы задачи: воркер пишет live.json не чаще JOB_LIVE_INTERVAL_MS,
+# веб-процесс проверяет его раз в JOB_LIVE_POLL_MS одним потоком на задачу для всех зрителей
+JOB_LIVE_INTERVAL_MS = int(os.getenv('JOB_LIVE_INTERVAL_MS', '500'))
+JOB_LIVE_POLL_MS = int(os.getenv('JOB_LIVE_POLL_MS', '500'))
+# Метрики /metrics: воркер сохраняет снимок своих счётчиков в METRICS_DIR раз в METRICS_SNAPSHOT_SEC
+METRICS_DIR = os.getenv('METRICS_DIR', str(MEDIA_ROOT / 'metrics'))
+METRICS_SNAPSHOT_SEC = int(os.getenv('METRICS_SNAPSHOT_SEC', '15'))
+
+# Общий бюджет потоков всех процессов FFmpeg воркера: 0 — число ядер
+FFMPEG_THREAD_BUDGET = int(os.getenv('FFMPEG_THREAD_BUDGET', '0'))
+# Привязывать каждый процесс FFmpeg к своему набору ядер (Linux)
+FFMPEG_PIN_CPUS = os.getenv('FFMPEG_PIN_CPUS', 'False') == 'True'
+# Как часто разбирать и отдавать прогресс FFmpeg (fps, скорость, битрейт, ETA)
+FFMPEG_PROGRESS_INTERVAL_MS = int(os.getenv('FFMPEG_PROGRESS_INTERVAL_MS', '500'))
+
+# Дисковый кэш ffprobe (по пути, размеру, mtime и inode); пустое значение — только кэш в памяти
+PROBE_CACHE_DIR = os.getenv('PROBE_CACHE_DIR', str(MEDIA_ROOT / 'probe_cache'))
+PROBE_WORKERS = int(os.getenv('PROBE_WORKERS', '8'))
+# Реестр возможностей FFmpeg (кодеры, фильтры, версия, работающие NVENC/VAAPI/QSV):
+# опрашивается один раз на процесс и кэшируется на диске хоста на FFMPEG_CAPS_TTL_SEC
+FFMPEG_CAPS_DIR = os.getenv('FFMPEG_CAPS_DIR', str(MEDIA_ROOT / 'ffmpeg_caps'))
+FFMPEG_CAPS_TTL_SEC = int(os.getenv('FFMPEG_CAPS_TTL_SEC', '86400'))